@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Агрегация уведомлений администратору
+Одинаковые ошибки (тип уведомления + класс исключения) объединяются в сводку,
+отправка идёт в фоновой задаче и не задерживает обработчики
+"""
+import html
+import time
+import asyncio
+import logging
+from datetime import datetime
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class _ErrorGroup:
+    """Накопленные за окно повторы одной ошибки"""
+
+    __slots__ = ('error_type', 'exception_name', 'sample', 'count', 'reported', 'users')
+
+    def __init__(self, error_type: str, exception_name: str, sample: str):
+        self.error_type = error_type
+        self.exception_name = exception_name
+        self.sample = sample
+        self.count = 0
+        self.reported = 0  # сколько повторов уже отправлено отдельным сообщением
+        self.users = set()
+
+
+def format_alert(error_message: str, user_info: str, error_type: str) -> str:
+    """Текст одиночного уведомления об ошибке (HTML)"""
+    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    error_text = (
+        f"🚨 <b>{html.escape(error_type)}</b>\n\n"
+        f"<b>Ошибка:</b>\n<code>{html.escape(error_message[:1000])}</code>\n\n"
+    )
+    if user_info:
+        error_text += f"<b>Пользователь:</b> {html.escape(user_info)}\n\n"
+    error_text += f"<b>Время:</b> {current_time}"
+    return error_text
+
+
+class AdminNotifier:
+    """Очередь уведомлений: первое появление ошибки отправляется сразу,
+    повторы за окно window секунд - одной сводкой в конце окна"""
+
+    def __init__(self, send, window: float = 60.0, burst: int = 5):
+        self.send = send  # корутина, отправляющая HTML-текст администратору
+        self.window = window
+        self.burst = burst  # максимум отдельных уведомлений за окно
+        self._groups = OrderedDict()
+        self._immediate = []
+        self._immediate_sent = 0
+        self._window_started = time.monotonic()
+        self._wakeup = None
+        self._task = None
+
+    def notify(self, error_message: str, user_info: str = "", error_type: str = "ERROR",
+               exception_name: str = ""):
+        """Регистрация ошибки (не ждёт отправки)"""
+        key = (error_type, exception_name)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _ErrorGroup(error_type, exception_name, error_message)
+        group.count += 1
+        if user_info:
+            group.users.add(user_info)
+        if group.count == 1 and self._immediate_sent < self.burst:
+            # Новая за окно ошибка - сообщаем сразу
+            self._immediate_sent += 1
+            group.reported = 1
+            self._immediate.append(format_alert(error_message, user_info, error_type))
+        self._ensure_started()
+        self._wakeup.set()
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            remaining = self._window_started + self.window - time.monotonic()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, remaining))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._send_immediate()
+            if time.monotonic() >= self._window_started + self.window:
+                await self._send_digest()
+
+    async def _send_immediate(self):
+        while self._immediate:
+            await self._safe_send(self._immediate.pop(0))
+
+    async def _send_digest(self):
+        groups = [group for group in self._groups.values() if group.count > group.reported]
+        elapsed = time.monotonic() - self._window_started
+        self._groups.clear()
+        self._immediate_sent = 0
+        self._window_started = time.monotonic()
+        if not groups:
+            return
+        lines = [f"📊 <b>Сводка ошибок за последние {elapsed:.0f}s</b>\n"]
+        for group in groups:
+            name = group.exception_name or "Error"
+            lines.append(
+                f"• <b>{html.escape(group.error_type)}</b>: {html.escape(name)} ×{group.count}, "
+                f"пользователей: {len(group.users)}\n"
+                f"<code>{html.escape(group.sample[:300])}</code>"
+            )
+        await self._safe_send("\n".join(lines)[:4096])
+
+    async def _safe_send(self, text: str):
+        try:
+            await self.send(text)
+        except Exception as e:
+            logger.error(f"Не удалось отправить уведомление администратору: {e}")
+
+    async def close(self):
+        """Отправка накопленного и остановка фоновой задачи"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._send_immediate()
+        await self._send_digest()
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетная генерация шаблонов через OpenAI Batch API
+Резюме из папки (TXT/PDF/DOCX) разбираются теми же функциями, что и в боте,
+запросы отправляются JSONL-пакетами, готовые шаблоны сохраняются в выходную папку.
+Состояние хранится в <output>/batch_state.json: повторный запуск продолжает
+с места прерывания и не отправляет уже поставленные в очередь резюме
+
+Пример:
+    python batch.py resumes/ letters/
+    python batch.py resumes/ letters/ --no-wait    # только отправить, забрать позже
+"""
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+
+from config import require_tokens, MIN_RESUME_LENGTH, EXTRACTION_WORKERS
+from prompts import (
+    prompt_template, prepare_resume_text, build_request_params, cover_letter_cache_key, clean_cover_letter
+)
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = 'batch_state.json'
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+# Статусы пакета, после которых он больше не изменится
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+class LocalDocument:
+    """Файл на диске с тем же интерфейсом, что telegram.Document и telegram.File
+
+    Позволяет разбирать его через extract_text_from_file: download_file читает
+    пути без http(s) прямо с диска
+    """
+
+    def __init__(self, path: str):
+        self.file_path = os.path.abspath(path)
+        self.file_name = os.path.basename(path)
+        self.file_size = os.path.getsize(path)
+        # Кэш текста по file_unique_id для локальных файлов не используется
+        self.file_unique_id = None
+
+    async def get_file(self):
+        return self
+
+
+class BatchState:
+    """Состояние пакетной обработки (атомарно сохраняется после каждого шага)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.items = {}  # custom_id -> source, signature, status, batch_id, cache_key, error
+        self.batches = {}  # batch_id -> status, count
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.items = data.get('items', {})
+            self.batches = data.get('batches', {})
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'items': self.items, 'batches': self.batches}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def pending_batches(self) -> list:
+        return [batch_id for batch_id, batch in self.batches.items() if batch['status'] not in FINAL_STATUSES]
+
+    def counts(self) -> dict:
+        counts = {}
+        for item in self.items.values():
+            counts[item['status']] = counts.get(item['status'], 0) + 1
+        return counts
+
+
+def file_signature(path: str) -> list:
+    """Размер и время изменения: изменённый файл обрабатывается заново"""
+    stat = os.stat(path)
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+def find_resumes(input_dir: str) -> list:
+    """Относительные пути резюме поддерживаемых форматов"""
+    paths = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                paths.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return paths
+
+
+def output_path(output_dir: str, custom_id: str) -> str:
+    return os.path.join(output_dir, custom_id + '.txt')
+
+
+def write_letter(output_dir: str, custom_id: str, text: str):
+    path = output_path(output_dir, custom_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+class BatchRunner:
+    """Отправка резюме пакетами и сбор результатов"""
+
+    def __init__(self, bot, input_dir: str, output_dir: str, batch_size: int = 1000,
+                 poll_interval: float = 30.0, completion_window: str = '24h'):
+        self.bot = bot
+        # Клиент первого эндпоинта пула: файлы и пакеты Batch API привязаны к ключу
+        self.client = bot.openai_pool.endpoints[0].client
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.state = BatchState(os.path.join(output_dir, STATE_FILE))
+
+    def _needs_work(self, custom_id: str) -> bool:
+        item = self.state.items.get(custom_id)
+        if item is None or item['signature'] != file_signature(os.path.join(self.input_dir, custom_id)):
+            return True
+        # Неудачная генерация повторяется при следующем запуске
+        return item['status'] == 'failed'
+
+    async def _prepare(self, custom_id: str, prompt, semaphore: asyncio.Semaphore):
+        """Текст резюме для запроса (None, если файл пропущен)"""
+        path = os.path.join(self.input_dir, custom_id)
+        item = self.state.items[custom_id] = {
+            'source': custom_id, 'signature': file_signature(path),
+            'status': 'pending', 'batch_id': None, 'cache_key': None, 'error': None,
+        }
+        async with semaphore:
+            text = await self.bot.extract_text_from_file(LocalDocument(path))
+        if not text or len(text.strip()) < MIN_RESUME_LENGTH:
+            item.update(status='skipped', error="could not extract enough text")
+            return None
+        try:
+            text = prepare_resume_text(text).text
+        except ValueError as e:
+            item.update(status='skipped', error=str(e))
+            return None
+
+        item['cache_key'] = cover_letter_cache_key(text, prompt)
+        cache = self.bot.cover_letter_cache
+        cached = await cache.get(item['cache_key']) if cache is not None else None
+        if cached is not None:
+            write_letter(self.output_dir, custom_id, cached)
+            item.update(status='done', error=None)
+            return None
+        return text
+
+    async def submit(self, custom_ids: list):
+        """Разбор файлов и отправка пакетов по batch_size запросов"""
+        semaphore = asyncio.Semaphore(max(1, EXTRACTION_WORKERS))
+        prompt = prompt_template.current()
+        if prompt is None:
+            raise RuntimeError(f"Prompt file {prompt_template.path} could not be loaded")
+        for start in range(0, len(custom_ids), self.batch_size):
+            chunk = custom_ids[start:start + self.batch_size]
+            texts = await asyncio.gather(*(self._prepare(custom_id, prompt, semaphore) for custom_id in chunk))
+            lines = []
+            submitted = []
+            for custom_id, text in zip(chunk, texts):
+                if text is None:
+                    continue
+                submitted.append(custom_id)
+                lines.append(json.dumps({
+                    'custom_id': custom_id,
+                    'method': 'POST',
+                    'url': '/v1/chat/completions',
+                    'body': build_request_params(text, prompt),
+                }, ensure_ascii=False))
+            if not lines:
+                self.state.save()
+                continue
+
+            payload = ("\n".join(lines) + "\n").encode('utf-8')
+            input_file = await self.client.files.create(
+                file=(f'cover_letters_{start}.jsonl', payload), purpose='batch'
+            )
+            batch = await self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint='/v1/chat/completions',
+                completion_window=self.completion_window
+            )
+            self.state.batches[batch.id] = {'status': batch.status, 'count': len(lines)}
+            for custom_id in submitted:
+                self.state.items[custom_id].update(status='submitted', batch_id=batch.id)
+            self.state.save()
+            logger.info(f"Отправлен пакет {batch.id}: {len(lines)} резюме")
+
+    async def _read_results(self, file_id: str) -> list:
+        content = await self.client.files.content(file_id)
+        return [json.loads(line) for line in content.text.splitlines() if line.strip()]
+
+    async def collect(self, batch_id: str, batch):
+        """Сохранение шаблонов завершённого пакета"""
+        results = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                results += await self._read_results(file_id)
+
+        cache = self.bot.cover_letter_cache
+        for result in results:
+            item = self.state.items.get(result.get('custom_id'))
+            if item is None or item['batch_id'] != batch_id:
+                continue
+            response = result.get('response') or {}
+            body = response.get('body') or {}
+            if response.get('status_code') == 200 and body.get('choices'):
+                letter = clean_cover_letter(body['choices'][0]['message']['content'] or "")
+                write_letter(self.output_dir, item['source'], letter)
+                if cache is not None and item['cache_key'] and letter:
+                    await cache.set(item['cache_key'], letter)
+                item.update(status='done', error=None)
+            else:
+                error = result.get('error') or body.get('error') or {}
+                item.update(status='failed', error=error.get('message') or f"HTTP {response.get('status_code')}")
+
+        # Запросы, которых нет в результатах (пакет истёк или отменён)
+        for item in self.state.items.values():
+            if item['batch_id'] == batch_id and item['status'] == 'submitted':
+                item.update(status='failed', error=f"batch {batch.status}")
+
+    async def wait(self, block: bool = True):
+        """Опрос незавершённых пакетов (block=False - одна проверка без ожидания)"""
+        while True:
+            for batch_id in self.state.pending_batches():
+                batch = await self.client.batches.retrieve(batch_id)
+                if batch.status in FINAL_STATUSES:
+                    await self.collect(batch_id, batch)
+                    logger.info(f"Пакет {batch_id} завершён со статусом {batch.status}")
+                self.state.batches[batch_id]['status'] = batch.status
+                self.state.save()
+            pending = self.state.pending_batches()
+            if not pending or not block:
+                return
+            logger.info(f"Ожидание пакетов: {', '.join(pending)}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def run(self, wait: bool = True) -> dict:
+        os.makedirs(self.output_dir, exist_ok=True)
+        custom_ids = [custom_id for custom_id in find_resumes(self.input_dir) if self._needs_work(custom_id)]
+        if custom_ids:
+            logger.info(f"К отправке: {len(custom_ids)} резюме")
+            await self.submit(custom_ids)
+        await self.wait(block=wait)
+        return self.state.counts()
+
+
+async def run(args) -> dict:
+    # bot тянет весь стек бота (Telegram, пулы, кэш) - импортируем только для запуска
+    import bot
+
+    runner = BatchRunner(
+        bot, args.input_dir, args.output_dir, batch_size=args.batch_size,
+        poll_interval=args.poll_interval, completion_window=args.completion_window
+    )
+    try:
+        return await runner.run(wait=not args.no_wait)
+    finally:
+        await bot.admin_notifier.close()
+        bot.extraction_pool.shutdown()
+        await bot.close_http_client()
+        await bot.openai_pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate cover letter templates for a folder of resumes "
+                                                 "with the OpenAI Batch API")
+    parser.add_argument('input_dir', help="folder with .txt/.pdf/.docx resumes (searched recursively)")
+    parser.add_argument('output_dir', help="folder for templates and batch_state.json")
+    parser.add_argument('--batch-size', type=int, default=1000, help="requests per batch")
+    parser.add_argument('--poll-interval', type=float, default=30.0, help="seconds between status checks")
+    parser.add_argument('--completion-window', default='24h')
+    parser.add_argument('--no-wait', action='store_true', help="submit batches and exit; rerun to collect")
+    args = parser.parse_args()
+
+    try:
+        require_tokens('CHATGPT_TOKEN')
+    except ValueError as e:
+        sys.exit(str(e))
+    counts = asyncio.run(run(args))
+    print(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())) or "No resumes found")
+
+
+if __name__ == '__main__':
+    main()
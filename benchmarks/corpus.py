@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Генерация корпуса синтетических резюме (TXT, PDF, DOCX) для бенчмарков
+"""
+import os
+import random
+import argparse
+
+FIRST_NAMES = ['Alex', 'Maria', 'Ivan', 'Olga', 'John', 'Emma', 'Dmitry', 'Sofia']
+LAST_NAMES = ['Petrov', 'Smith', 'Ivanova', 'Brown', 'Kuznetsov', 'Garcia', 'Novak']
+TITLES = ['Backend Engineer', 'Data Analyst', 'Product Manager', 'QA Engineer', 'DevOps Engineer']
+SKILLS = ['Python', 'PostgreSQL', 'Kubernetes', 'Go', 'React', 'Airflow', 'Kafka', 'Terraform',
+          'SQL', 'Docker', 'AWS', 'Figma', 'Jira', 'pandas', 'FastAPI', 'Redis']
+COMPANIES = ['Acme Corp', 'Globex', 'Initech', 'Umbrella', 'Hooli', 'Stark Industries', 'Wayne Enterprises']
+ACHIEVEMENTS = [
+    'Reduced API p95 latency by {n}% by introducing caching and query tuning',
+    'Led a team of {n} engineers through a migration to microservices',
+    'Automated reporting pipeline saving {n} hours per week',
+    'Increased conversion by {n}% through A/B tested onboarding changes',
+    'Cut infrastructure costs by {n}% with autoscaling and spot instances',
+]
+
+
+def make_resume(seed: int, jobs: int = 4) -> list:
+    """Строки резюме для заданного seed (детерминированно)"""
+    rnd = random.Random(seed)
+    name = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}"
+    lines = [
+        name,
+        f"{rnd.choice(TITLES)} | {name.split()[0].lower()}@example.com | +1 555 {rnd.randint(1000, 9999)}",
+        "",
+        "SUMMARY",
+        f"{rnd.choice(TITLES)} with {rnd.randint(2, 15)} years of experience building reliable products.",
+        "",
+        "EXPERIENCE",
+    ]
+    for job in range(jobs):
+        lines.append(f"{rnd.choice(TITLES)}, {rnd.choice(COMPANIES)} ({2024 - job * 2 - 2}-{2024 - job * 2})")
+        for _ in range(rnd.randint(2, 4)):
+            lines.append("- " + rnd.choice(ACHIEVEMENTS).format(n=rnd.randint(2, 60)))
+    lines += ["", "SKILLS", ", ".join(rnd.sample(SKILLS, 8)), "", "EDUCATION",
+              f"BSc Computer Science, State University ({rnd.randint(2005, 2018)})"]
+    return lines
+
+
+def write_txt(path: str, lines: list):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines))
+
+
+def write_docx(path: str, lines: list):
+    """DOCX с абзацами; блок SKILLS оформлен таблицей, как во многих шаблонах резюме"""
+    from docx import Document
+    doc = Document()
+    skills = lines.index("SKILLS") if "SKILLS" in lines else -1
+    for index, line in enumerate(lines):
+        if index == skills + 1 and skills >= 0:
+            items = [item.strip() for item in line.split(',')]
+            table = doc.add_table(rows=(len(items) + 1) // 2, cols=2)
+            for cell_index, item in enumerate(items):
+                table.cell(cell_index // 2, cell_index % 2).text = item
+        else:
+            doc.add_paragraph(line)
+    doc.save(path)
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path: str, lines: list, lines_per_page: int = 45):
+    """Минимальный PDF с текстом (Helvetica), без внешних зависимостей
+
+    Каждая страница получает колонтитулы (имя и "Page N of M"), как в реальных резюме
+    """
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    header = lines[0] if lines else ""
+    pages = [[header] + page + [f"Page {number} of {len(pages)}"] for number, page in enumerate(pages, start=1)]
+    objects = []
+    font_id = 3
+    page_ids = []
+    for page_lines in pages:
+        content = ["BT", "/F1 11 Tf", "14 TL", "50 800 Td"]
+        for line in page_lines:
+            content.append(f"({_pdf_escape(line.encode('latin-1', 'replace').decode('latin-1'))}) Tj T*")
+        content.append("ET")
+        stream = "\n".join(content).encode('latin-1')
+        content_id = 4 + len(objects)
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_id = 4 + len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (font_id, content_id)
+        )
+        page_ids.append(page_id)
+    catalog = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % i for i in page_ids) + b"] /Count %d >>" % len(page_ids),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    all_objects = catalog + objects
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(all_objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(all_objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(all_objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def build_corpus(directory: str, count: int = 10, long_every: int = 5) -> list:
+    """Создание count резюме в каждом формате; каждое long_every-е - многостраничное"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for seed in range(count):
+        jobs = 40 if long_every and seed % long_every == long_every - 1 else 4
+        lines = make_resume(seed, jobs=jobs)
+        for ext, writer in (('txt', write_txt), ('pdf', write_pdf), ('docx', write_docx)):
+            path = os.path.join(directory, f"resume_{seed:03d}.{ext}")
+            writer(path, lines)
+            paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic resume corpus")
+    parser.add_argument('directory')
+    parser.add_argument('--count', type=int, default=10)
+    args = parser.parse_args()
+    print("\n".join(build_corpus(args.directory, args.count)))
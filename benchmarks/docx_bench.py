@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение извлечения текста из DOCX: потоковый разбор XML против python-docx
+Печатает пропускную способность, пик памяти (tracemalloc) и полноту текста
+
+Пример:
+    python benchmarks/docx_bench.py --corpus ~/resumes --repeat 5
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', 'bench')
+os.environ.setdefault('CHATGPT_TOKEN', 'bench')
+
+from docx import Document  # noqa: E402
+from benchmarks.corpus import build_corpus  # noqa: E402
+from extraction import extract_docx_text_fast  # noqa: E402
+
+
+def extract_python_docx(stream) -> str:
+    doc = Document(stream)
+    return "\n".join(paragraph.text for paragraph in doc.paragraphs)
+
+
+EXTRACTORS = {
+    'fast': extract_docx_text_fast,
+    'python-docx': extract_python_docx,
+}
+
+
+def load_files(paths: list) -> list:
+    files = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            files.append((path, f.read()))
+    return files
+
+
+def measure(extract, files: list, repeat: int) -> dict:
+    """Время на весь корпус, пик памяти на один файл и суммарная длина текста"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for _, data in files:
+            extract(io.BytesIO(data))
+    elapsed = time.perf_counter() - started
+
+    peak = 0
+    chars = 0
+    for _, data in files:
+        tracemalloc.start()
+        text = extract(io.BytesIO(data))
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        chars += len(text)
+    total_bytes = sum(len(data) for _, data in files) * repeat
+    return {
+        'files_per_second': len(files) * repeat / elapsed if elapsed else 0.0,
+        'mb_per_second': total_bytes / elapsed / 1024 / 1024 if elapsed else 0.0,
+        'peak_kb': peak / 1024,
+        'chars': chars,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DOCX text extraction")
+    parser.add_argument('--corpus', help="directory with .docx resumes (default: generated)")
+    parser.add_argument('--corpus-size', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix='resume_corpus_')
+    if not args.corpus:
+        build_corpus(corpus_dir, args.corpus_size)
+    paths = sorted(
+        os.path.join(corpus_dir, name) for name in os.listdir(corpus_dir) if name.lower().endswith('.docx')
+    )
+    if not paths:
+        parser.error(f"no .docx files in {corpus_dir}")
+    files = load_files(paths)
+
+    print(f"{len(files)} files, {sum(len(d) for _, d in files) / 1024:.0f} KB, repeat {args.repeat}")
+    print(f"{'extractor':<14}{'files/s':>10}{'MB/s':>10}{'peak KB':>10}{'chars':>10}")
+    for name, extract in EXTRACTORS.items():
+        stats = measure(extract, files, args.repeat)
+        print(f"{name:<14}{stats['files_per_second']:>10.1f}{stats['mb_per_second']:>10.2f}"
+              f"{stats['peak_kb']:>10.0f}{stats['chars']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Заглушка OpenAI Chat Completions и Batch API для нагрузочных тестов
+Настраиваемая задержка, скорость потоковой выдачи и доля ошибок
+
+Отдельный запуск (например, для batch.py):
+    python benchmarks/fake_openai.py --port 8081 --batch-latency 5
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from aiohttp import web
+
+SAMPLE_LETTER = (
+    "[Your Name] [Your City, Country] [Your Email] | [Your Phone] | [Your LinkedIn]\n\n"
+    "Dear Hiring Manager at [Company name], I'm pleased to apply for the [Position title] role "
+    "at [Company name]. I bring about 5 years of experience as a Backend Engineer building "
+    "high-load services, including leading a team of four engineers.\n\n"
+    "Recent outcomes: • Cut API latency by 40% • Migrated billing to event sourcing "
+    "• Scaled ingestion to 20k rps • Mentored junior developers\n\n"
+    "[Company name]'s emphasis on [Company focus or mission] and [Company values or culture theme] "
+    "resonates with me; I'd be excited to support [Team or product] and help achieve "
+    "[Company goal or desired outcome].\n\n"
+    "I'd value a conversation about how I can support [Company name] in the [Position title] role. "
+    "Sincerely, [Your Name]"
+)
+
+
+class FakeOpenAI:
+    """Сервер, отвечающий на POST /v1/chat/completions"""
+
+    def __init__(self, latency: float = 2.0, jitter: float = 0.5, tokens_per_second: float = 200.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 1.0,
+                 batch_latency: float = 2.0, stall_rate: float = 0.0, stall_seconds: float = 10.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.batch_latency = batch_latency
+        # Доля "зависших" запросов с дополнительной задержкой (хвост распределения)
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.files = {}
+        self.batches = {}
+        self._batch_tasks = set()
+        self._seen_prefixes = set()
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self._runner = None
+        self.url = None
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.handle_completion)
+        app.router.add_get('/v1/models', self.handle_models)
+        app.router.add_post('/v1/files', self.handle_file_upload)
+        app.router.add_get('/v1/files/{file_id}/content', self.handle_file_content)
+        app.router.add_post('/v1/batches', self.handle_batch_create)
+        app.router.add_get('/v1/batches/{batch_id}', self.handle_batch_get)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}/v1"
+        return self.url
+
+    async def stop(self):
+        for task in self._batch_tasks:
+            task.cancel()
+        if self._runner:
+            await self._runner.cleanup()
+
+    def _usage(self, messages: list) -> dict:
+        prompt_tokens = sum(len(m.get('content', '')) for m in messages) // 4
+        completion_tokens = len(SAMPLE_LETTER) // 4
+        # Как у OpenAI: повторный префикс от 1024 токенов кэшируется блоками по 128
+        prefix = messages[0].get('content', '') if messages else ''
+        prefix_tokens = len(prefix) // 4
+        cached_tokens = 0
+        if prefix in self._seen_prefixes and prefix_tokens >= 1024:
+            cached_tokens = prefix_tokens // 128 * 128
+        self._seen_prefixes.add(prefix)
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'prompt_tokens_details': {'cached_tokens': cached_tokens},
+        }
+
+    def _completion(self, body: dict, created: int) -> dict:
+        return {
+            'id': f'chatcmpl-fake-{self.requests}',
+            'object': 'chat.completion',
+            'created': created,
+            'model': body.get('model'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': SAMPLE_LETTER},
+                'finish_reason': 'stop',
+            }],
+            'usage': self._usage(body.get('messages', [])),
+        }
+
+    async def handle_models(self, request):
+        # Лёгкий запрос для проверки доступности эндпоинта
+        return web.json_response({'object': 'list', 'data': [{'id': 'gpt-4o-mini', 'object': 'model'}]})
+
+    async def handle_completion(self, request):
+        self.requests += 1
+        body = await request.json()
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            self.rate_limited += 1
+            return web.json_response(
+                {'error': {'message': 'Rate limit reached (fake)', 'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                status=429, headers={'retry-after': str(self.retry_after)}
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.errors += 1
+            return web.json_response(
+                {'error': {'message': 'Internal server error (fake)', 'type': 'server_error'}}, status=500
+            )
+
+        # Время до первого токена
+        delay = max(0.0, random.gauss(self.latency, self.jitter))
+        if random.random() < self.stall_rate:
+            delay += self.stall_seconds
+        await asyncio.sleep(delay)
+        created = int(time.time())
+        usage = self._usage(body.get('messages', []))
+
+        if not body.get('stream'):
+            return web.json_response(self._completion(body, created))
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        words = SAMPLE_LETTER.split(' ')
+        delay = 1.0 / self.tokens_per_second if self.tokens_per_second else 0
+        for index, word in enumerate(words):
+            chunk = {
+                'id': f'chatcmpl-fake-{self.requests}',
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': body.get('model'),
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': word if index == 0 else ' ' + word},
+                    'finish_reason': None,
+                }],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            if delay:
+                await asyncio.sleep(delay)
+        if (body.get('stream_options') or {}).get('include_usage'):
+            final = {
+                'id': f'chatcmpl-fake-{self.requests}',
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': body.get('model'),
+                'choices': [],
+                'usage': usage,
+            }
+            await response.write(f"data: {json.dumps(final)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    # Batch API: файл с JSONL-запросами загружается через /v1/files, пакет
+    # "выполняется" через batch_latency секунд, результат доступен как файл
+
+    def _file_object(self, file_id: str, filename: str, purpose: str) -> dict:
+        return {
+            'id': file_id,
+            'object': 'file',
+            'bytes': len(self.files[file_id]),
+            'created_at': int(time.time()),
+            'filename': filename,
+            'purpose': purpose,
+            'status': 'processed',
+        }
+
+    def _store_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        file_id = f'file-fake-{len(self.files) + 1}'
+        self.files[file_id] = content
+        return self._file_object(file_id, filename, purpose)
+
+    async def handle_file_upload(self, request):
+        form = await request.post()
+        upload = form['file']
+        return web.json_response(self._store_file(upload.file.read(), upload.filename, form.get('purpose', 'batch')))
+
+    async def handle_file_content(self, request):
+        content = self.files.get(request.match_info['file_id'])
+        if content is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=content, content_type='application/octet-stream')
+
+    async def handle_batch_create(self, request):
+        body = await request.json()
+        if body.get('input_file_id') not in self.files:
+            return web.json_response(
+                {'error': {'message': 'Unknown input file (fake)', 'type': 'invalid_request_error'}}, status=400
+            )
+        batch_id = f'batch_fake_{len(self.batches) + 1}'
+        self.batches[batch_id] = {
+            'id': batch_id,
+            'object': 'batch',
+            'endpoint': body.get('endpoint'),
+            'input_file_id': body['input_file_id'],
+            'completion_window': body.get('completion_window', '24h'),
+            'status': 'in_progress',
+            'created_at': int(time.time()),
+            'output_file_id': None,
+            'error_file_id': None,
+            'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+            'metadata': body.get('metadata'),
+        }
+        task = asyncio.create_task(self._run_batch(batch_id))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+        return web.json_response(self.batches[batch_id])
+
+    async def handle_batch_get(self, request):
+        batch = self.batches.get(request.match_info['batch_id'])
+        if batch is None:
+            raise web.HTTPNotFound()
+        return web.json_response(batch)
+
+    async def _run_batch(self, batch_id: str):
+        batch = self.batches[batch_id]
+        await asyncio.sleep(self.batch_latency)
+        outputs, errors = [], []
+        created = int(time.time())
+        for line in self.files[batch['input_file_id']].decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            self.requests += 1
+            result = {'id': f'batch_req_{self.requests}', 'custom_id': item['custom_id'], 'error': None}
+            if random.random() < self.error_rate:
+                self.errors += 1
+                result['response'] = {
+                    'status_code': 500,
+                    'body': {'error': {'message': 'Internal server error (fake)', 'type': 'server_error'}},
+                }
+                errors.append(result)
+            else:
+                result['response'] = {'status_code': 200, 'body': self._completion(item['body'], created)}
+                outputs.append(result)
+
+        def jsonl(rows: list) -> bytes:
+            return "".join(json.dumps(row) + "\n" for row in rows).encode('utf-8')
+
+        if outputs:
+            batch['output_file_id'] = self._store_file(jsonl(outputs), f'{batch_id}_output.jsonl', 'batch_output')['id']
+        if errors:
+            batch['error_file_id'] = self._store_file(jsonl(errors), f'{batch_id}_error.jsonl', 'batch_output')['id']
+        batch['request_counts'] = {'total': len(outputs) + len(errors), 'completed': len(outputs), 'failed': len(errors)}
+        batch['status'] = 'completed'
+        batch['completed_at'] = int(time.time())
+
+
+async def serve(args):
+    fake = FakeOpenAI(latency=args.latency, jitter=args.jitter, tokens_per_second=args.tps,
+                      error_rate=args.error_rate, batch_latency=args.batch_latency)
+    url = await fake.start(args.host, args.port)
+    print(f"Fake OpenAI API: {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the fake OpenAI API server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=1.0)
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--tps', type=float, default=300.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--batch-latency', type=float, default=2.0)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
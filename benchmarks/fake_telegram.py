@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Заглушка Telegram Bot API для нагрузочных тестов
+Поддерживает методы, которые вызывает бот, и раздачу файлов из корпуса.
+Может имитировать flood control: отвечать 429 с retry_after при превышении
+числа сообщений в секунду на чат или всего
+"""
+import os
+import time
+import asyncio
+from collections import Counter, defaultdict, deque
+from aiohttp import web
+
+BOT_INFO = {
+    'id': 123456,
+    'is_bot': True,
+    'first_name': 'BenchBot',
+    'username': 'bench_bot',
+    'can_join_groups': False,
+    'can_read_all_group_messages': False,
+    'supports_inline_queries': False,
+}
+
+# Методы, на которые действует flood control
+FLOOD_METHODS = ('sendMessage', 'editMessageText', 'deleteMessage')
+
+
+class FakeTelegram:
+    """Сервер Bot API: /bot<token>/<method> и /file/bot<token>/<path>"""
+
+    def __init__(self, files_dir: str = None, latency: float = 0.02,
+                 chat_limit: int = 0, global_limit: int = 0):
+        self.files_dir = files_dir
+        self.latency = latency
+        self.chat_limit = chat_limit  # сообщений в секунду на чат (0 - без ограничения)
+        self.global_limit = global_limit  # сообщений в секунду всего (0 - без ограничения)
+        self.calls = Counter()
+        self._sent = defaultdict(deque)  # время последних сообщений по чатам
+        self._sent_all = deque()
+        self._message_id = 0
+        # Апдейты для getUpdates (long polling)
+        self._updates = []
+        self._update_id = 0
+        self._new_update = asyncio.Event()
+        self._runner = None
+        self.base_url = None
+        self.base_file_url = None
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route('*', '/bot{token}/{method}', self.handle_method)
+        app.router.add_get('/file/bot{token}/{path:.+}', self.handle_file)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}/bot"
+        self.base_file_url = f"http://{host}:{port}/file/bot"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def push_update(self, update: dict) -> int:
+        """Апдейт, который бот получит через getUpdates; update_id проставляется здесь"""
+        self._update_id += 1
+        self._updates.append(dict(update, update_id=self._update_id))
+        self._new_update.set()
+        return self._update_id
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        # Подтверждённые апдейты (update_id < offset) больше не отдаются
+        self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), min(timeout, 1.0))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:int(params.get('limit') or 100)]
+
+    def _message(self, chat_id, text: str) -> dict:
+        self._message_id += 1
+        return {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            'from': BOT_INFO,
+            'text': text,
+        }
+
+    def _flooded(self, chat_id) -> bool:
+        """Превышен ли лимит сообщений за последнюю секунду; иначе сообщение учитывается"""
+        now = time.monotonic()
+        chat = self._sent[chat_id]
+        for window in (chat, self._sent_all):
+            while window and now - window[0] >= 1.0:
+                window.popleft()
+        if (self.chat_limit and len(chat) >= self.chat_limit) or \
+                (self.global_limit and len(self._sent_all) >= self.global_limit):
+            return True
+        chat.append(now)
+        self._sent_all.append(now)
+        return False
+
+    async def _params(self, request) -> dict:
+        if request.content_type == 'application/json':
+            return await request.json()
+        return dict(await request.post())
+
+    async def handle_method(self, request):
+        method = request.match_info['method']
+        params = await self._params(request)
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method in FLOOD_METHODS and (self.chat_limit or self.global_limit) and \
+                self._flooded(str(params.get('chat_id', ''))):
+            self.calls['flood'] += 1
+            return web.json_response({
+                'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                'parameters': {'retry_after': 1},
+            })
+        if method == 'getMe':
+            result = BOT_INFO
+        elif method == 'getUpdates':
+            result = await self._get_updates(params)
+        elif method in ('sendMessage', 'editMessageText'):
+            result = self._message(params.get('chat_id', 0), params.get('text', ''))
+        elif method in ('deleteMessage', 'setWebhook', 'deleteWebhook'):
+            result = True
+        elif method == 'getFile':
+            file_id = params.get('file_id', '')
+            path = os.path.join(self.files_dir or '', file_id)
+            result = {
+                'file_id': file_id,
+                'file_unique_id': file_id,
+                'file_size': os.path.getsize(path) if os.path.exists(path) else 0,
+                'file_path': f"documents/{file_id}",
+            }
+        else:
+            return web.json_response({'ok': False, 'error_code': 400, 'description': f'Unsupported method {method}'})
+        return web.json_response({'ok': True, 'result': result})
+
+    async def handle_file(self, request):
+        name = os.path.basename(request.match_info['path'])
+        path = os.path.join(self.files_dir or '', name)
+        if not os.path.exists(path):
+            raise web.HTTPNotFound()
+        self.calls['download'] += 1
+        return web.FileResponse(path)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест бота без сети
+Поднимает заглушки OpenAI и Telegram Bot API, прогоняет через handle_message и
+handle_document синтетические апдейты и печатает задержки, пропускную способность
+и задержку event loop
+
+Пример:
+    python benchmarks/load_test.py --requests 200 --concurrency 50 --openai-latency 2
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import build_corpus  # noqa: E402
+from benchmarks.fake_openai import FakeOpenAI  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegram  # noqa: E402
+
+
+def percentile(values: list, pct: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(values: list) -> dict:
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else 0.0,
+    }
+
+
+def parse_mix(mix: str) -> dict:
+    """'text=0.5,pdf=0.3,docx=0.2' -> словарь весов"""
+    weights = {}
+    for item in mix.split(','):
+        kind, _, weight = item.partition('=')
+        weights[kind.strip()] = float(weight or 1)
+    unknown = set(weights) - {'text', 'txt', 'pdf', 'docx'}
+    if unknown:
+        raise ValueError(f"Unknown update kinds in --mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+async def monitor_loop_lag(samples: list, interval: float, stop: asyncio.Event):
+    """Задержка пробуждения event loop относительно запланированного времени"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+def make_update(update_id: int, user_id: int, kind: str, corpus: dict, unique: bool) -> dict:
+    """JSON синтетического апдейта с текстом или документом"""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'username': f'bench{user_id}'},
+    }
+    if kind == 'text':
+        text = random.choice(corpus['text'])
+        # Уникальный хвост, чтобы запросы не попадали в кэш шаблонов
+        message['text'] = f"{text}\nReference: {update_id}" if unique else text
+    else:
+        path = random.choice(corpus[kind])
+        name = os.path.basename(path)
+        message['document'] = {
+            'file_id': name,
+            'file_unique_id': f"{name}-{update_id}" if unique else name,
+            'file_name': name,
+            'file_size': os.path.getsize(path),
+        }
+    return {'update_id': update_id, 'message': message}
+
+
+async def run(args) -> dict:
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix='resume_corpus_')
+    paths = build_corpus(corpus_dir, args.corpus_size) if not args.corpus else [
+        os.path.join(corpus_dir, name) for name in sorted(os.listdir(corpus_dir))
+    ]
+    corpus = defaultdict(list)
+    for path in paths:
+        ext = path.rsplit('.', 1)[-1]
+        corpus[ext].append(path)
+        if ext == 'txt':
+            with open(path, encoding='utf-8') as f:
+                corpus['text'].append(f.read())
+
+    fake_openai = FakeOpenAI(
+        latency=args.openai_latency, jitter=args.openai_jitter,
+        tokens_per_second=args.openai_tps, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        stall_rate=args.stall_rate, stall_seconds=args.stall_seconds
+    )
+    fake_telegram = FakeTelegram(
+        files_dir=corpus_dir, latency=args.telegram_latency,
+        chat_limit=args.flood_chat_limit, global_limit=args.flood_global_limit
+    )
+    openai_url = await fake_openai.start()
+    await fake_telegram.start()
+
+    # Конфигурация читается при импорте bot.py, поэтому окружение задаём до него
+    os.environ.update({
+        'BOT_TOKEN': '123456:bench-token',
+        'CHATGPT_TOKEN': 'sk-bench',
+        'OPENAI_BASE_URL': openai_url,
+        'OPENAI_STREAMING': 'true' if args.stream else 'false',
+        'MAX_REQUESTS_PER_MINUTE': str(10 ** 9),
+        'RATE_LIMIT_BACKEND': 'memory',
+        'CACHE_ENABLED': 'true' if args.cache else 'false',
+        'CACHE_DB_PATH': '',
+        'METRICS_PORT': '0',
+        'BOT_MODE': 'polling',
+        # Генерация в обработчике апдейта: задержка process_update - полное время ответа
+        'JOB_WORKERS': '0',
+        'STREAM_EDIT_INTERVAL': str(args.edit_interval),
+        'OPENAI_HEDGE_MAX_FRACTION': str(args.hedge_fraction),
+    })
+    if not args.send_scheduler:
+        # Лимиты планировщика отправки настолько высоки, что он ничего не задерживает
+        os.environ.update({'TELEGRAM_GLOBAL_RATE': str(10 ** 6), 'TELEGRAM_CHAT_RATE': str(10 ** 6),
+                           'TELEGRAM_CHAT_BURST': str(10 ** 6), 'TELEGRAM_SEND_RETRIES': '0'})
+    import bot
+    logging.getLogger().setLevel(args.log_level)
+
+    application = bot.build_application(
+        base_url=fake_telegram.base_url, base_file_url=fake_telegram.base_file_url
+    )
+    await application.initialize()
+    # Как в post_init бота: openai и tiktoken импортируются до первой генерации, а не во время замера
+    await bot.preload_dependencies()
+    bot_api = application.bot
+
+    weights = parse_mix(args.mix)
+    kinds = random.choices(list(weights), weights=list(weights.values()), k=args.requests)
+    latencies = defaultdict(list)
+    lag_samples = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_loop_lag(lag_samples, args.lag_interval, stop))
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(index: int, kind: str):
+        data = make_update(index + 1, 100000 + index, kind, corpus, unique=not args.cache)
+        update = bot.Update.de_json(data, bot_api)
+        async with semaphore:
+            started = time.perf_counter()
+            await application.process_update(update)
+            elapsed = time.perf_counter() - started
+        latencies[kind].append(elapsed)
+        latencies['all'].append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i, kind) for i, kind in enumerate(kinds)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await lag_task
+
+    await bot.admin_notifier.close()
+    await application.shutdown()
+    bot.extraction_pool.shutdown()
+    await fake_openai.stop()
+    await fake_telegram.stop()
+
+    return {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'wall_seconds': wall,
+        'throughput_rps': args.requests / wall if wall else 0.0,
+        'latency': {kind: summarize(values) for kind, values in sorted(latencies.items())},
+        'loop_lag': summarize(lag_samples),
+        'openai': {
+            'requests': fake_openai.requests,
+            'errors': fake_openai.errors,
+            'rate_limited': fake_openai.rate_limited,
+        },
+        'telegram_calls': dict(fake_telegram.calls),
+        'generations': {key[0]: value for key, value in bot.GENERATIONS._values.items()},
+    }
+
+
+def print_report(report: dict):
+    print(f"\nRequests: {report['requests']}  concurrency: {report['concurrency']}  "
+          f"wall: {report['wall_seconds']:.2f}s  throughput: {report['throughput_rps']:.2f} req/s")
+    print(f"{'kind':<8}{'count':>7}{'p50, s':>10}{'p95, s':>10}{'p99, s':>10}{'max, s':>10}")
+    for kind, stats in report['latency'].items():
+        print(f"{kind:<8}{stats['count']:>7}{stats['p50']:>10.3f}{stats['p95']:>10.3f}"
+              f"{stats['p99']:>10.3f}{stats['max']:>10.3f}")
+    lag = report['loop_lag']
+    print(f"Event loop lag: p50 {lag['p50'] * 1000:.1f}ms  p99 {lag['p99'] * 1000:.1f}ms  "
+          f"max {lag['max'] * 1000:.1f}ms")
+    print(f"OpenAI stub: {report['openai']}")
+    print(f"Telegram stub calls: {report['telegram_calls']}")
+    print(f"Generation outcomes: {report['generations']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the cover letter bot")
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--mix', default='text=0.4,txt=0.1,pdf=0.25,docx=0.25',
+                        help="update kinds and weights: text, txt, pdf, docx")
+    parser.add_argument('--corpus', help="directory with resumes (default: generated)")
+    parser.add_argument('--corpus-size', type=int, default=10)
+    parser.add_argument('--openai-latency', type=float, default=1.0, help="seconds to first token")
+    parser.add_argument('--openai-jitter', type=float, default=0.2)
+    parser.add_argument('--openai-tps', type=float, default=300.0, help="streamed tokens per second")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of 500 responses")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="share of 429 responses")
+    parser.add_argument('--stall-rate', type=float, default=0.0, help="share of OpenAI requests that stall")
+    parser.add_argument('--stall-seconds', type=float, default=10.0, help="extra delay of a stalled request")
+    parser.add_argument('--hedge-fraction', type=float, default=0.1,
+                        help="max share of hedged OpenAI requests (0 disables hedging)")
+    parser.add_argument('--telegram-latency', type=float, default=0.02)
+    parser.add_argument('--flood-chat-limit', type=int, default=0,
+                        help="Telegram stub answers 429 above this many messages per chat per second")
+    parser.add_argument('--flood-global-limit', type=int, default=0,
+                        help="Telegram stub answers 429 above this many messages per second in total")
+    parser.add_argument('--send-scheduler', action=argparse.BooleanOptionalAction, default=True,
+                        help="pace outgoing messages (--no-send-scheduler lifts its limits)")
+    parser.add_argument('--stream', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--cache', action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument('--edit-interval', type=float, default=1.5)
+    parser.add_argument('--lag-interval', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="write the report as JSON to this path")
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Время импорта бота (холодный старт) по данным python -X importtime
+Печатает медиану времени импорта, самые тяжёлые зависимости и проверяет,
+что тяжёлые библиотеки (openai, PyPDF2, python-docx, ...) не импортируются
+при старте. Код возврата 1, если цель не достигнута - для проверки регрессий
+
+Пример:
+    python benchmarks/startup_time.py --repeat 5 --target-ms 500
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Импортируются при первом использовании, а не при запуске
+LAZY_MODULES = ('openai', 'PyPDF2', 'docx', 'aiohttp', 'tiktoken')
+
+
+def parse_importtime(stderr: str, module: str):
+    """Время импорта module (мкс) и импортированные им модули: [(имя, глубина, мкс)]
+
+    Вывод -X importtime - строки "import time: self | cumulative | имя" в порядке
+    завершения импорта: зависимости идут раньше модуля, вложенность - отступом
+    """
+    block = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|', 2)
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        name = name.strip()
+        if depth == 0:
+            if name == module:
+                return int(cumulative), block
+            block = []
+        else:
+            block.append((name, depth, int(cumulative)))
+    raise RuntimeError(f"module {module} not found in -X importtime output")
+
+
+def run_once(module: str, env: dict):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    total, imported = parse_importtime(result.stderr, module)
+    return wall, total, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure bot cold start (import time)")
+    parser.add_argument('--module', default='bot')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--target-ms', type=float, default=500.0,
+                        help="fail if the median import time exceeds this")
+    parser.add_argument('--top', type=int, default=10, help="heaviest direct imports to show")
+    parser.add_argument('--json', help="write the report as JSON to this path")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('BOT_TOKEN', 'bench')
+    env.setdefault('CHATGPT_TOKEN', 'bench')
+
+    walls, totals = [], []
+    imported = []
+    for _ in range(args.repeat):
+        wall, total, imported = run_once(args.module, env)
+        walls.append(wall)
+        totals.append(total / 1000)
+
+    import_ms = statistics.median(totals)
+    process_ms = statistics.median(walls) * 1000
+    names = {name for name, _, _ in imported}
+    eager = sorted(lazy for lazy in LAZY_MODULES
+                   if any(name == lazy or name.startswith(lazy + '.') for name in names))
+    heaviest = sorted((item for item in imported if item[1] == 1), key=lambda item: -item[2])[:args.top]
+
+    print(f"import {args.module}: median {import_ms:.1f}ms (min {min(totals):.1f}, max {max(totals):.1f}) "
+          f"over {args.repeat} runs; process wall time {process_ms:.1f}ms")
+    print(f"{'module':<32}{'cumulative, ms':>16}")
+    for name, _, cumulative in heaviest:
+        print(f"{name:<32}{cumulative / 1000:>16.1f}")
+
+    failures = []
+    if import_ms > args.target_ms:
+        failures.append(f"import time {import_ms:.1f}ms exceeds target {args.target_ms:.0f}ms")
+    if eager:
+        failures.append(f"imported at startup, expected lazy: {', '.join(eager)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"OK: target {args.target_ms:.0f}ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'module': args.module,
+                'import_ms': import_ms,
+                'import_ms_runs': totals,
+                'process_ms': process_ms,
+                'heaviest': [{'module': name, 'ms': cumulative / 1000} for name, _, cumulative in heaviest],
+                'eager_lazy_modules': eager,
+                'failures': failures,
+            }, f, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
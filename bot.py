@@ -1,18 +1,66 @@
 # -*- coding: utf-8 -*-
 import os
+import sys
+import time
+import asyncio
 import logging
-from datetime import datetime, timedelta
-from collections import defaultdict
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from openai import OpenAI, RateLimitError, APIError, APIConnectionError, APITimeoutError
+import functools
+from datetime import datetime, timezone
+from telegram import Update, Message, Chat
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler,
+    filters, ContextTypes
+)
 from config import (
     BOT_TOKEN, CHATGPT_TOKEN, ADMIN_ID,
-    OPENAI_MODEL, OPENAI_TEMPERATURE, OPENAI_MAX_TOKENS, OPENAI_TIMEOUT,
+    OPENAI_MODEL, OPENAI_MAX_TOKENS, OPENAI_TIMEOUT, OPENAI_BASE_URL,
+    OPENAI_ENDPOINTS, OPENAI_ENDPOINT_COOLDOWN, OPENAI_HEALTH_CHECK_INTERVAL,
+    OPENAI_HEDGE_QUANTILE, OPENAI_HEDGE_MAX_FRACTION, OPENAI_HEDGE_MIN_SAMPLES,
+    OPENAI_ADAPTIVE_TIMEOUT, OPENAI_MIN_TIMEOUT,
+    OPENAI_MAX_CONCURRENCY, TELEGRAM_CONCURRENT_UPDATES,
+    OPENAI_TPM_LIMIT, OPENAI_RPM_LIMIT, OPENAI_RATE_LIMIT_RETRIES, OPENAI_BACKOFF_BASE, OPENAI_BACKOFF_MAX,
+    OPENAI_STREAMING, STREAM_EDIT_INTERVAL,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_SECRET,
+    WEBHOOK_SET_ON_START, TELEGRAM_BASE_URL, TELEGRAM_BASE_FILE_URL,
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_GROUP_RATE_PER_MINUTE,
+    TELEGRAM_SEND_RETRIES,
     MAX_FILE_SIZE, MAX_RESUME_LENGTH, MAX_PDF_PAGES, MIN_RESUME_LENGTH,
-    MAX_REQUESTS_PER_MINUTE
+    EXTRACTION_WORKERS, EXTRACTION_TIMEOUT, DOWNLOAD_MEMORY_LIMIT,
+    ADMIN_NOTIFY_WINDOW, ADMIN_NOTIFY_BURST, METRICS_HOST, METRICS_PORT,
+    MAX_REQUESTS_PER_MINUTE, RATE_LIMIT_BACKEND, RATE_LIMIT_DB_PATH, RATE_LIMIT_REDIS_URL,
+    CACHE_ENABLED, CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, CACHE_DB_PATH, CACHE_DB_MAX_ENTRIES,
+    FILE_TEXT_CACHE_ENABLED, FILE_TEXT_CACHE_MAX_ENTRIES, FILE_TEXT_CACHE_TTL_SECONDS,
+    JOB_WORKERS, JOB_QUEUE_DB_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_RECLAIM_ON_START,
+    PROFILES_ENABLED, PROFILE_DB_PATH, PROFILE_MAX_ENTRIES, PROFILE_TTL_SECONDS, PROFILE_MAX_TOKENS,
+    require_tokens
+)
+from cache import TieredCache, make_cache_key
+from rate_limiter import create_rate_limiter
+from governor import OpenAIGovernor
+from client_pool import ClientPool, parse_endpoints, is_region_blocked
+from hedging import Hedger
+from admin_notifier import AdminNotifier, format_alert
+from metrics import (
+    timed, start_metrics_server,
+    FILE_DOWNLOAD_SECONDS, EXTRACTION_SECONDS, OPENAI_REQUEST_SECONDS,
+    OPENAI_PROMPT_TOKENS, OPENAI_CACHED_PROMPT_TOKENS, OPENAI_COMPLETION_TOKENS, HANDLER_SECONDS,
+    JOB_WAIT_SECONDS, GENERATION_SECONDS, CACHE_REQUESTS, FILE_TEXT_CACHE_REQUESTS, RATE_LIMITED, GENERATIONS, ERRORS,
+    PROFILE_FOLLOWUPS, PROFILE_BUILDS, PLACEHOLDER_FILLS
+)
+from download import download_file, close_http_client, FileTooLargeError
+from extraction import ExtractionPool, PdfTooLargeError, ExtractionTimeoutError
+from streaming import MessageStreamer, split_text
+from send_scheduler import SendScheduler, PRIORITY_PROGRESS, PRIORITY_ADMIN
+from job_queue import Job, JobQueue, JobWorkerPool
+from profiles import ProfileStore, looks_like_job_posting
+from placeholders import PLACEHOLDER_RE, find_placeholders, fill_placeholders, parse_fill_request, is_details_text
+from tokens import estimate_tokens, estimator_name
+from prompts import (
+    prompt_template, sanitize_resume_text, sanitize_vacancy_text, prepare_resume_text, prepare_vacancy_text, build_request_params,
+    build_vacancy_request_params, build_profile_request_params, cover_letter_cache_key,
+    vacancy_letter_cache_key, clean_cover_letter
 )
-import io
+from webhook import serve_webhook
 
 # Настройка логирования
 logging.basicConfig(
@@ -21,103 +69,126 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Rate limiting: словарь для хранения запросов пользователей
-user_requests = defaultdict(list)
+# Rate limiting: token bucket на MAX_REQUESTS_PER_MINUTE запросов в минуту
+rate_limiter = create_rate_limiter(
+    RATE_LIMIT_BACKEND,
+    MAX_REQUESTS_PER_MINUTE,
+    db_path=RATE_LIMIT_DB_PATH,
+    redis_url=RATE_LIMIT_REDIS_URL
+)
+
+# Пул процессов для разбора PDF/DOCX (запускается при первом файле)
+extraction_pool = ExtractionPool(EXTRACTION_WORKERS, EXTRACTION_TIMEOUT)
+
+# Без ключа OpenAI не работает ни бот, ни пакетный режим
+require_tokens('CHATGPT_TOKEN')
+
+# Пул асинхронных OpenAI клиентов (эндпоинты/ключи из OPENAI_ENDPOINTS) с таймаутом
+# (синхронный клиент блокировал event loop на время всего запроса)
+openai_pool = ClientPool(
+    parse_endpoints(OPENAI_ENDPOINTS, CHATGPT_TOKEN, OPENAI_BASE_URL),
+    timeout=OPENAI_TIMEOUT,
+    cooldown=OPENAI_ENDPOINT_COOLDOWN,
+    health_check_interval=OPENAI_HEALTH_CHECK_INTERVAL
+)
+
+# Дублирование медленных запросов и адаптивный таймаут - отдельно для потокового
+# (время до первого токена) и обычного (время ответа) режимов
+openai_hedgers = {
+    mode: Hedger(
+        mode,
+        max_timeout=OPENAI_TIMEOUT,
+        quantile=OPENAI_HEDGE_QUANTILE,
+        max_fraction=OPENAI_HEDGE_MAX_FRACTION,
+        min_samples=OPENAI_HEDGE_MIN_SAMPLES,
+        min_timeout=OPENAI_MIN_TIMEOUT,
+        adaptive_timeout=OPENAI_ADAPTIVE_TIMEOUT
+    )
+    for mode in ("stream", "plain")
+}
 
-# Импорты для обработки файлов (с обработкой ошибок)
-try:
-    import PyPDF2
-    PDF_SUPPORT = True
-except ImportError:
-    PDF_SUPPORT = False
-    logger.warning("PyPDF2 не установлен. Поддержка PDF файлов будет ограничена.")
+# Глобальная очередь запросов к OpenAI: параллельность, бюджет TPM/RPM и повторы
+# (лимиты заданы на один эндпоинт, общий бюджет растёт с числом эндпоинтов)
+openai_governor = OpenAIGovernor(
+    max_concurrency=OPENAI_MAX_CONCURRENCY * len(openai_pool),
+    tokens_per_minute=OPENAI_TPM_LIMIT * len(openai_pool),
+    requests_per_minute=OPENAI_RPM_LIMIT * len(openai_pool),
+    max_retries=OPENAI_RATE_LIMIT_RETRIES,
+    backoff_base=OPENAI_BACKOFF_BASE,
+    backoff_max=OPENAI_BACKOFF_MAX
+)
 
-try:
-    from docx import Document
-    DOCX_SUPPORT = True
-except ImportError:
-    DOCX_SUPPORT = False
-    logger.warning("python-docx не установлен. Поддержка DOCX файлов будет ограничена.")
+# Кэш готовых шаблонов (повторно присланное резюме не тратит токены)
+cover_letter_cache = TieredCache(
+    "cover_letters",
+    max_entries=CACHE_MAX_ENTRIES,
+    ttl=CACHE_TTL_SECONDS,
+    db_path=CACHE_DB_PATH or None,
+    db_max_entries=CACHE_DB_MAX_ENTRIES
+) if CACHE_ENABLED else None
 
-# Инициализация OpenAI клиента с таймаутом
-client = OpenAI(api_key=CHATGPT_TOKEN, timeout=OPENAI_TIMEOUT)
+# Кэш извлечённого текста документов по file_unique_id (без повторной загрузки и разбора)
+file_text_cache = TieredCache(
+    "file_texts",
+    max_entries=FILE_TEXT_CACHE_MAX_ENTRIES,
+    ttl=FILE_TEXT_CACHE_TTL_SECONDS,
+    db_path=CACHE_DB_PATH or None,
+    db_max_entries=CACHE_DB_MAX_ENTRIES,
+    table="file_texts"
+) if FILE_TEXT_CACHE_ENABLED else None
 
 # Глобальная переменная для приложения (будет установлена при запуске)
 application_instance = None
 
-# Загрузка промпта из файла
-def load_prompt():
-    try:
-        with open('promt.txt', 'r', encoding='utf-8') as f:
-            return f.read().strip()
-    except FileNotFoundError:
-        logger.error("Файл promt.txt не найден")
-        return None
+# Очередь заданий генерации и её обработчики (создаются в post_init)
+job_queue = None
+job_workers = None
+
+# Сохранённые резюме и профили пользователей (создаётся в post_init)
+profile_store = None
+# Создание краткого профиля в фоне: user_id -> задача
+profile_builds = {}
 
-SYSTEM_PROMPT = load_prompt()
-
-# Дополнительные инструкции для ИИ
-ADDITIONAL_INSTRUCTIONS = """
-CRITICAL INSTRUCTIONS:
-- You MUST return ONLY the cover letter template text
-- DO NOT include any introductory text, explanations, or comments
-- DO NOT say things like "Here is your cover letter:" or "Based on your resume:"
-- DO NOT use markdown code blocks (```)
-- DO NOT add any text before or after the template
-- The template must be in English
-- Include placeholders in square brackets [ ] as shown in the format
-- Base the template on the resume information provided
-- Start directly with the template format: [Your Name] [Your City, Country]...
-"""
-
-def check_rate_limit(user_id: int) -> bool:
+async def check_rate_limit(user_id: int) -> bool:
     """Проверка rate limit для пользователя"""
-    now = datetime.now()
-    # Очищаем старые запросы (старше 1 минуты)
-    user_requests[user_id] = [
-        req_time for req_time in user_requests[user_id]
-        if now - req_time < timedelta(minutes=1)
-    ]
-    
-    # Проверяем лимит
-    if len(user_requests[user_id]) >= MAX_REQUESTS_PER_MINUTE:
-        return False
-    
-    # Добавляем текущий запрос
-    user_requests[user_id].append(now)
-    return True
+    try:
+        return await rate_limiter.acquire(user_id)
+    except Exception as e:
+        # Недоступный бэкенд не должен блокировать пользователей
+        logger.error(f"Ошибка rate limiter ({RATE_LIMIT_BACKEND}): {e}")
+        return True
 
-def sanitize_resume_text(text: str) -> str:
-    """Очистка и валидация текста резюме"""
-    if len(text) > MAX_RESUME_LENGTH:
-        raise ValueError(f"Resume is too long (maximum {MAX_RESUME_LENGTH} characters)")
-    
-    # Удаляем потенциально опасные символы
-    text = text.replace('\x00', '')  # Null bytes
-    text = text[:MAX_RESUME_LENGTH]  # Обрезаем до лимита
-    
-    return text.strip()
+async def send_admin_message(text: str):
+    """Отправка HTML-сообщения администратору"""
+    if application_instance:
+        await application_instance.bot.send_message(
+            chat_id=ADMIN_ID,
+            text=text,
+            parse_mode='HTML',
+            rate_limit_args={'priority': PRIORITY_ADMIN}
+        )
 
-async def send_error_notification(error_message: str, user_info: str = "", error_type: str = "ERROR"):
-    """Отправка уведомления об ошибке администратору"""
+# Уведомления администратору отправляются в фоне, повторы объединяются в сводки
+admin_notifier = AdminNotifier(send_admin_message, window=ADMIN_NOTIFY_WINDOW, burst=ADMIN_NOTIFY_BURST)
+
+async def send_error_notification(error_message: str, user_info: str = "", error_type: str = "ERROR",
+                                  exception: Exception = None, immediate: bool = False):
+    """Отправка уведомления об ошибке администратору
+    
+    По умолчанию только ставит уведомление в очередь; immediate=True отправляет сразу
+    (например, когда event loop вот-вот завершится)
+    """
     try:
-        if application_instance:
-            from datetime import datetime
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            error_text = (
-                f"🚨 <b>{error_type}</b>\n\n"
-                f"<b>Ошибка:</b>\n<code>{error_message[:1000]}</code>\n\n"
-            )
-            if user_info:
-                error_text += f"<b>Пользователь:</b> {user_info}\n\n"
-            error_text += f"<b>Время:</b> {current_time}"
-            
-            await application_instance.bot.send_message(
-                chat_id=ADMIN_ID,
-                text=error_text,
-                parse_mode='HTML'
-            )
+        if immediate:
+            await send_admin_message(format_alert(error_message, user_info, error_type))
+            return
+        # Класс исключения берём из обрабатываемого исключения, если его не передали
+        exception = exception or sys.exc_info()[1]
+        ERRORS.inc(error_type=error_type)
+        admin_notifier.notify(
+            error_message, user_info, error_type,
+            exception_name=type(exception).__name__ if exception else ""
+        )
     except Exception as e:
         logger.error(f"Не удалось отправить уведомление администратору: {e}")
 
@@ -141,90 +212,110 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "   • Отправь файл с резюме (PDF, DOC, DOCX, TXT)\n\n"
         "2. Бот автоматически создаст шаблон сопроводительного письма\n\n"
         "3. Шаблон будет содержать плейсхолдеры [ ], которые нужно заменить на данные вакансии\n\n"
+        "4. После шаблона можно присылать описания вакансий (или /vacancy <текст вакансии>) - "
+        "бот напишет письмо под каждую, не запрашивая резюме заново\n\n"
+        "5. /fill company=Acme; position=... - заполнить плейсхолдеры последнего шаблона "
+        "мгновенно, без генерации (можно вставить и текст вакансии после /fill)\n\n"
+        "🗑 /forget - удалить сохранённое резюме\n\n"
         "💡 Совет: Чем подробнее резюме, тем лучше будет шаблон!"
     )
     await update.message.reply_text(help_text)
 
+def notify_file_too_large(file, size_text: str):
+    """Уведомление администратора о слишком большом файле"""
+    logger.warning(f"Файл слишком большой: {size_text} (максимум {MAX_FILE_SIZE})")
+    return send_error_notification(
+        f"File too large: {size_text}",
+        f"File: {file.file_name if hasattr(file, 'file_name') else 'Unknown'}",
+        "WARNING: File Size Exceeded"
+    )
+
 async def extract_text_from_file(file) -> str:
     """Извлечение текста из файла"""
     try:
+        # Размер из сообщения позволяет отказать ещё до запроса getFile
+        if file.file_size and file.file_size > MAX_FILE_SIZE:
+            await notify_file_too_large(file, f"{file.file_size} bytes")
+            return None
+        
+        # Определяем тип файла
+        file_name = file.file_name.lower() if file.file_name else ""
+        
+        if file_name.endswith('.pdf'):
+            format_name = "PDF"
+        elif file_name.endswith('.docx'):
+            format_name = "DOCX"
+        elif file_name.endswith('.txt'):
+            format_name = "TXT"
+        else:
+            # Старые .doc файлы сложнее обрабатывать, просим пользователя конвертировать
+            return None
+        
+        # Повторно присланный файл (тот же file_unique_id) не скачиваем и не разбираем заново
+        cache_key = None
+        if file_text_cache is not None and file.file_unique_id:
+            cache_key = make_cache_key(file.file_unique_id, file.file_size, format_name)
+            cached = await file_text_cache.get(cache_key)
+            FILE_TEXT_CACHE_REQUESTS.inc(result="hit" if cached is not None else "miss")
+            if cached is not None:
+                logger.info(f"Текст файла {file_name} взят из кэша")
+                return cached
+        
         # Получаем файл
         file_obj = await file.get_file()
         
         # Проверка размера файла
         if file_obj.file_size and file_obj.file_size > MAX_FILE_SIZE:
-            logger.warning(f"Файл слишком большой: {file_obj.file_size} bytes (максимум {MAX_FILE_SIZE})")
-            await send_error_notification(
-                f"File too large: {file_obj.file_size} bytes",
-                f"File: {file.file_name if hasattr(file, 'file_name') else 'Unknown'}",
-                "WARNING: File Size Exceeded"
-            )
+            await notify_file_too_large(file, f"{file_obj.file_size} bytes")
             return None
         
-        file_content = await file_obj.download_as_bytearray()
-        
-        # Определяем тип файла
-        file_name = file.file_name.lower() if file.file_name else ""
-        
-        if file_name.endswith('.txt'):
-            return file_content.decode('utf-8', errors='ignore')
+        # Потоковая загрузка: размер file_size может отсутствовать, поэтому лимит
+        # проверяется по мере получения данных, и загрузка обрывается при превышении
+        try:
+            with FILE_DOWNLOAD_SECONDS.time():
+                buffer = await download_file(file_obj, MAX_FILE_SIZE, DOWNLOAD_MEMORY_LIMIT)
+        except FileTooLargeError:
+            await notify_file_too_large(file, f"more than {MAX_FILE_SIZE} bytes (download aborted)")
+            return None
         
-        elif file_name.endswith('.pdf'):
-            if not PDF_SUPPORT:
-                return None
-            try:
-                pdf_file = io.BytesIO(file_content)
-                pdf_reader = PyPDF2.PdfReader(pdf_file)
-                
-                # Проверка количества страниц
-                num_pages = len(pdf_reader.pages)
-                if num_pages > MAX_PDF_PAGES:
-                    logger.warning(f"PDF слишком большой: {num_pages} страниц (максимум {MAX_PDF_PAGES})")
+        with buffer:
+            if format_name == "TXT":
+                with EXTRACTION_SECONDS.time(format="txt"):
+                    text = buffer.fileobj().read().decode('utf-8', errors='ignore')
+            else:
+                # Разбор выполняется в отдельном процессе, чтобы не блокировать event loop
+                try:
+                    with EXTRACTION_SECONDS.time(format=format_name.lower()):
+                        text = await extraction_pool.extract(file_name, buffer)
+                except PdfTooLargeError as e:
+                    logger.warning(f"PDF слишком большой: {e.num_pages} страниц (максимум {MAX_PDF_PAGES})")
                     await send_error_notification(
-                        f"PDF too large: {num_pages} pages",
+                        f"PDF too large: {e.num_pages} pages",
                         f"File: {file_name}",
                         "WARNING: PDF Too Large"
                     )
                     return None
-                
-                text = ""
-                for page in pdf_reader.pages[:MAX_PDF_PAGES]:  # Ограничиваем количество страниц
-                    text += page.extract_text() + "\n"
-                return text.strip() if text.strip() else None
-            except Exception as e:
-                logger.error(f"Ошибка при чтении PDF: {e}", exc_info=True)
-                # Отправляем уведомление о критической ошибке чтения PDF
-                await send_error_notification(
-                    f"PDF Reading Error: {type(e).__name__}\n{str(e)}",
-                    f"File: {file_name}",
-                    "ERROR: PDF Processing Failed"
-                )
-                return None
-        
-        elif file_name.endswith('.docx'):
-            if not DOCX_SUPPORT:
-                return None
-            try:
-                doc_file = io.BytesIO(file_content)
-                doc = Document(doc_file)
-                text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-                return text.strip() if text.strip() else None
-            except Exception as e:
-                logger.error(f"Ошибка при чтении DOCX: {e}", exc_info=True)
-                # Отправляем уведомление о критической ошибке чтения DOCX
-                await send_error_notification(
-                    f"DOCX Reading Error: {type(e).__name__}\n{str(e)}",
-                    f"File: {file_name}",
-                    "ERROR: DOCX Processing Failed"
-                )
-                return None
-        
-        elif file_name.endswith('.doc'):
-            # Старые .doc файлы сложнее обрабатывать, просим пользователя конвертировать
-            return None
+                except ExtractionTimeoutError as e:
+                    logger.warning(f"Превышено время разбора {format_name}: {e}")
+                    await send_error_notification(
+                        f"{format_name} extraction timed out after {EXTRACTION_TIMEOUT}s",
+                        f"File: {file_name}",
+                        f"WARNING: {format_name} Extraction Timeout"
+                    )
+                    return None
+                except Exception as e:
+                    logger.error(f"Ошибка при чтении {format_name}: {e}", exc_info=True)
+                    # Отправляем уведомление о критической ошибке чтения файла
+                    await send_error_notification(
+                        f"{format_name} Reading Error: {type(e).__name__}\n{str(e)}",
+                        f"File: {file_name}",
+                        f"ERROR: {format_name} Processing Failed"
+                    )
+                    return None
         
-        else:
-            return None
+        if text and cache_key:
+            await file_text_cache.set(cache_key, text)
+        return text
     except Exception as e:
         logger.error(f"Ошибка при обработке файла: {e}", exc_info=True)
         # Отправляем уведомление о критической ошибке обработки файла
@@ -236,10 +327,36 @@ async def extract_text_from_file(file) -> str:
         )
         return None
 
-async def generate_cover_letter(resume_text: str, user_id: int = None, username: str = None) -> str:
-    """Генерация шаблона сопроводительного письма через OpenAI"""
+def queue_position_reporter(processing_msg, streamer=None):
+    """Колбэк, сообщающий пользователю его место в очереди к OpenAI"""
+    async def report(position: int):
+        # Если текст уже начал появляться, не затираем его
+        if streamer and streamer.started:
+            return
+        await processing_msg.get_bot().edit_message_text(
+            f"⏳ High demand right now. Your place in the queue: {position}\n\n"
+            f"The template will be created automatically, there is no need to resend the resume.",
+            chat_id=processing_msg.chat_id, message_id=processing_msg.message_id,
+            rate_limit_args={'priority': PRIORITY_PROGRESS}
+        )
+    return report
+
+async def generate_cover_letter(resume_text: str, user_id: int = None, username: str = None,
+                                on_progress=None, on_queue_position=None, vacancy_text: str = None) -> str:
+    """Генерация шаблона сопроводительного письма через OpenAI
+    
+    on_progress - необязательная корутина, получающая частичный текст в потоковом режиме
+    on_queue_position - необязательная корутина, получающая место в очереди к OpenAI
+    vacancy_text - описание вакансии: тогда resume_text - профиль кандидата (или
+    сохранённое резюме), и пишется письмо под эту вакансию
+    """
+    # openai импортируется при первой генерации (или заранее в фоне, см. post_init)
+    from openai import RateLimitError, APIError, APIConnectionError, APITimeoutError
+
     try:
-        if not SYSTEM_PROMPT:
+        # Промпт перечитывается из файла, если promt.txt изменился
+        prompt = prompt_template.current()
+        if prompt is None:
             error_msg = "Error: Failed to load prompt. Please check the promt.txt file"
             await send_error_notification(
                 "Failed to load prompt from promt.txt file",
@@ -248,48 +365,99 @@ async def generate_cover_letter(resume_text: str, user_id: int = None, username:
             )
             return error_msg
         
-        # Валидация и санитизация резюме
-        try:
-            resume_text = sanitize_resume_text(resume_text)
-        except ValueError as e:
-            logger.warning(f"Валидация резюме не прошла: {e}")
-            return None
+        if vacancy_text is None:
+            # Валидация, нормализация и ограничение резюме по токенам
+            try:
+                prepared = prepare_resume_text(resume_text)
+            except ValueError as e:
+                logger.warning(f"Валидация резюме не прошла: {e}")
+                return None
+            resume_text = prepared.text
+            await remember_resume(user_id, resume_text)
+            request_params = build_request_params(resume_text, prompt)
+            # Оценка стоимости запроса для бюджета токенов: промпт + максимум ответа
+            cost = prompt.prefix_tokens + prepared.tokens + OPENAI_MAX_TOKENS
+        else:
+            try:
+                vacancy = prepare_vacancy_text(vacancy_text)
+            except ValueError as e:
+                logger.warning(f"Валидация вакансии не прошла: {e}")
+                return None
+            vacancy_text = vacancy.text
+            request_params = build_vacancy_request_params(resume_text, vacancy_text, prompt)
+            cost = (prompt.vacancy_prefix_tokens + estimate_tokens(resume_text, OPENAI_MODEL) + vacancy.tokens
+                    + OPENAI_MAX_TOKENS)
         
-        full_prompt = f"{SYSTEM_PROMPT}\n\n{ADDITIONAL_INSTRUCTIONS}\n\nResume:\n{resume_text}"
-        
-        response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT + "\n\n" + ADDITIONAL_INSTRUCTIONS},
-                {"role": "user", "content": f"Generate a cover letter template based on this resume:\n\n{resume_text}"}
-            ],
-            temperature=OPENAI_TEMPERATURE,
-            max_tokens=OPENAI_MAX_TOKENS,
-            timeout=OPENAI_TIMEOUT
-        )
+        # Проверяем кэш: ключ зависит от резюме (и вакансии), промпта и параметров модели
+        cache_key = None
+        if cover_letter_cache is not None:
+            if vacancy_text is None:
+                cache_key = cover_letter_cache_key(resume_text, prompt)
+            else:
+                cache_key = vacancy_letter_cache_key(resume_text, vacancy_text, prompt)
+            cached = await cover_letter_cache.get(cache_key)
+            CACHE_REQUESTS.inc(result="hit" if cached is not None else "miss")
+            if cached is not None:
+                logger.info(f"Cover letter cache hit for user {user_id} ({cover_letter_cache.stats()})")
+                return cached
+        
+        mode = "stream" if on_progress and OPENAI_STREAMING else "plain"
+        hedger = openai_hedgers[mode]
+        
+        async def complete(client, commit):
+            # Таймаут попытки подстраивается под наблюдаемые задержки
+            timeout = hedger.attempt_timeout()
+            if mode == "stream":
+                # Потоковый режим: отдаём частичный текст по мере генерации
+                stream = await client.chat.completions.create(
+                    stream=True, stream_options={"include_usage": True}, timeout=timeout, **request_params
+                )
+                chunks = []
+                usage = None
+                async for chunk in stream:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        # Первый токен решает гонку с дублирующим запросом - второй отменяется
+                        commit()
+                        chunks.append(delta)
+                        await on_progress(clean_cover_letter("".join(chunks)))
+                return "".join(chunks), usage
+            response = await client.chat.completions.create(timeout=timeout, **request_params)
+            return response.choices[0].message.content, response.usage
+        
+        async def attempt(commit):
+            # Эндпоинт выбирается пулом; при сбое запрос повторяется на другом
+            return await openai_pool.call(functools.partial(complete, commit=commit))
+        
+        def reserve_hedge():
+            # Дублирующий запрос - только если регулятор может выдать ему бюджет сразу
+            ticket = openai_governor.try_acquire(user_id, cost)
+            return None if ticket is None else functools.partial(openai_governor.release, ticket)
         
-        cover_letter = response.choices[0].message.content.strip()
-        
-        # Убираем возможные markdown форматирования и лишний текст
-        cover_letter = cover_letter.replace('```markdown', '').replace('```', '').strip()
-        
-        # Удаляем возможные вводные фразы
-        intro_phrases = [
-            "here is your cover letter:",
-            "based on your resume:",
-            "here's your cover letter:",
-            "cover letter template:",
-            "template:"
-        ]
-        for phrase in intro_phrases:
-            if cover_letter.lower().startswith(phrase):
-                cover_letter = cover_letter[len(phrase):].strip()
-                # Убираем двоеточие и пробелы в начале
-                if cover_letter.startswith(':'):
-                    cover_letter = cover_letter[1:].strip()
-        
-        # Убираем лишние пробелы и переносы в начале
-        cover_letter = cover_letter.lstrip()
+        async def request():
+            with OPENAI_REQUEST_SECONDS.time(mode=mode):
+                content, usage = await hedger.run(attempt, reserve=reserve_hedge, cost=cost)
+            if usage is None:
+                return content, None
+            OPENAI_PROMPT_TOKENS.observe(usage.prompt_tokens)
+            OPENAI_COMPLETION_TOKENS.observe(usage.completion_tokens)
+            # Сколько токенов промпта OpenAI взял из своего кэша префиксов
+            details = getattr(usage, 'prompt_tokens_details', None)
+            cached_tokens = getattr(details, 'cached_tokens', None) or 0
+            OPENAI_CACHED_PROMPT_TOKENS.inc(cached_tokens)
+            logger.debug(f"Prompt tokens: {usage.prompt_tokens}, cached: {cached_tokens}")
+            return content, usage.total_tokens
+        
+        cover_letter = await openai_governor.call(user_id, cost, request, on_position=on_queue_position)
+        
+        cover_letter = clean_cover_letter(cover_letter)
+        
+        if cache_key and cover_letter:
+            await cover_letter_cache.set(cache_key, cover_letter)
         
         return cover_letter
         
@@ -331,14 +499,10 @@ async def generate_cover_letter(resume_text: str, user_id: int = None, username:
         error_message = str(e)
         
         # Проверяем на ошибку региона (должна быть первой проверкой)
-        is_region_blocked = (
-            "unsupported_country" in error_message.lower() or 
-            "country, region, or territory not supported" in error_message.lower() or
-            "unsupported_country_region_territory" in error_message.lower()
-        )
+        region_blocked = is_region_blocked(e)
         
         # Определяем тип ошибки для более детального уведомления
-        if is_region_blocked:
+        if region_blocked:
             notification_type = "CRITICAL: OpenAI API Region Blocked"
             error_details = (
                 f"OpenAI API Region Blocked: {error_type}\n{error_message}\n\n"
@@ -347,7 +511,8 @@ async def generate_cover_letter(resume_text: str, user_id: int = None, username:
                 f"1. Использовать VPN/прокси для API запросов\n"
                 f"2. Использовать альтернативный API endpoint\n"
                 f"3. Проверить настройки аккаунта OpenAI\n"
-                f"4. Использовать другой API ключ из поддерживаемого региона"
+                f"4. Использовать другой API ключ из поддерживаемого региона\n"
+                f"(эндпоинты и ключи можно добавить в OPENAI_ENDPOINTS - запросы переключатся автоматически)"
             )
         elif "permissiondenied" in error_type.lower() or "403" in error_message.lower():
             notification_type = "CRITICAL: OpenAI API Permission Denied"
@@ -373,7 +538,7 @@ async def generate_cover_letter(resume_text: str, user_id: int = None, username:
         )
         
         # Возвращаем специальное сообщение для пользователя в случае ошибки региона
-        if is_region_blocked:
+        if region_blocked:
             return "REGION_BLOCKED"
         
         return None
@@ -397,6 +562,352 @@ async def generate_cover_letter(resume_text: str, user_id: int = None, username:
         )
         return None
 
+async def remember_resume(user_id: int, resume_text: str):
+    """Сохранение резюме для следующих писем под вакансии"""
+    if profile_store is None or not user_id:
+        return
+    try:
+        await profile_store.save_resume(user_id, resume_text)
+    except Exception as e:
+        # Без сохранённого резюме бот работает как раньше
+        logger.error(f"Не удалось сохранить резюме пользователя {user_id}: {e}")
+
+async def build_user_profile(stored):
+    """Создание краткого профиля кандидата по сохранённому резюме (один раз на резюме)"""
+    request_params = build_profile_request_params(stored.resume_text)
+    
+    async def complete(client):
+        response = await client.chat.completions.create(timeout=OPENAI_TIMEOUT, **request_params)
+        return response.choices[0].message.content, response.usage
+    
+    async def request():
+        content, usage = await openai_pool.call(complete)
+        return content, usage.total_tokens if usage else None
+    
+    cost = estimate_tokens(stored.resume_text, OPENAI_MODEL) + PROFILE_MAX_TOKENS
+    try:
+        profile = (await openai_governor.call(stored.user_id, cost, request) or "").strip()
+        if not profile:
+            raise ValueError("empty profile")
+        await profile_store.set_profile(stored.user_id, stored.resume_hash, profile)
+        PROFILE_BUILDS.inc(outcome="success")
+        logger.info(
+            f"Профиль пользователя {stored.user_id}: {estimate_tokens(profile, OPENAI_MODEL)} токенов "
+            f"вместо {estimate_tokens(stored.resume_text, OPENAI_MODEL)} в резюме"
+        )
+    except Exception as e:
+        # Следующее письмо под вакансию снова использует резюме и повторит попытку
+        PROFILE_BUILDS.inc(outcome="error")
+        logger.warning(f"Не удалось создать профиль пользователя {stored.user_id}: {type(e).__name__}: {e}")
+    finally:
+        profile_builds.pop(stored.user_id, None)
+
+async def generate_vacancy_letter(vacancy_text: str, user_id: int, username: str = None,
+                                  on_progress=None, on_queue_position=None) -> str:
+    """Письмо под вакансию по сохранённому профилю пользователя
+    
+    Пока краткого профиля нет, письмо пишется по сохранённому резюме, а профиль
+    создаётся в фоне для следующих вакансий. "NO_PROFILE" - резюме не сохранено
+    """
+    stored = await profile_store.get(user_id) if profile_store else None
+    if stored is None:
+        return "NO_PROFILE"
+    if stored.profile:
+        PROFILE_FOLLOWUPS.inc(context="profile")
+    else:
+        PROFILE_FOLLOWUPS.inc(context="resume")
+        # Резюме не длиннее профиля сжимать незачем
+        short = estimate_tokens(stored.resume_text, OPENAI_MODEL) <= PROFILE_MAX_TOKENS
+        if not short and user_id not in profile_builds:
+            profile_builds[user_id] = asyncio.create_task(build_user_profile(stored))
+    return await generate_cover_letter(
+        stored.profile or stored.resume_text, user_id=user_id, username=username,
+        on_progress=on_progress, on_queue_position=on_queue_position, vacancy_text=vacancy_text
+    )
+
+async def remember_template(user_id: int, text: str):
+    """Сохранение общего шаблона с плейсхолдерами для /fill"""
+    if profile_store is None or not PLACEHOLDER_RE.search(text):
+        return
+    try:
+        await profile_store.save_template(user_id, text)
+    except Exception as e:
+        logger.error(f"Не удалось сохранить шаблон пользователя {user_id}: {e}")
+
+NO_PROFILE_TEXT = (
+    "📄 I don't have your resume yet (or it has expired).\n\n"
+    "Please send your resume first - then you can send job descriptions "
+    "and I'll write a cover letter for each vacancy."
+)
+
+# Тексты ошибок генерации для резюме из сообщения, из файла и для вакансии
+GENERATION_FAILED_TEXT = {
+    "message": "❌ An error occurred while generating the template. "
+               "Please try again or send the resume in a different format.",
+    "document": "❌ An error occurred while generating the template. "
+                "Please try sending the resume as text.",
+    "vacancy": "❌ An error occurred while writing the cover letter for this vacancy. "
+               "Please try again.",
+}
+
+async def submit_generation_job(update: Update, processing_msg, resume_text: str, source: str):
+    """Постановка генерации в очередь заданий (при JOB_WORKERS=0 - выполнение сразу)"""
+    user = update.effective_user
+    job_args = dict(
+        user_id=user.id,
+        username=user.username or "N/A",
+        chat_id=processing_msg.chat_id,
+        chat_type=processing_msg.chat.type,
+        message_id=processing_msg.message_id,
+        source=source,
+        resume_text=resume_text
+    )
+    if job_queue is None:
+        job = Job(id=None, resume_hash=None, attempts=1, created_at=time.time(), **job_args)
+        await run_generation_job(job, processing_msg)
+        return
+    job_id = await job_queue.put(**job_args)
+    job_workers.notify()
+    logger.info(f"Задание {job_id} пользователя {user.id} поставлено в очередь")
+
+async def run_generation_job(job: Job, processing_msg=None):
+    """Выполнение задания с замером полного времени от постановки в очередь до ответа"""
+    try:
+        await process_generation_job(job, processing_msg)
+    finally:
+        GENERATION_SECONDS.observe(max(0.0, time.time() - job.created_at), source=job.source)
+
+async def process_generation_job(job: Job, processing_msg=None):
+    """Генерация шаблона по заданию и доставка результата в исходный чат
+    
+    После перезапуска бота исходного объекта сообщения нет - он восстанавливается
+    по chat_id и message_id, чтобы редактировать то же сообщение "Processing..."
+    """
+    bot = application_instance.bot
+    if processing_msg is None:
+        processing_msg = Message(
+            message_id=job.message_id,
+            date=datetime.fromtimestamp(job.created_at, timezone.utc),
+            chat=Chat(id=job.chat_id, type=job.chat_type or Chat.PRIVATE)
+        )
+        processing_msg.set_bot(bot)
+        JOB_WAIT_SECONDS.observe(max(0.0, time.time() - job.created_at))
+    reply = functools.partial(bot.send_message, job.chat_id)
+    user_id, username = job.user_id, job.username
+    from_file = {"document": " from file", "vacancy": " for a vacancy"}.get(job.source, "")
+    streamer = None
+    
+    if job.attempts > JOB_MAX_ATTEMPTS:
+        # Задание, на котором процесс падал несколько раз подряд, больше не повторяем
+        logger.error(f"Задание {job.id} отменено после {job.attempts - 1} попыток")
+        await send_error_notification(
+            f"Generation job {job.id} abandoned after {job.attempts - 1} attempts",
+            f"ID: {user_id}, Username: @{username}",
+            "ERROR: Generation Job Abandoned"
+        )
+        await processing_msg.edit_text("❌ An error occurred. Please try again.")
+        return
+    
+    try:
+        # Генерируем шаблон (в потоковом режиме текст появляется в processing_msg)
+        if OPENAI_STREAMING:
+            streamer = MessageStreamer(processing_msg, reply, interval=STREAM_EDIT_INTERVAL,
+                                       max_retries=TELEGRAM_SEND_RETRIES)
+        # В задании вакансии вместо резюме - текст вакансии, резюме берётся из профиля
+        generate = generate_vacancy_letter if job.source == "vacancy" else generate_cover_letter
+        cover_letter = await generate(
+            job.resume_text, user_id=user_id, username=username,
+            on_progress=streamer.update if streamer else None,
+            on_queue_position=queue_position_reporter(processing_msg, streamer)
+        )
+        
+        # Логируем результат генерации
+        if cover_letter == "REGION_BLOCKED":
+            outcome = "region_blocked"
+        elif cover_letter == "NO_PROFILE":
+            outcome = "no_profile"
+        elif cover_letter:
+            outcome = "success"
+        else:
+            outcome = "error"
+        GENERATIONS.inc(outcome=outcome)
+        if outcome == "success":
+            logger.info(f"User {user_id} (@{username}) successfully generated cover letter{from_file}")
+        else:
+            logger.info(f"User {user_id} (@{username}) failed to generate cover letter{from_file} ({outcome})")
+        
+        if cover_letter == "REGION_BLOCKED":
+            # Специальная обработка ошибки региона
+            await processing_msg.edit_text(
+                "❌ Unfortunately, the OpenAI API service is not available in your region.\n\n"
+                "This is a limitation from OpenAI. To resolve the issue:\n"
+                "• Use a VPN\n"
+                "• Contact the bot administrator\n\n"
+                "Sorry for the inconvenience."
+            )
+        elif cover_letter == "NO_PROFILE":
+            # Резюме удалено или истёк срок хранения, пока задание ждало в очереди
+            await processing_msg.edit_text(NO_PROFILE_TEXT)
+        elif cover_letter and streamer:
+            # Дописываем итоговый текст в те же сообщения
+            await streamer.finish(cover_letter)
+        elif cover_letter:
+            # Удаляем сообщение о обработке
+            await processing_msg.delete()
+            
+            # Отправляем результат (длинный текст - частями по границам абзацев)
+            for part in split_text(cover_letter):
+                await reply(part)
+        else:
+            await (streamer.fail if streamer else processing_msg.edit_text)(GENERATION_FAILED_TEXT[job.source])
+        
+        # Для /fill хранится только общий шаблон: письмо под вакансию уже заполнено
+        if outcome == "success" and job.source != "vacancy":
+            await remember_template(user_id, cover_letter)
+            
+    except Exception as e:
+        error_type = type(e).__name__
+        error_message = str(e)
+        logger.error(f"Ошибка при генерации по заданию {job.id}: {e}", exc_info=True)
+        
+        # Отправляем уведомление администратору о критической ошибке
+        user_info = f"ID: {user_id}, Username: @{username}"
+        
+        await send_error_notification(
+            f"Generation Error: {error_type}\n{error_message}",
+            user_info,
+            "ERROR: Generation Failed"
+        )
+        
+        await processing_msg.edit_text(GENERATION_FAILED_TEXT[job.source])
+
+# Сообщение о начале обработки текста резюме и описания вакансии
+PROCESSING_TEXT = {
+    "message": "⏳ Processing your resume and creating a template...",
+    "vacancy": "⏳ Writing a cover letter for this vacancy based on your saved resume...",
+}
+
+# Подсказка при слишком длинном тексте резюме и описания вакансии
+TOO_LONG_HINT = {
+    "message": f"Please send a resume shorter than {MAX_RESUME_LENGTH} characters.",
+    "vacancy": f"Please send a shorter job description (up to {MAX_RESUME_LENGTH} characters).",
+}
+
+async def has_saved_resume(user_id: int) -> bool:
+    """Есть ли у пользователя сохранённое резюме"""
+    if profile_store is None:
+        return False
+    try:
+        return await profile_store.get(user_id) is not None
+    except Exception as e:
+        logger.error(f"Не удалось прочитать профиль пользователя {user_id}: {e}")
+        return False
+
+async def is_vacancy_followup(user_id: int, text: str) -> bool:
+    """Текст похож на вакансию, и резюме пользователя уже сохранено"""
+    return looks_like_job_posting(text) and await has_saved_resume(user_id)
+
+@timed(HANDLER_SECONDS, handler="vacancy")
+async def vacancy_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /vacancy: письмо под вакансию по сохранённому резюме"""
+    user_id = update.effective_user.id
+    username = update.effective_user.username or "N/A"
+    
+    if not await check_rate_limit(user_id):
+        await update.message.reply_text(
+            "⏳ Too many requests. Please wait a minute before your next request."
+        )
+        logger.info(f"Rate limit exceeded for user {user_id} (@{username})")
+        RATE_LIMITED.inc()
+        return
+    
+    # Текст после команды, с сохранением переносов строк
+    parts = (update.message.text or "").split(maxsplit=1)
+    vacancy_text = parts[1].strip() if len(parts) > 1 else ""
+    if not vacancy_text:
+        await update.message.reply_text(
+            "📝 Send /vacancy followed by the job description, for example:\n\n"
+            "/vacancy Senior Python Developer at Acme. Requirements: ..."
+        )
+        return
+    if not await has_saved_resume(user_id):
+        await update.message.reply_text(NO_PROFILE_TEXT)
+        return
+    
+    processing_msg = await update.message.reply_text(PROCESSING_TEXT["vacancy"])
+    try:
+        await submit_generation_job(update, processing_msg, sanitize_vacancy_text(vacancy_text), "vacancy")
+    except ValueError as e:
+        await processing_msg.edit_text(f"❌ {str(e)}\n\n{TOO_LONG_HINT['vacancy']}")
+    except Exception as e:
+        logger.error(f"Ошибка в vacancy_command: {e}", exc_info=True)
+        await send_error_notification(
+            f"Vacancy Processing Error: {type(e).__name__}\n{str(e)}",
+            f"ID: {user_id}, Username: @{username}",
+            "ERROR: Vacancy Processing Failed"
+        )
+        await processing_msg.edit_text(GENERATION_FAILED_TEXT["vacancy"])
+
+FILL_USAGE_TEXT = (
+    "📝 Send /fill followed by the vacancy details, one per line:\n\n"
+    "/fill company=Acme\nposition=Senior Python Developer\nteam=Payments team\n\n"
+    "Keys: company, position, focus, values, team, goal, or any placeholder name "
+    "(e.g. \"Your Phone=+1 555 0100\"). You can also paste the job posting after /fill."
+)
+
+async def fill_template(update: Update, details: str):
+    """Заполнение плейсхолдеров последнего шаблона без запроса к модели"""
+    user_id = update.effective_user.id
+    stored = await profile_store.get(user_id) if profile_store else None
+    if stored is None or not stored.last_template:
+        PLACEHOLDER_FILLS.inc(outcome="no_template")
+        await update.message.reply_text(
+            "📄 I don't have a template for you yet. Send your resume first, then use /fill."
+        )
+        return
+    values = parse_fill_request(details)
+    filled, unresolved = fill_placeholders(stored.last_template, values)
+    if filled == stored.last_template:
+        PLACEHOLDER_FILLS.inc(outcome="no_values")
+        await update.message.reply_text(
+            "⚠️ I couldn't match anything to the template placeholders.\n\n" + FILL_USAGE_TEXT
+        )
+        return
+    PLACEHOLDER_FILLS.inc(outcome="partial" if unresolved else "complete")
+    for part in split_text(filled):
+        await update.message.reply_text(part)
+    if unresolved:
+        await update.message.reply_text(
+            "⚠️ Still to fill in: " + ", ".join(unresolved) + "\n\n"
+            "Add them with /fill, e.g. /fill company=Acme"
+        )
+
+async def fill_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /fill: плейсхолдеры последнего шаблона по данным вакансии"""
+    parts = (update.message.text or "").split(maxsplit=1)
+    if len(parts) > 1 and parts[1].strip():
+        await fill_template(update, parts[1])
+        return
+    stored = await profile_store.get(update.effective_user.id) if profile_store else None
+    remaining = find_placeholders(stored.last_template) if stored and stored.last_template else []
+    if remaining:
+        await update.message.reply_text(
+            "Placeholders in your last template: " + ", ".join(remaining) + "\n\n" + FILL_USAGE_TEXT
+        )
+    else:
+        await update.message.reply_text(FILL_USAGE_TEXT)
+
+async def forget_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /forget: удаление сохранённого резюме и профиля"""
+    user_id = update.effective_user.id
+    deleted = profile_store is not None and await profile_store.delete(user_id)
+    if deleted:
+        logger.info(f"User {user_id} deleted the saved resume")
+        await update.message.reply_text("🗑 Your saved resume and profile have been deleted.")
+    else:
+        await update.message.reply_text("ℹ️ I don't have a saved resume for you.")
+
+@timed(HANDLER_SECONDS, handler="message")
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик текстовых сообщений"""
     user_message = update.message.text
@@ -409,12 +920,18 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     username = update.effective_user.username or "N/A"
     
+    # Строки "company=Acme" заполняют последний шаблон локально, без запроса к модели
+    if profile_store is not None and is_details_text(user_message):
+        await fill_template(update, user_message)
+        return
+    
     # Проверка rate limit
-    if not check_rate_limit(user_id):
+    if not await check_rate_limit(user_id):
         await update.message.reply_text(
             "⏳ Too many requests. Please wait a minute before your next request."
         )
         logger.info(f"Rate limit exceeded for user {user_id} (@{username})")
+        RATE_LIMITED.inc()
         return
     
     # Проверяем минимальную длину резюме
@@ -432,52 +949,23 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
+    # Описание вакансии от пользователя с сохранённым резюме - письмо под эту вакансию
+    source = "vacancy" if await is_vacancy_followup(user_id, user_message) else "message"
+    
     # Отправляем сообщение о обработке
-    processing_msg = await update.message.reply_text("⏳ Processing your resume and creating a template...")
+    processing_msg = await update.message.reply_text(PROCESSING_TEXT[source])
     
     try:
         # Валидация и санитизация резюме
         try:
-            sanitized_message = sanitize_resume_text(user_message)
+            sanitize = sanitize_vacancy_text if source == "vacancy" else sanitize_resume_text
+            sanitized_message = sanitize(user_message)
         except ValueError as e:
-            await processing_msg.edit_text(
-                f"❌ {str(e)}\n\n"
-                f"Please send a resume shorter than {MAX_RESUME_LENGTH} characters."
-            )
+            await processing_msg.edit_text(f"❌ {str(e)}\n\n{TOO_LONG_HINT[source]}")
             return
         
-        # Генерируем шаблон
-        cover_letter = await generate_cover_letter(sanitized_message, user_id=user_id, username=username)
-        
-        # Логируем успешную генерацию
-        logger.info(f"User {user_id} (@{username}) successfully generated cover letter")
-        
-        if cover_letter == "REGION_BLOCKED":
-            # Специальная обработка ошибки региона
-            await processing_msg.edit_text(
-                "❌ Unfortunately, the OpenAI API service is not available in your region.\n\n"
-                "This is a limitation from OpenAI. To resolve the issue:\n"
-                "• Use a VPN\n"
-                "• Contact the bot administrator\n\n"
-                "Sorry for the inconvenience."
-            )
-        elif cover_letter:
-            # Удаляем сообщение о обработке
-            await processing_msg.delete()
-            
-            # Отправляем результат
-            if len(cover_letter) <= 4096:
-                await update.message.reply_text(cover_letter)
-            else:
-                # Если текст слишком длинный, разбиваем на части
-                parts = [cover_letter[i:i+4096] for i in range(0, len(cover_letter), 4096)]
-                for part in parts:
-                    await update.message.reply_text(part)
-        else:
-            await processing_msg.edit_text(
-                "❌ An error occurred while generating the template. "
-                "Please try again or send the resume in a different format."
-            )
+        # Генерация выполняется в пуле обработчиков очереди заданий
+        await submit_generation_job(update, processing_msg, sanitized_message, source)
             
     except Exception as e:
         error_type = type(e).__name__
@@ -499,6 +987,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "❌ An error occurred. Please try again."
         )
 
+@timed(HANDLER_SECONDS, handler="document")
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик документов"""
     document = update.message.document
@@ -508,11 +997,12 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = update.effective_user.username or "N/A"
     
     # Проверка rate limit
-    if not check_rate_limit(user_id):
+    if not await check_rate_limit(user_id):
         await update.message.reply_text(
             "⏳ Too many requests. Please wait a minute before your next request."
         )
         logger.info(f"Rate limit exceeded for user {user_id} (@{username})")
+        RATE_LIMITED.inc()
         return
     
     # Проверяем тип файла
@@ -572,42 +1062,8 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        # Получаем информацию о пользователе
-        user_id = update.effective_user.id
-        username = update.effective_user.username or "N/A"
-        
-        # Генерируем шаблон
-        cover_letter = await generate_cover_letter(resume_text, user_id=user_id, username=username)
-        
-        # Логируем успешную генерацию
-        logger.info(f"User {user_id} (@{username}) successfully generated cover letter from file")
-        
-        if cover_letter == "REGION_BLOCKED":
-            # Специальная обработка ошибки региона
-            await processing_msg.edit_text(
-                "❌ Unfortunately, the OpenAI API service is not available in your region.\n\n"
-                "This is a limitation from OpenAI. To resolve the issue:\n"
-                "• Use a VPN\n"
-                "• Contact the bot administrator\n\n"
-                "Sorry for the inconvenience."
-            )
-        elif cover_letter:
-            # Удаляем сообщение о обработке
-            await processing_msg.delete()
-            
-            # Отправляем результат
-            if len(cover_letter) <= 4096:
-                await update.message.reply_text(cover_letter)
-            else:
-                # Если текст слишком длинный, разбиваем на части
-                parts = [cover_letter[i:i+4096] for i in range(0, len(cover_letter), 4096)]
-                for part in parts:
-                    await update.message.reply_text(part)
-        else:
-            await processing_msg.edit_text(
-                "❌ An error occurred while generating the template. "
-                "Please try sending the resume as text."
-            )
+        # Генерация выполняется в пуле обработчиков очереди заданий
+        await submit_generation_job(update, processing_msg, resume_text, "document")
             
     except Exception as e:
         error_type = type(e).__name__
@@ -650,17 +1106,121 @@ async def handle_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Use /help for detailed information."
     )
 
-def main():
-    """Основная функция запуска бота"""
+# Типы апдейтов, которые получает каждый вид обработчика
+HANDLER_UPDATE_TYPES = {
+    CommandHandler: [Update.MESSAGE],
+    MessageHandler: [Update.MESSAGE],
+    CallbackQueryHandler: [Update.CALLBACK_QUERY],
+    InlineQueryHandler: [Update.INLINE_QUERY],
+}
+
+def get_allowed_updates(application: Application) -> list:
+    """Список типов апдейтов, нужных зарегистрированным обработчикам"""
+    allowed = set()
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            update_types = HANDLER_UPDATE_TYPES.get(type(handler))
+            if update_types is None:
+                # Неизвестный обработчик - не сужаем список, чтобы ничего не потерять
+                return Update.ALL_TYPES
+            allowed.update(update_types)
+    return sorted(allowed)
+
+# HTTP-сервер метрик (запускается в post_init)
+metrics_runner = None
+openai_preload = None
+
+async def preload_dependencies():
+    """Клиенты OpenAI и промпт (с подсчётом токенов) загружаются в фоне до первой генерации"""
+    await asyncio.gather(openai_pool.preload(), asyncio.to_thread(prompt_template.current))
+
+async def post_init(application: Application):
+    """Запуск вспомогательных сервисов после инициализации бота"""
+    global metrics_runner, job_queue, job_workers, openai_preload, profile_store
+    # Бот начинает принимать апдейты, не дожидаясь импорта openai и tiktoken
+    openai_preload = asyncio.create_task(preload_dependencies())
+    if METRICS_PORT:
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    if JOB_WORKERS > 0:
+        job_queue = JobQueue(JOB_QUEUE_DB_PATH, lease_seconds=JOB_LEASE_SECONDS)
+        if JOB_RECLAIM_ON_START:
+            # Задания, взятые до перезапуска, выполняем сразу, не дожидаясь конца аренды
+            await job_queue.release_all()
+        pending = await job_queue.size()
+        if pending:
+            logger.info(f"В очереди {pending} незавершённых заданий - продолжаем их выполнение")
+        job_workers = JobWorkerPool(job_queue, run_generation_job, size=JOB_WORKERS)
+        job_workers.start()
+    if PROFILES_ENABLED:
+        profile_store = ProfileStore(
+            PROFILE_DB_PATH, max_entries=PROFILE_MAX_ENTRIES, ttl=PROFILE_TTL_SECONDS
+        )
+    openai_pool.start_health_checks()
+
+async def post_stop(application: Application):
+    """Остановка обработчиков заданий и отправка накопленных уведомлений,
+    пока бот ещё может слать сообщения"""
+    if job_workers:
+        # Прерванные задания остаются в очереди и будут выполнены после перезапуска
+        await job_workers.stop()
+    # Недостроенный профиль будет создан заново при следующей вакансии
+    for task in list(profile_builds.values()):
+        task.cancel()
+    await admin_notifier.close()
+
+async def post_shutdown(application: Application):
+    """Освобождение ресурсов при остановке бота"""
+    extraction_pool.shutdown()
+    await close_http_client()
+    await rate_limiter.close()
+    await openai_pool.close()
+    if job_queue:
+        await job_queue.close()
+    if profile_store:
+        await profile_store.close()
+    if metrics_runner:
+        await metrics_runner.cleanup()
+
+def build_application(base_url: str = None, base_file_url: str = None) -> Application:
+    """Создание приложения с зарегистрированными обработчиками
+    
+    base_url/base_file_url позволяют направить запросы к Bot API на другой сервер
+    (например, локальную заглушку в бенчмарках); по умолчанию - из конфигурации
+    """
     global application_instance
+    require_tokens('BOT_TOKEN')
     
     # Создаём приложение
-    application = Application.builder().token(BOT_TOKEN).build()
+    # concurrent_updates: без него PTB обрабатывает апдейты строго по одному,
+    # и генерации разных пользователей выстраиваются в очередь
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(TELEGRAM_CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        # Все исходящие запросы - через общую очередь с лимитами Telegram
+        .rate_limiter(SendScheduler(
+            global_rate=TELEGRAM_GLOBAL_RATE, chat_rate=TELEGRAM_CHAT_RATE, chat_burst=TELEGRAM_CHAT_BURST,
+            group_rate=TELEGRAM_GROUP_RATE_PER_MINUTE / 60, max_retries=TELEGRAM_SEND_RETRIES
+        ))
+    )
+    base_url = base_url or TELEGRAM_BASE_URL
+    base_file_url = base_file_url or TELEGRAM_BASE_FILE_URL
+    if base_url:
+        builder = builder.base_url(base_url)
+    if base_file_url:
+        builder = builder.base_file_url(base_file_url)
+    application = builder.build()
     application_instance = application
     
     # Регистрируем обработчики команд
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("vacancy", vacancy_command))
+    application.add_handler(CommandHandler("fill", fill_command))
+    application.add_handler(CommandHandler("forget", forget_command))
     
     # Регистрируем обработчики сообщений
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
@@ -670,20 +1230,42 @@ def main():
     # Обработчик для всех остальных типов сообщений
     application.add_handler(MessageHandler(filters.ALL, handle_unknown))
     
+    return application
+
+def main():
+    """Основная функция запуска бота"""
+    application = build_application()
+    
+    # Запрашиваем у Telegram только те апдейты, которые мы обрабатываем
+    allowed_updates = get_allowed_updates(application)
+    
     # Запускаем бота
-    logger.info("Бот запущен...")
+    logger.info(f"Бот запущен ({BOT_MODE}, апдейты: {', '.join(allowed_updates)})...")
+    logger.info(f"Подсчёт токенов: {estimator_name()}")
     try:
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if BOT_MODE == 'webhook':
+            asyncio.run(serve_webhook(
+                application,
+                url=WEBHOOK_URL,
+                path=WEBHOOK_PATH,
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                secret=WEBHOOK_SECRET,
+                allowed_updates=allowed_updates,
+                set_webhook=WEBHOOK_SET_ON_START
+            ))
+        else:
+            application.run_polling(allowed_updates=allowed_updates)
     except Exception as e:
         logger.critical(f"Критическая ошибка при запуске бота: {e}", exc_info=True)
         # Попытка отправить уведомление (если бот уже инициализирован)
         if application_instance:
-            import asyncio
             try:
                 asyncio.run(send_error_notification(
                     f"Critical bot startup error: {type(e).__name__}\n{str(e)}",
                     "",
-                    "CRITICAL: Bot Startup Failed"
+                    "CRITICAL: Bot Startup Failed",
+                    immediate=True
                 ))
             except:
                 pass
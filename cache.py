@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш сгенерированных шаблонов
+Двухуровневый: LRU в памяти + опциональный SQLite на диске
+"""
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений времени доступа к записям на диске копится до записи
+TOUCH_BATCH = 100
+
+
+def make_cache_key(*parts) -> str:
+    """Построение ключа кэша как SHA-256 от частей ключа"""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = str(part).encode('utf-8')
+        # Длина перед данными, чтобы ("ab", "c") и ("a", "bc") не совпадали
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class TieredCache:
+    """LRU-кэш в памяти с TTL и опциональным вторым уровнем в SQLite
+
+    Память используется только из event loop, обращения к SQLite
+    выполняются в потоках через asyncio.to_thread
+    """
+
+    def __init__(self, name: str, max_entries: int = 1000, ttl: float = 0,
+                 db_path: str = None, db_max_entries: int = 10000, table: str = "cache"):
+        self.name = name
+        # Несколько кэшей могут жить в одном файле SQLite, каждый в своей таблице
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_max_entries = db_max_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._touched = {}  # ключ -> время попадания, ещё не записанное на диск
+        self._db_lock = threading.Lock()
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                    "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Не удалось открыть SQLite кэш {db_path}: {e}")
+                self._db = None
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl) and now - created_at > self.ttl
+
+    async def get(self, key: str):
+        """Получение значения по ключу (None, если нет или истёк TTL)"""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            value, created_at = entry
+            if not self._expired(created_at, now):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._memory[key]
+
+        if self._db is not None:
+            # SQLite - в потоке, чтобы не блокировать event loop
+            row = await asyncio.to_thread(self._db_get, key, now)
+            if row is not None:
+                value, created_at = row
+                # Поднимаем запись в память, сохраняя исходное время создания
+                self._memory_put(key, value, created_at)
+                # Время доступа на диске обновляется пачкой при следующей записи
+                self._touched[key] = now
+                if len(self._touched) >= TOUCH_BATCH:
+                    await asyncio.to_thread(self._db_write, None, None, now, self._take_touched())
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        """Сохранение значения в кэш"""
+        now = time.time()
+        self._memory_put(key, value, now)
+        if self._db is not None:
+            await asyncio.to_thread(self._db_write, key, value, now, self._take_touched())
+
+    def _take_touched(self) -> dict:
+        touched, self._touched = self._touched, {}
+        return touched
+
+    def _memory_put(self, key: str, value: str, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _db_get(self, key: str, now: float):
+        """(значение, время создания) из SQLite; выполняется в потоке"""
+        with self._db_lock:
+            try:
+                row = self._db.execute(
+                    f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if self._expired(row[1], now):
+                    self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    self._db.commit()
+                    return None
+                return row
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка чтения SQLite кэша {self.name}: {e}")
+                return None
+
+    def _db_write(self, key, value, now: float, touched: dict):
+        """Запись значения (key=None - только времён доступа) одной транзакцией; выполняется в потоке"""
+        with self._db_lock:
+            try:
+                if touched:
+                    self._db.executemany(
+                        f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+                        [(accessed_at, touched_key) for touched_key, accessed_at in touched.items()]
+                    )
+                if key is not None:
+                    self._db.execute(
+                        f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, accessed_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (key, value, now, now)
+                    )
+                    self._db_evict(now)
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи в SQLite кэш {self.name}: {e}")
+
+    def _db_evict(self, now: float):
+        # Сначала истёкшие записи, затем самые давно использованные сверх лимита
+        if self.ttl:
+            self._db.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.ttl,))
+        self._db.execute(
+            f"DELETE FROM {self.table} WHERE key IN ("
+            f"SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.db_max_entries,)
+        )
+
+    def stats(self) -> dict:
+        """Счётчики попаданий и промахов"""
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'size': len(self._memory),
+        }
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Пул OpenAI-совместимых эндпоинтов (адрес API + ключ)
+Запрос уходит на наименее загруженный эндпоинт с учётом его задержки (EWMA);
+при ошибке соединения, таймауте, блокировке региона или исчерпании лимита
+эндпоинт временно исключается, а запрос повторяется на следующем.
+Фоновая проверка возвращает эндпоинты в работу после восстановления.
+Модуль openai импортируется, а клиенты создаются при первом запросе или
+в фоне после запуска (preload): импорт openai - самая долгая часть старта бота
+"""
+import time
+import asyncio
+import logging
+from urllib.parse import urlparse
+from governor import get_retry_after
+from metrics import OPENAI_ENDPOINT_REQUESTS, OPENAI_ENDPOINT_LATENCY, OPENAI_ENDPOINT_UP
+
+logger = logging.getLogger(__name__)
+
+# Максимальное время исключения эндпоинта после серии ошибок
+MAX_COOLDOWN = 600.0
+
+
+def is_region_blocked(error: Exception) -> bool:
+    """Ошибка OpenAI о недоступности API в регионе"""
+    message = str(error).lower()
+    return (
+        "unsupported_country" in message or
+        "country, region, or territory not supported" in message or
+        "unsupported_country_region_territory" in message
+    )
+
+
+def parse_endpoints(spec: str, default_key: str, default_url: str = '') -> list:
+    """Список (base_url, api_key) из строки "url|ключ,url|ключ"
+
+    Пустой url - адрес по умолчанию, пустой ключ - default_key.
+    Пустая строка - один эндпоинт (default_url, default_key)
+    """
+    endpoints = []
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        base_url, _, api_key = entry.partition('|')
+        endpoints.append((base_url.strip() or default_url, api_key.strip() or default_key))
+    return endpoints or [(default_url, default_key)]
+
+
+class Endpoint:
+    """Клиент одного эндпоинта и его состояние"""
+
+    __slots__ = ('name', 'options', '_client', 'in_flight', 'latency', 'samples', 'failures',
+                 'down_until', 'last_error')
+
+    def __init__(self, name: str, options: dict, initial_latency: float):
+        self.name = name
+        self.options = options  # аргументы AsyncOpenAI
+        self._client = None
+        self.in_flight = 0
+        self.latency = initial_latency  # EWMA длительности запроса, секунд
+        self.samples = 0
+        self.failures = 0  # ошибок подряд
+        self.down_until = 0.0
+        self.last_error = None
+
+    @property
+    def client(self):
+        """AsyncOpenAI эндпоинта, создаётся при первом обращении"""
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(**self.options)
+        return self._client
+
+    def available(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def score(self) -> float:
+        # Ожидаемое время обслуживания с учётом запросов, уже идущих через эндпоинт
+        return (self.in_flight + 1) * self.latency
+
+
+class ClientPool:
+    """Маршрутизация запросов по эндпоинтам с переключением при сбоях"""
+
+    def __init__(self, endpoints: list, timeout: float, cooldown: float = 30.0,
+                 health_check_interval: float = 30.0, ewma_alpha: float = 0.2, initial_latency: float = 5.0):
+        self.cooldown = cooldown
+        self.health_check_interval = health_check_interval
+        self.ewma_alpha = ewma_alpha
+        self.endpoints = []
+        for index, (base_url, api_key) in enumerate(endpoints):
+            options = dict(
+                api_key=api_key, base_url=base_url or None, timeout=timeout,
+                # С несколькими эндпоинтами быстрее переключиться, чем повторять запрос на том же
+                **({'max_retries': 0} if len(endpoints) > 1 else {})
+            )
+            name = f"{index}:{urlparse(base_url).netloc or 'api.openai.com'}"
+            self.endpoints.append(Endpoint(name, options, initial_latency))
+            OPENAI_ENDPOINT_UP.set(1, endpoint=name)
+        self._health_task = None
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    async def preload(self):
+        """Импорт openai и создание клиентов в фоновом потоке, чтобы первый запрос не ждал их"""
+        await asyncio.to_thread(lambda: [endpoint.client for endpoint in self.endpoints])
+
+    def pick(self, exclude=()) -> Endpoint:
+        """Доступный эндпоинт с наименьшей ожидаемой задержкой
+
+        Если все исключены после ошибок, берём тот, что должен восстановиться раньше
+        """
+        now = time.monotonic()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        available = [endpoint for endpoint in candidates if endpoint.available(now)]
+        if available:
+            return min(available, key=Endpoint.score)
+        return min(candidates, key=lambda endpoint: endpoint.down_until)
+
+    async def call(self, request):
+        """Выполнение request(client) с переключением на другой эндпоинт при сбое
+
+        Каждый эндпоинт пробуется не больше одного раза; если подходящих
+        не осталось, исключение пробрасывается вызывающему коду
+        """
+        from openai import APIError
+
+        tried = []
+        while True:
+            endpoint = self.pick(tried)
+            tried.append(endpoint)
+            endpoint.in_flight += 1
+            started = time.monotonic()
+            try:
+                result = await request(endpoint.client)
+            except APIError as e:
+                delay = self._failure_cooldown(endpoint, e)
+                if delay is None:
+                    OPENAI_ENDPOINT_REQUESTS.inc(endpoint=endpoint.name, result="error")
+                    raise
+                self._mark_down(endpoint, delay, e)
+                if len(tried) >= len(self.endpoints):
+                    OPENAI_ENDPOINT_REQUESTS.inc(endpoint=endpoint.name, result="error")
+                    raise
+                OPENAI_ENDPOINT_REQUESTS.inc(endpoint=endpoint.name, result="failover")
+                logger.warning(f"Эндпоинт {endpoint.name} недоступен ({type(e).__name__}), переключение")
+            else:
+                self._mark_up(endpoint, time.monotonic() - started)
+                OPENAI_ENDPOINT_REQUESTS.inc(endpoint=endpoint.name, result="success")
+                return result
+            finally:
+                endpoint.in_flight -= 1
+
+    def _failure_cooldown(self, endpoint: Endpoint, error):
+        """Время исключения эндпоинта после ошибки (None - ошибка не связана с эндпоинтом)"""
+        from openai import (
+            APIConnectionError, InternalServerError, AuthenticationError, PermissionDeniedError, RateLimitError
+        )
+
+        if isinstance(error, RateLimitError):
+            # Лимит этого ключа: ждём столько, сколько просит OpenAI
+            retry_after = get_retry_after(error)
+            return retry_after if retry_after is not None else self.cooldown
+        if isinstance(error, (APIConnectionError, InternalServerError, AuthenticationError,
+                              PermissionDeniedError)) or is_region_blocked(error):
+            # Повторные сбои подряд - экспоненциально дольше
+            return min(MAX_COOLDOWN, self.cooldown * 2 ** endpoint.failures)
+        return None
+
+    def _mark_down(self, endpoint: Endpoint, delay: float, error: Exception):
+        from openai import RateLimitError
+
+        now = time.monotonic()
+        # Параллельные запросы, упавшие на одном сбое, не удлиняют исключение многократно
+        if not isinstance(error, RateLimitError) and endpoint.available(now):
+            endpoint.failures += 1
+        endpoint.down_until = max(endpoint.down_until, now + delay)
+        endpoint.last_error = f"{type(error).__name__}: {error}"
+        OPENAI_ENDPOINT_UP.set(0, endpoint=endpoint.name)
+
+    def _mark_up(self, endpoint: Endpoint, latency: float = None):
+        if latency is not None:
+            # Первое измерение заменяет начальную оценку целиком
+            alpha = self.ewma_alpha if endpoint.samples else 1.0
+            endpoint.latency += alpha * (latency - endpoint.latency)
+            endpoint.samples += 1
+            OPENAI_ENDPOINT_LATENCY.set(round(endpoint.latency, 3), endpoint=endpoint.name)
+        if endpoint.failures:
+            logger.info(f"Эндпоинт {endpoint.name} снова доступен")
+        endpoint.failures = 0
+        endpoint.down_until = 0.0
+        endpoint.last_error = None
+        OPENAI_ENDPOINT_UP.set(1, endpoint=endpoint.name)
+
+    async def check(self, endpoint: Endpoint):
+        """Проверка эндпоинта лёгким запросом списка моделей"""
+        if endpoint.down_until and not endpoint.failures:
+            # Исключён из-за лимита запросов - вернётся сам по истечении Retry-After
+            return
+        from openai import APIError, RateLimitError
+
+        try:
+            await endpoint.client.with_options(max_retries=0, timeout=10.0).models.list()
+        except APIError as e:
+            if isinstance(e, RateLimitError) or self._failure_cooldown(endpoint, e) is None:
+                # Эндпоинт отвечает - лимит или ошибка запроса не признак сбоя
+                return
+            self._mark_down(endpoint, min(MAX_COOLDOWN, self.cooldown * 2 ** endpoint.failures), e)
+            logger.warning(f"Проверка эндпоинта {endpoint.name} не прошла: {endpoint.last_error}")
+        else:
+            if endpoint.failures:
+                self._mark_up(endpoint)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await asyncio.gather(*(self.check(endpoint) for endpoint in self.endpoints))
+
+    def start_health_checks(self):
+        """Периодическая проверка эндпоинтов (только если их больше одного)"""
+        if len(self.endpoints) > 1 and self.health_check_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        for endpoint in self.endpoints:
+            # Клиент, который так и не понадобился, не создаём ради закрытия
+            if endpoint._client is not None:
+                await endpoint._client.close()
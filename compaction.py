@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Нормализация текста резюме перед запросом к модели
+Детерминированный конвейер убирает артефакты извлечения из PDF/DOCX
+(колонтитулы, номера страниц, переносы, лишние пробелы) и ограничивает
+длину текста по токенам, а не по символам
+"""
+import re
+import unicodedata
+from collections import Counter
+from tokens import estimate_tokens
+
+# Разделитель страниц в тексте, извлечённом из PDF
+PAGE_BREAK = '\f'
+
+# Сколько строк в начале и в конце страницы считаются колонтитулами
+EDGE_LINES = 2
+
+_ZERO_WIDTH_RE = re.compile('[\u200b\u200c\u200d\u2060\ufeff\u00ad]')
+_CONTROL_RE = re.compile('[\x00-\x08\x0b\x0e-\x1f\x7f]')
+_SPACES_RE = re.compile(r'[ \t\r\v]+')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+# Перенос слова по слогам в конце строки: "experi-\nence" -> "experience"
+_HYPHENATION_RE = re.compile(r'(?<=[a-zа-яё])-\n(?=[a-zа-яё])')
+# Маркеры списков (символы из шрифтов Symbol/Wingdings приходят как U+F0xx)
+_BULLET_RE = re.compile(
+    '^(?:[\u2022\u25cf\u25cb\u25e6\u25aa\u25ab\u25a0\u25a1\u25ba\u25b8\u2023\u2043\u2219\u00b7\u27a2\u27a4\u2713\u2714'
+    '\uf0a7\uf0b7\uf0d8\uf0fc]+\\s*|[-*\u2013\u2014]+\\s+)(?=\\S)'
+)
+_PAGE_NUMBER_RE = re.compile(
+    r'^(?:(?:page|стр\.?|страница)\s*\d+(?:\s*(?:of|/|из)\s*\d+)?'
+    r'|\d{1,3}\s*(?:of|/|из)\s*\d{1,3}'
+    r'|[-\u2013\u2014]\s*\d+\s*[-\u2013\u2014])$',
+    re.IGNORECASE
+)
+_DIGITS_RE = re.compile(r'\d+')
+
+
+class CompactionResult:
+    """Нормализованный текст и его размер в токенах до и после"""
+
+    __slots__ = ('text', 'original_tokens', 'tokens', 'truncated')
+
+    def __init__(self, text: str, original_tokens: int, tokens: int, truncated: bool):
+        self.text = text
+        self.original_tokens = original_tokens
+        self.tokens = tokens
+        self.truncated = truncated
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.original_tokens - self.tokens)
+
+
+def normalize_characters(text: str) -> str:
+    """NFKC (лигатуры, неразрывные пробелы), без невидимых и управляющих символов"""
+    text = unicodedata.normalize('NFKC', text)
+    text = _ZERO_WIDTH_RE.sub('', text)
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return _CONTROL_RE.sub('', text)
+
+
+def _edge_indexes(lines: list) -> list:
+    """Индексы первых и последних непустых строк страницы"""
+    filled = [index for index, line in enumerate(lines) if line.strip()]
+    return sorted(set(filled[:EDGE_LINES] + filled[-EDGE_LINES:]))
+
+
+def remove_page_artifacts(text: str) -> str:
+    """Удаление колонтитулов, повторяющихся на разных страницах, и номеров страниц"""
+    pages = [page.split('\n') for page in text.split(PAGE_BREAK)]
+    repeated = set()
+    if len(pages) > 1:
+        # Колонтитул - строка у края страницы, повторяющаяся (с точностью до цифр)
+        # хотя бы на двух страницах и на половине всех страниц
+        seen = Counter()
+        for lines in pages:
+            seen.update({_DIGITS_RE.sub('#', lines[i].strip().lower()) for i in _edge_indexes(lines)})
+        threshold = max(2, len(pages) / 2)
+        repeated = {key for key, count in seen.items() if count >= threshold}
+
+    result = []
+    kept = set()
+    for lines in pages:
+        edges = set(_edge_indexes(lines))
+        for index, line in enumerate(lines):
+            stripped = line.strip()
+            if _PAGE_NUMBER_RE.match(stripped):
+                continue
+            if index in edges:
+                if stripped.isdigit() and len(stripped) <= 3:
+                    continue
+                key = _DIGITS_RE.sub('#', stripped.lower())
+                if key in repeated:
+                    # Первое появление оставляем: в колонтитуле часто имя кандидата
+                    if key in kept:
+                        continue
+                    kept.add(key)
+            result.append(line)
+    return '\n'.join(result)
+
+
+def normalize_lines(text: str) -> str:
+    """Пробелы, переносы слов, маркеры списков и подряд идущие одинаковые строки"""
+    text = _HYPHENATION_RE.sub('', text)
+    lines = []
+    previous = None
+    for line in text.split('\n'):
+        line = _SPACES_RE.sub(' ', line).strip()
+        line = _BULLET_RE.sub('- ', line)
+        if line and line == previous:
+            # Текст, наложенный сам на себя в PDF, извлекается дважды
+            continue
+        lines.append(line)
+        previous = line
+    return _BLANK_LINES_RE.sub('\n\n', '\n'.join(lines)).strip()
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    """Обрезка по границе строки так, чтобы текст уложился в max_tokens"""
+    tokens = estimate_tokens(text, model)
+    while tokens > max_tokens and text:
+        # Длину подбираем по среднему числу символов на токен, с небольшим запасом
+        limit = int(len(text) * max_tokens / tokens * 0.97)
+        cut = text.rfind('\n', 0, limit)
+        text = text[:cut if cut > 0 else limit].rstrip()
+        tokens = estimate_tokens(text, model)
+    return text
+
+
+def compact_resume(text: str, max_tokens: int = None, model: str = 'gpt-4o-mini') -> CompactionResult:
+    """Полный конвейер нормализации с подсчётом сэкономленных токенов"""
+    original_tokens = estimate_tokens(text, model)
+    compacted = normalize_lines(remove_page_artifacts(normalize_characters(text)))
+    tokens = estimate_tokens(compacted, model)
+    truncated = bool(max_tokens) and tokens > max_tokens
+    if truncated:
+        compacted = truncate_to_tokens(compacted, max_tokens, model)
+        tokens = estimate_tokens(compacted, model)
+    return CompactionResult(compacted, original_tokens, tokens, truncated)
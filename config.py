@@ -22,26 +22,162 @@ if not BOT_TOKEN or not CHATGPT_TOKEN:
     except ImportError:
         pass
 
-# Валидация обязательных токенов
-if not BOT_TOKEN or not CHATGPT_TOKEN:
-    raise ValueError(
-        "BOT_TOKEN и CHATGPT_TOKEN должны быть установлены в переменных окружения "
-        "или в файле secrets.py"
-    )
+
+def require_tokens(*names: str):
+    """Валидация обязательных токенов (пакетному режиму BOT_TOKEN не нужен)"""
+    missing = [name for name in names if not globals().get(name)]
+    if missing:
+        raise ValueError(
+            f"{' и '.join(missing)} должны быть установлены в переменных окружения "
+            "или в файле secrets.py"
+        )
 
 # Bot Settings
 ADMIN_ID = int(os.getenv('ADMIN_ID', '292730940'))
+# Повторы одной ошибки за окно объединяются в сводку для администратора
+ADMIN_NOTIFY_WINDOW = float(os.getenv('ADMIN_NOTIFY_WINDOW', '60.0'))  # секунд
+ADMIN_NOTIFY_BURST = int(os.getenv('ADMIN_NOTIFY_BURST', '5'))  # отдельных уведомлений за окно
 OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
 OPENAI_TEMPERATURE = float(os.getenv('OPENAI_TEMPERATURE', '0.7'))
 OPENAI_MAX_TOKENS = int(os.getenv('OPENAI_MAX_TOKENS', '1000'))
 OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '30.0'))
+# OpenAI-совместимый адрес API (прокси, локальная заглушка); пусто - api.openai.com
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', '')
+# Пул эндпоинтов: "url|ключ" через запятую (пустой url - OPENAI_BASE_URL, пустой ключ -
+# CHATGPT_TOKEN); запросы распределяются между ними с переключением при сбоях.
+# Пусто - один эндпоинт из OPENAI_BASE_URL и CHATGPT_TOKEN
+OPENAI_ENDPOINTS = os.getenv('OPENAI_ENDPOINTS', '')
+OPENAI_ENDPOINT_COOLDOWN = float(os.getenv('OPENAI_ENDPOINT_COOLDOWN', '30.0'))  # исключение после сбоя, секунд
+OPENAI_HEALTH_CHECK_INTERVAL = float(os.getenv('OPENAI_HEALTH_CHECK_INTERVAL', '30.0'))  # секунд
+
+# Prompt
+# Путь к файлу промпта (по умолчанию - рядом с кодом, а не в текущей папке)
+PROMPT_PATH = os.getenv('PROMPT_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'promt.txt'))
+# Как часто проверять изменение файла промпта (перезагрузка без перезапуска бота)
+PROMPT_RELOAD_INTERVAL = float(os.getenv('PROMPT_RELOAD_INTERVAL', '5.0'))  # секунд
+
+# Hedging
+# Запрос без ответа дольше квантиля недавних задержек дублируется (для потока -
+# по времени до первого токена); берётся первый ответ, второй запрос отменяется
+OPENAI_HEDGE_QUANTILE = float(os.getenv('OPENAI_HEDGE_QUANTILE', '0.95'))
+# Максимальная доля продублированных запросов (0 - не дублировать)
+OPENAI_HEDGE_MAX_FRACTION = float(os.getenv('OPENAI_HEDGE_MAX_FRACTION', '0.1'))
+# Сколько измерений нужно, прежде чем дублировать запросы и менять таймаут
+OPENAI_HEDGE_MIN_SAMPLES = int(os.getenv('OPENAI_HEDGE_MIN_SAMPLES', '20'))
+# Таймаут попытки по наблюдаемой задержке (3 x p99, от OPENAI_MIN_TIMEOUT до OPENAI_TIMEOUT)
+OPENAI_ADAPTIVE_TIMEOUT = os.getenv('OPENAI_ADAPTIVE_TIMEOUT', 'true').lower() in ('1', 'true', 'yes')
+OPENAI_MIN_TIMEOUT = float(os.getenv('OPENAI_MIN_TIMEOUT', '5.0'))
+
+# Streaming
+# Показывать текст шаблона по мере генерации, редактируя сообщение "Processing..."
+OPENAI_STREAMING = os.getenv('OPENAI_STREAMING', 'true').lower() in ('1', 'true', 'yes')
+# Минимальный интервал между правками сообщения (лимиты Telegram на edit)
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.5'))
+
+# Metrics
+# Локальный эндпоинт /metrics в формате Prometheus (METRICS_PORT=0 - отключить)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9090'))
+
+# Update Delivery
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()  # polling или webhook
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # публичный https-адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+# Устанавливать webhook при старте (при нескольких репликах можно оставить только на одной)
+WEBHOOK_SET_ON_START = os.getenv('WEBHOOK_SET_ON_START', 'true').lower() in ('1', 'true', 'yes')
+
+# Другой сервер Bot API (например, локальный telegram-bot-api); пусто - api.telegram.org
+TELEGRAM_BASE_URL = os.getenv('TELEGRAM_BASE_URL', '')
+TELEGRAM_BASE_FILE_URL = os.getenv('TELEGRAM_BASE_FILE_URL', '')
+
+if BOT_MODE == 'webhook' and (not WEBHOOK_URL or not WEBHOOK_SECRET):
+    raise ValueError("Для BOT_MODE=webhook необходимо задать WEBHOOK_URL и WEBHOOK_SECRET")
+
+# Concurrency
+# Максимальное число одновременных запросов к OpenAI (остальные ждут в очереди)
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '8'))
+# Лимиты аккаунта OpenAI: при их исчерпании запросы ждут в очереди, а не падают.
+# Параллельность и лимиты заданы на один эндпоинт пула и умножаются на их число
+OPENAI_TPM_LIMIT = int(os.getenv('OPENAI_TPM_LIMIT', '200000'))  # токенов в минуту
+OPENAI_RPM_LIMIT = int(os.getenv('OPENAI_RPM_LIMIT', '500'))  # запросов в минуту
+OPENAI_RATE_LIMIT_RETRIES = int(os.getenv('OPENAI_RATE_LIMIT_RETRIES', '5'))
+OPENAI_BACKOFF_BASE = float(os.getenv('OPENAI_BACKOFF_BASE', '1.0'))
+OPENAI_BACKOFF_MAX = float(os.getenv('OPENAI_BACKOFF_MAX', '60.0'))
+# Сколько Telegram-апдейтов обрабатывается параллельно
+TELEGRAM_CONCURRENT_UPDATES = int(os.getenv('TELEGRAM_CONCURRENT_UPDATES', '64'))
+
+# Telegram Send Limits
+# Исходящие сообщения и правки проходят через очередь с лимитами Telegram:
+# общий (сообщений в секунду), на личный чат (в секунду, с пачкой до BURST)
+# и на группу (в минуту); при RetryAfter запрос повторяется до SEND_RETRIES раз
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1.0'))
+TELEGRAM_CHAT_BURST = int(os.getenv('TELEGRAM_CHAT_BURST', '3'))
+TELEGRAM_GROUP_RATE_PER_MINUTE = float(os.getenv('TELEGRAM_GROUP_RATE_PER_MINUTE', '20'))
+TELEGRAM_SEND_RETRIES = int(os.getenv('TELEGRAM_SEND_RETRIES', '3'))
+
+# Job Queue
+# Генерации выполняются пулом из JOB_WORKERS обработчиков по заданиям из SQLite
+# и переживают перезапуск бота (0 - генерация прямо в обработчике апдейта)
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '16'))
+JOB_QUEUE_DB_PATH = os.getenv('JOB_QUEUE_DB_PATH', 'jobs.db')
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '120.0'))  # аренда задания обработчиком
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# Сразу подхватывать задания, взятые до перезапуска (отключить, если очередь общая
+# для нескольких процессов - тогда они освобождаются по истечении аренды)
+JOB_RECLAIM_ON_START = os.getenv('JOB_RECLAIM_ON_START', 'true').lower() in ('1', 'true', 'yes')
 
 # File Limits
 MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', str(10 * 1024 * 1024)))  # 10MB
-MAX_RESUME_LENGTH = int(os.getenv('MAX_RESUME_LENGTH', '50000'))  # 50KB
+# Грубый предварительный фильтр по символам (защита от мегабайтных текстов); размер
+# резюме в запросе определяет MAX_RESUME_TOKENS, поэтому лимит с большим запасом выше него
+MAX_RESUME_LENGTH = int(os.getenv('MAX_RESUME_LENGTH', '200000'))
 MAX_PDF_PAGES = int(os.getenv('MAX_PDF_PAGES', '50'))
 MIN_RESUME_LENGTH = int(os.getenv('MIN_RESUME_LENGTH', '50'))
+# Нормализация текста резюме перед запросом (колонтитулы, пробелы, маркеры списков)
+RESUME_COMPACTION = os.getenv('RESUME_COMPACTION', 'true').lower() in ('1', 'true', 'yes')
+# Максимум токенов резюме в запросе; более длинный текст обрезается по границе строки.
+# Токены считаются tiktoken, без него - приближённо (~4 байта UTF-8 на токен)
+MAX_RESUME_TOKENS = int(os.getenv('MAX_RESUME_TOKENS', '6000'))
+
+# Файлы до этого размера скачиваются в память, более крупные - во временный файл
+DOWNLOAD_MEMORY_LIMIT = int(os.getenv('DOWNLOAD_MEMORY_LIMIT', str(1024 * 1024)))  # 1MB
+
+# File Extraction
+# Число процессов для разбора PDF/DOCX (0 - разбор в потоке основного процесса)
+EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', '2'))
+EXTRACTION_TIMEOUT = float(os.getenv('EXTRACTION_TIMEOUT', '20.0'))  # секунд на файл
+# Потоковый разбор word/document.xml вместо python-docx (с fallback на python-docx)
+DOCX_FAST_EXTRACTOR = os.getenv('DOCX_FAST_EXTRACTOR', 'true').lower() in ('1', 'true', 'yes')
+
+# Cover Letter Cache
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1000'))
+CACHE_TTL_SECONDS = int(os.getenv('CACHE_TTL_SECONDS', str(7 * 24 * 3600)))  # 7 дней
+CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', '')  # пусто - только кэш в памяти
+CACHE_DB_MAX_ENTRIES = int(os.getenv('CACHE_DB_MAX_ENTRIES', '10000'))
+# Кэш текста документов по file_unique_id (на диске - в той же базе CACHE_DB_PATH)
+FILE_TEXT_CACHE_ENABLED = os.getenv('FILE_TEXT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+FILE_TEXT_CACHE_MAX_ENTRIES = int(os.getenv('FILE_TEXT_CACHE_MAX_ENTRIES', '500'))
+FILE_TEXT_CACHE_TTL_SECONDS = int(os.getenv('FILE_TEXT_CACHE_TTL_SECONDS', str(24 * 3600)))  # 1 день
+
+# User Profiles
+# После шаблона резюме пользователя сохраняется, и описание вакансии в следующем
+# сообщении (или /vacancy) превращается в письмо под вакансию по краткому профилю
+PROFILES_ENABLED = os.getenv('PROFILES_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+PROFILE_DB_PATH = os.getenv('PROFILE_DB_PATH', 'profiles.db')
+PROFILE_MAX_ENTRIES = int(os.getenv('PROFILE_MAX_ENTRIES', '10000'))
+PROFILE_TTL_SECONDS = int(os.getenv('PROFILE_TTL_SECONDS', str(30 * 24 * 3600)))  # 30 дней
+PROFILE_MAX_TOKENS = int(os.getenv('PROFILE_MAX_TOKENS', '400'))  # размер краткого профиля
+MAX_VACANCY_TOKENS = int(os.getenv('MAX_VACANCY_TOKENS', '2000'))  # описание вакансии в запросе
 
 # Rate Limiting
 MAX_REQUESTS_PER_MINUTE = int(os.getenv('MAX_REQUESTS_PER_MINUTE', '5'))
+# memory - в памяти процесса; sqlite/redis - общий лимит для нескольких процессов бота
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()
+RATE_LIMIT_DB_PATH = os.getenv('RATE_LIMIT_DB_PATH', 'rate_limit.db')
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
 
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Потоковая загрузка файлов из Telegram с ограничением размера
+Файл пишется в буфер в памяти, а после порога - во временный файл на диске
+"""
+import io
+import mmap
+import asyncio
+import logging
+import tempfile
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Общий HTTP-клиент для скачивания файлов (создаётся при первой загрузке)
+_http_client = None
+
+
+class FileTooLargeError(Exception):
+    """Файл превышает допустимый размер"""
+
+    def __init__(self, size: int):
+        super().__init__(size)
+        self.size = size
+
+    def __str__(self):
+        return f"File too large: more than {self.size} bytes"
+
+
+class DownloadBuffer:
+    """Буфер загрузки: в памяти до memory_limit байт, дальше - во временном файле"""
+
+    def __init__(self, memory_limit: int = 1024 * 1024):
+        self.memory_limit = memory_limit
+        self.size = 0
+        self.on_disk = False
+        self._file = io.BytesIO()
+
+    def write(self, chunk: bytes):
+        if not self.on_disk and self.size + len(chunk) > self.memory_limit:
+            # Переносим уже скачанное на диск и дальше пишем туда
+            disk_file = tempfile.TemporaryFile()
+            disk_file.write(self._file.getbuffer())
+            self._file.close()
+            self._file = disk_file
+            self.on_disk = True
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def fileobj(self):
+        """Файловый объект с содержимым (для разбора в текущем процессе)"""
+        self._file.seek(0)
+        return self._file
+
+    @contextmanager
+    def view(self):
+        """memoryview содержимого без копирования (mmap для файла на диске)"""
+        if not self.size:
+            yield memoryview(b"")
+        elif self.on_disk:
+            self._file.flush()
+            with mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    yield view
+                finally:
+                    view.release()
+        else:
+            view = self._file.getbuffer()
+            try:
+                yield view
+            finally:
+                view.release()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _get_http_client(timeout: float) -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=timeout, follow_redirects=True)
+    return _http_client
+
+
+async def close_http_client():
+    """Закрытие общего HTTP-клиента"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _copy_local_file(path: str, buffer: DownloadBuffer, max_size: int):
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            buffer.write(chunk)
+            if buffer.size > max_size:
+                raise FileTooLargeError(max_size)
+
+
+async def download_file(file_obj, max_size: int, memory_limit: int, timeout: float = 60.0) -> DownloadBuffer:
+    """Скачивание telegram.File в DownloadBuffer
+
+    Загрузка прерывается с FileTooLargeError, как только получено больше max_size байт
+    """
+    buffer = DownloadBuffer(memory_limit)
+    try:
+        path = file_obj.file_path
+        if urlsplit(path).scheme not in ('http', 'https'):
+            # Локальный Bot API сервер отдаёт путь к файлу на диске; чтение - в потоке
+            await asyncio.to_thread(_copy_local_file, path, buffer, max_size)
+            return buffer
+
+        client = _get_http_client(timeout)
+        try:
+            async with client.stream('GET', path) as response:
+                response.raise_for_status()
+                content_length = response.headers.get('content-length')
+                if content_length and content_length.isdigit() and int(content_length) > max_size:
+                    raise FileTooLargeError(max_size)
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    buffer.write(chunk)
+                    if buffer.size > max_size:
+                        raise FileTooLargeError(max_size)
+        except httpx.HTTPError as e:
+            # URL файла содержит токен бота - не пропускаем его в логи и уведомления
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            raise RuntimeError(
+                f"File download failed: {type(e).__name__}" + (f" ({status})" if status else "")
+            ) from None
+        return buffer
+    except BaseException:
+        buffer.close()
+        raise
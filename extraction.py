@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Извлечение текста из файлов резюме
+Разбор PDF/DOCX выполняется в отдельных процессах с ограничением по времени
+"""
+import io
+import asyncio
+import logging
+import zipfile
+import importlib.util
+import multiprocessing
+from xml.etree.ElementTree import iterparse, ParseError
+from config import MAX_PDF_PAGES, MAX_RESUME_LENGTH, DOCX_FAST_EXTRACTOR
+from compaction import PAGE_BREAK
+
+logger = logging.getLogger(__name__)
+
+# Библиотеки разбора PDF/DOCX импортируются при первом файле такого формата:
+# их импорт заметно замедляет запуск бота, здесь только проверяем наличие
+PDF_SUPPORT = importlib.util.find_spec('PyPDF2') is not None
+if not PDF_SUPPORT:
+    logger.warning("PyPDF2 не установлен. Поддержка PDF файлов будет ограничена.")
+
+DOCX_SUPPORT = importlib.util.find_spec('docx') is not None
+if not DOCX_SUPPORT:
+    logger.warning("python-docx не установлен. Поддержка DOCX файлов будет ограничена.")
+
+
+class PdfTooLargeError(Exception):
+    """PDF содержит больше MAX_PDF_PAGES страниц"""
+
+    def __init__(self, num_pages: int):
+        # num_pages передаётся в args, чтобы исключение пережило pickle между процессами
+        super().__init__(num_pages)
+        self.num_pages = num_pages
+
+    def __str__(self):
+        return f"PDF too large: {self.num_pages} pages"
+
+
+class ExtractionTimeoutError(Exception):
+    """Разбор файла не уложился в отведённое время"""
+
+
+def iter_pdf_pages(pdf_reader, max_pages: int):
+    """Ленивое извлечение текста страниц PDF по одной"""
+    for page_number in range(min(len(pdf_reader.pages), max_pages)):
+        yield pdf_reader.pages[page_number].extract_text() or ""
+
+
+def extract_pdf_text(stream, max_chars: int = None) -> str:
+    """Извлечение текста из PDF
+
+    Разбор останавливается, как только текста набралось больше max_chars:
+    такое резюме всё равно будет отклонено по длине, остальные страницы не нужны
+    """
+    import PyPDF2
+
+    pdf_reader = PyPDF2.PdfReader(stream)
+
+    # Проверка количества страниц
+    num_pages = len(pdf_reader.pages)
+    if num_pages > MAX_PDF_PAGES:
+        raise PdfTooLargeError(num_pages)
+
+    parts = []
+    total = 0
+    for page_text in iter_pdf_pages(pdf_reader, MAX_PDF_PAGES):
+        parts.append(page_text)
+        total += len(page_text) + 1
+        # Пробелы по краям будут обрезаны, поэтому при превышении проверяем точную длину
+        if max_chars and total > max_chars and len(PAGE_BREAK.join(parts).strip()) > max_chars:
+            logger.info(f"PDF: текст превысил {max_chars} символов после {len(parts)} из {num_pages} страниц")
+            break
+    # Страницы разделяются \f, чтобы при нормализации можно было найти колонтитулы
+    return PAGE_BREAK.join(parts)
+
+
+# Пространства имён WordprocessingML и markup compatibility
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+
+
+def extract_docx_text_fast(stream, max_chars: int = None) -> str:
+    """Потоковое извлечение текста из word/document.xml без построения модели документа
+
+    Учитывает абзацы в таблицах и текстовых полях; разбор останавливается,
+    как только текст превысил max_chars.
+    """
+    lines = []
+    total = 0
+    paragraphs = []  # стек буферов: абзац может содержать текстовое поле со своими абзацами
+    fallback_depth = 0  # содержимое mc:Fallback дублирует mc:Choice - пропускаем его
+    props_depth = 0  # w:pPr (позиции табуляции w:tabs и т.п.) текста не содержит
+    run_depth = 0  # w:tab и w:br - символы текста только внутри w:r
+    with zipfile.ZipFile(stream) as archive:
+        with archive.open('word/document.xml') as xml_file:
+            for event, elem in iterparse(xml_file, events=('start', 'end')):
+                tag = elem.tag
+                if event == 'start':
+                    if tag == MC_FALLBACK:
+                        fallback_depth += 1
+                    elif tag == W_NS + 'pPr':
+                        props_depth += 1
+                    elif tag == W_NS + 'r':
+                        run_depth += 1
+                    elif tag == W_NS + 'p' and not fallback_depth:
+                        paragraphs.append([])
+                    continue
+
+                if tag == MC_FALLBACK:
+                    fallback_depth -= 1
+                elif tag == W_NS + 'pPr':
+                    props_depth -= 1
+                elif tag == W_NS + 'r':
+                    run_depth -= 1
+                elif fallback_depth or props_depth or not paragraphs:
+                    pass
+                elif tag == W_NS + 't':
+                    paragraphs[-1].append(elem.text or '')
+                elif tag == W_NS + 'tab' and run_depth:
+                    paragraphs[-1].append('\t')
+                elif tag in (W_NS + 'br', W_NS + 'cr') and run_depth:
+                    paragraphs[-1].append('\n')
+                elif tag == W_NS + 'p':
+                    line = ''.join(paragraphs.pop())
+                    lines.append(line)
+                    total += len(line) + 1
+                    if max_chars and total > max_chars and len("\n".join(lines).strip()) > max_chars:
+                        logger.info(f"DOCX: текст превысил {max_chars} символов, разбор остановлен")
+                        break
+                # Обработанные элементы больше не нужны
+                if tag in (W_NS + 'p', W_NS + 'tbl', W_NS + 'txbxContent'):
+                    elem.clear()
+    return "\n".join(lines)
+
+
+def extract_docx_text(stream, max_chars: int = None) -> str:
+    """Извлечение текста из DOCX (быстрый разбор XML с fallback на python-docx)"""
+    if DOCX_FAST_EXTRACTOR:
+        try:
+            return extract_docx_text_fast(stream, max_chars)
+        except (zipfile.BadZipFile, KeyError, ParseError) as e:
+            logger.warning(f"Быстрый разбор DOCX не удался, используется python-docx: {e}")
+            stream.seek(0)
+    if not DOCX_SUPPORT:
+        return None
+    from docx import Document
+
+    doc = Document(stream)
+    return "\n".join(paragraph.text for paragraph in doc.paragraphs)
+
+
+def parse_document(file_name: str, stream):
+    """Извлечение текста из файлового объекта по расширению имени файла"""
+    file_name = file_name.lower()
+    if file_name.endswith('.txt'):
+        text = stream.read().decode('utf-8', errors='ignore')
+    elif file_name.endswith('.pdf'):
+        if not PDF_SUPPORT:
+            return None
+        text = extract_pdf_text(stream, max_chars=MAX_RESUME_LENGTH)
+    elif file_name.endswith('.docx'):
+        text = extract_docx_text(stream, max_chars=MAX_RESUME_LENGTH)
+        if text is None:
+            return None
+    else:
+        # Старые .doc файлы и прочие форматы не поддерживаются
+        return None
+    return text.strip() or None
+
+
+def _worker_main(conn):
+    """Цикл рабочего процесса: получает файл, возвращает текст или исключение"""
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        # Имя файла приходит отдельным сообщением, содержимое - сырыми байтами без pickle
+        file_name = task
+        content = conn.recv_bytes()
+        try:
+            conn.send(('ok', parse_document(file_name, io.BytesIO(content))))
+        except Exception as e:
+            try:
+                conn.send(('error', e))
+            except Exception:
+                # Исключение не сериализуется - передаём его описание
+                conn.send(('error', RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class _Worker:
+    """Рабочий процесс с каналом для обмена заданиями"""
+
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, EOFError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class ExtractionPool:
+    """Пул процессов для разбора документов с жёстким таймаутом на файл
+
+    В отличие от ProcessPoolExecutor, зависший процесс убивается и заменяется
+    новым, не затрагивая задания, которые выполняются в других процессах.
+    При size=0 разбор выполняется в потоке текущего процесса (без принудительной остановки).
+    """
+
+    def __init__(self, size: int, timeout: float):
+        self.size = size
+        self.timeout = timeout
+        self._ctx = multiprocessing.get_context('spawn')
+        self._idle = None
+
+    def _ensure_started(self):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for _ in range(self.size):
+                self._idle.put_nowait(_Worker(self._ctx))
+
+    def _submit(self, worker, file_name: str, buffer) -> bool:
+        # Передача файла и ожидание ответа выполняются вне event loop;
+        # send_bytes пишет прямо из memoryview буфера, без промежуточной копии
+        worker.conn.send(file_name)
+        with buffer.view() as view:
+            worker.conn.send_bytes(view)
+        return worker.conn.poll(self.timeout)
+
+    async def extract(self, file_name: str, buffer):
+        """Извлечение текста из DownloadBuffer в рабочем процессе"""
+        if self.size <= 0:
+            try:
+                return await asyncio.wait_for(
+                    asyncio.to_thread(parse_document, file_name, buffer.fileobj()), self.timeout
+                )
+            except asyncio.TimeoutError:
+                raise ExtractionTimeoutError(f"Extraction exceeded {self.timeout}s")
+
+        self._ensure_started()
+        worker = await self._idle.get()
+        healthy = False
+        try:
+            if not worker.process.is_alive():
+                worker = _Worker(self._ctx)
+            ready = await asyncio.to_thread(self._submit, worker, file_name, buffer)
+            if not ready:
+                logger.warning(f"Разбор файла {file_name} превысил {self.timeout}s, процесс остановлен")
+                raise ExtractionTimeoutError(f"Extraction exceeded {self.timeout}s")
+            status, payload = worker.conn.recv()
+            healthy = True
+        except (EOFError, OSError) as e:
+            # Процесс упал (например, из-за нехватки памяти)
+            raise RuntimeError(f"Extraction worker crashed: {e}")
+        finally:
+            if not healthy:
+                worker.kill()
+                worker = _Worker(self._ctx)
+            self._idle.put_nowait(worker)
+
+        if status == 'error':
+            raise payload
+        return payload
+
+    def shutdown(self):
+        """Остановка всех рабочих процессов"""
+        if self._idle is None:
+            return
+        while not self._idle.empty():
+            self._idle.get_nowait().stop()
+        self._idle = None
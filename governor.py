@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Глобальный регулятор запросов к OpenAI
+Держит скользящий бюджет токенов/запросов в минуту, ставит запросы в честную
+очередь (FIFO внутри пользователя, по кругу между пользователями) и повторяет
+запросы при RateLimitError с учётом Retry-After
+"""
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from metrics import OPENAI_QUEUE_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class _Ticket:
+    """Заявка на выполнение одного запроса"""
+
+    __slots__ = ('user_id', 'cost', 'future', 'entry', 'position', 'on_position')
+
+    def __init__(self, user_id, cost: int, on_position=None):
+        self.user_id = user_id
+        self.cost = cost
+        self.future = asyncio.get_running_loop().create_future()
+        self.entry = None  # [время, токены] в скользящем окне после выдачи
+        self.position = None
+        self.on_position = on_position
+
+
+def get_retry_after(error):
+    """Задержка из заголовков Retry-After / retry-after-ms ответа OpenAI (секунды)"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class OpenAIGovernor:
+    """Ограничение параллельности, TPM и RPM для всех запросов процесса"""
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: int, requests_per_minute: int,
+                 max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 position_interval: float = 3.0, window: float = 60.0):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.position_interval = position_interval
+        self.window = window
+        self._queues = OrderedDict()  # user_id -> deque[_Ticket], порядок - очередь обхода
+        self._window = deque()  # [время выдачи, токены]
+        self._window_tokens = 0
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._timer = None
+        self._position_timer = None
+
+    @property
+    def queued(self) -> int:
+        """Число запросов, ожидающих в очереди"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def call(self, user_id, cost: int, request, on_position=None):
+        """Выполнение запроса через очередь с повторами при RateLimitError
+
+        request - функция без аргументов, возвращающая корутину с результатом
+        (значение, фактическое число токенов или None)
+        """
+        # openai импортируется при первом запросе, а не при запуске бота
+        from openai import RateLimitError
+
+        attempt = 0
+        while True:
+            queued_at = time.monotonic()
+            # Повтор встаёт в начало очереди пользователя, сохраняя FIFO
+            ticket = await self.acquire(user_id, cost, on_position, front=attempt > 0)
+            queue_wait = time.monotonic() - queued_at
+            OPENAI_QUEUE_WAIT_SECONDS.observe(queue_wait)
+            logger.info(f"OpenAI queue wait for user {user_id}: {queue_wait:.3f}s")
+            actual_tokens = None
+            try:
+                value, actual_tokens = await request()
+                return value
+            except RateLimitError as e:
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = get_retry_after(e)
+                if retry_after is not None:
+                    delay = retry_after + random.uniform(0, self.backoff_base)
+                else:
+                    # Экспоненциальная задержка с полным джиттером
+                    delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                attempt += 1
+                logger.warning(
+                    f"OpenAI rate limit, повтор {attempt}/{self.max_retries} через {delay:.1f}s "
+                    f"(user {user_id}, в очереди {self.queued})"
+                )
+                # Лимит общий для аккаунта - приостанавливаем выдачу всем
+                self.pause(delay)
+            finally:
+                self.release(ticket, actual_tokens)
+
+    async def acquire(self, user_id, cost: int, on_position=None, front: bool = False) -> _Ticket:
+        """Ожидание разрешения на запрос стоимостью cost токенов"""
+        ticket = _Ticket(user_id, cost, on_position)
+        queue = self._queues.setdefault(user_id, deque())
+        if front:
+            queue.appendleft(ticket)
+        else:
+            queue.append(ticket)
+        self._dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.entry is not None:
+                self.release(ticket)
+            else:
+                self._remove(ticket)
+            raise
+        return ticket
+
+    def try_acquire(self, user_id, cost: int):
+        """Разрешение на дополнительный запрос без ожидания (None - бюджета сейчас нет)
+
+        Для дублирующих запросов: разрешение выдаётся, только если никто не ждёт
+        в очереди и запрос укладывается в параллельность, TPM и RPM прямо сейчас.
+        Освобождается через release
+        """
+        now = time.monotonic()
+        self._expire(now)
+        if (self._queues or now < self._paused_until or self._in_flight >= self.max_concurrency
+                or not self._fits(cost)):
+            return None
+        ticket = _Ticket(user_id, cost)
+        ticket.entry = [now, cost]
+        self._window.append(ticket.entry)
+        self._window_tokens += cost
+        self._in_flight += 1
+        return ticket
+
+    def release(self, ticket: _Ticket, actual_tokens: int = None):
+        """Завершение запроса; actual_tokens уточняет оценку в окне"""
+        if ticket.entry is None:
+            return
+        self._expire(time.monotonic())
+        # Запись могла уже выйти из окна - тогда уточнять нечего
+        if actual_tokens is not None and self._window and ticket.entry[0] >= self._window[0][0]:
+            self._window_tokens += actual_tokens - ticket.entry[1]
+            ticket.entry[1] = actual_tokens
+        ticket.entry = None
+        self._in_flight -= 1
+        self._dispatch()
+
+    def pause(self, delay: float):
+        """Приостановка выдачи разрешений на delay секунд"""
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self._dispatch()
+
+    def _remove(self, ticket: _Ticket):
+        queue = self._queues.get(ticket.user_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.user_id]
+        self._dispatch()
+
+    def _expire(self, now: float):
+        while self._window and now - self._window[0][0] >= self.window:
+            _, tokens = self._window.popleft()
+            self._window_tokens -= tokens
+
+    def _fits(self, cost: int) -> bool:
+        if not self._window:
+            # Пустое окно: пропускаем даже запрос дороже бюджета, иначе он не выйдет никогда
+            return True
+        return (len(self._window) < self.requests_per_minute and
+                self._window_tokens + cost <= self.tokens_per_minute)
+
+    def _dispatch(self):
+        now = time.monotonic()
+        self._expire(now)
+        wake_at = None
+        while self._queues and self._in_flight < self.max_concurrency:
+            if now < self._paused_until:
+                wake_at = self._paused_until
+                break
+            user_id, queue = next(iter(self._queues.items()))
+            ticket = queue[0]
+            if not self._fits(ticket.cost):
+                # Ждём, пока самый старый запрос выйдет из окна
+                wake_at = self._window[0][0] + self.window
+                break
+            queue.popleft()
+            # Пользователь уходит в конец круга, следующий запрос - от другого пользователя
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            ticket.entry = [now, ticket.cost]
+            self._window.append(ticket.entry)
+            self._window_tokens += ticket.cost
+            self._in_flight += 1
+            if not ticket.future.done():
+                ticket.future.set_result(None)
+
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if wake_at is not None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(max(0.0, wake_at - now), self._dispatch)
+        # Позиции пересчитываются по таймеру, а не при каждой выдаче
+        if self._queues and self._position_timer is None:
+            self._position_timer = asyncio.get_running_loop().call_later(
+                self.position_interval, self._report_positions
+            )
+
+    def _report_positions(self):
+        """Рассылка позиций в очереди за один проход по всем заявкам"""
+        self._position_timer = None
+        if not self._queues:
+            return
+        # Позиция - число запросов, которые будут обслужены раньше при обходе по кругу:
+        # пользователи впереди по кругу успеют получить index + 1 запросов, позади - index.
+        # served[i] - сколько запросов выдаётся за первые i кругов, ahead[i] - сколько
+        # уже пройденных очередей получат запрос и на круге i
+        queues = list(self._queues.values())
+        longest = max(len(queue) for queue in queues)
+        longer = [0] * (longest + 1)  # longer[i] - число очередей длиннее i
+        for queue in queues:
+            longer[len(queue) - 1] += 1
+        for index in range(longest - 1, -1, -1):
+            longer[index] += longer[index + 1]
+        served = [0] * longest
+        for index in range(1, longest):
+            served[index] = served[index - 1] + longer[index - 1]
+        ahead = [0] * longest
+        loop = asyncio.get_running_loop()
+        for queue in queues:
+            for index, ticket in enumerate(queue):
+                position = served[index] + ahead[index] + 1
+                ahead[index] += 1
+                if ticket.on_position is None or position == ticket.position:
+                    continue
+                ticket.position = position
+                loop.create_task(self._notify(ticket, position))
+        self._position_timer = loop.call_later(self.position_interval, self._report_positions)
+
+    async def _notify(self, ticket: _Ticket, position: int):
+        if ticket.future.done():
+            return
+        try:
+            await ticket.on_position(position)
+        except Exception as e:
+            logger.warning(f"Не удалось сообщить позицию в очереди: {e}")
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Дублирующие (hedged) запросы и адаптивные таймауты
+По недавним задержкам считается квантиль (по умолчанию p95): если запрос не
+ответил за это время, запускается его копия, берётся результат первой
+ответившей попытки, вторая отменяется. Доля продублированных запросов
+ограничена, таймаут одной попытки выводится из того же распределения
+"""
+import asyncio
+import logging
+from collections import deque
+from metrics import OPENAI_HEDGES, OPENAI_HEDGE_LOSER_TOKENS, OPENAI_ATTEMPT_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Таймаут попытки - во столько раз больше p99 наблюдаемой задержки
+TIMEOUT_MULTIPLIER = 3.0
+
+
+def is_timeout(error: BaseException) -> bool:
+    """Таймаут попытки (asyncio, httpx или openai - по имени класса, без импорта openai)"""
+    return isinstance(error, TimeoutError) or 'Timeout' in type(error).__name__
+
+
+class LatencyTracker:
+    """Скользящее окно последних задержек"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, latency: float):
+        self._samples.append(latency)
+
+    def quantile(self, q: float) -> float:
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Hedger:
+    """Выполнение запроса с дублированием после квантиля задержки
+
+    Задержкой попытки считается время до commit(): для потокового ответа -
+    до первого токена, для обычного - до получения ответа целиком
+    """
+
+    def __init__(self, name: str, max_timeout: float, quantile: float = 0.95, max_fraction: float = 0.1,
+                 min_samples: int = 20, min_timeout: float = 5.0, adaptive_timeout: bool = True,
+                 window: int = 200):
+        self.name = name
+        self.max_timeout = max_timeout
+        self.quantile = quantile
+        self.max_fraction = max_fraction
+        self.min_samples = min_samples
+        self.min_timeout = min_timeout
+        self.adaptive_timeout = adaptive_timeout
+        self.latencies = LatencyTracker(window)
+        self._hedged = deque(maxlen=window)  # был ли продублирован каждый из последних запросов
+
+    def hedge_delay(self):
+        """Через сколько секунд дублировать запрос (None - статистики ещё мало)"""
+        if self.max_fraction <= 0 or len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.quantile(self.quantile)
+
+    def attempt_timeout(self) -> float:
+        """Таймаут одной попытки: кратный p99, в пределах [min_timeout, max_timeout]"""
+        timeout = self.max_timeout
+        if self.adaptive_timeout and len(self.latencies) >= self.min_samples:
+            timeout = min(self.max_timeout, max(self.min_timeout,
+                                                self.latencies.quantile(0.99) * TIMEOUT_MULTIPLIER))
+        OPENAI_ATTEMPT_TIMEOUT_SECONDS.set(round(timeout, 3), mode=self.name)
+        return timeout
+
+    def _can_hedge(self) -> bool:
+        return sum(self._hedged) < self.max_fraction * len(self._hedged)
+
+    async def run(self, attempt, reserve=None, cost: int = 0):
+        """Результат attempt(commit) - первой успешной из не более чем двух попыток
+
+        attempt вызывает commit(), когда получен первый результат (первый токен
+        потока): остальные попытки отменяются, до этого момента попытка не
+        должна ничего показывать пользователю.
+
+        reserve() занимает бюджет под дублирующий запрос и возвращает функцию его
+        освобождения (None - бюджета нет, запрос не дублируется); cost - оценка
+        токенов попытки для учёта отменённой
+        """
+        loop = asyncio.get_running_loop()
+        tasks = []
+        winner = []
+
+        def launch():
+            started = loop.time()
+
+            def commit():
+                if winner:
+                    return
+                winner.append(task)
+                self.latencies.add(loop.time() - started)
+                for other in tasks:
+                    if other is not task:
+                        other.cancel()
+
+            async def run_attempt():
+                try:
+                    result = await attempt(commit)
+                except BaseException as e:
+                    # Отменённая или не дождавшаяся ответа попытка длилась не меньше
+                    # этого времени - без таких замеров квантиль занижен
+                    committed = winner and winner[0] is task
+                    if not committed and (isinstance(e, asyncio.CancelledError) or is_timeout(e)):
+                        self.latencies.add(loop.time() - started)
+                    raise
+                commit()
+                return result
+
+            task = asyncio.ensure_future(run_attempt())
+            tasks.append(task)
+
+        launch()
+        delay = self.hedge_delay()
+        hedged = False
+        release = None
+        error = None
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Попытка дольше квантиля - дублируем, если позволяет бюджет
+                    delay = None
+                    if not winner and self._can_hedge():
+                        # Дубль занимает свою долю параллельности и TPM/RPM регулятора
+                        release = reserve() if reserve else (lambda: None)
+                        if release is None:
+                            OPENAI_HEDGES.inc(mode=self.name, winner="skipped")
+                            logger.info(f"OpenAI ({self.name}): нет бюджета на дублирующий запрос")
+                            continue
+                        hedged = True
+                        logger.info(f"OpenAI ({self.name}): нет ответа за {self.hedge_delay():.2f}s, "
+                                    f"дублирующий запрос")
+                        launch()
+                        pending = {task for task in tasks if not task.done()}
+                    continue
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is None:
+                        if hedged:
+                            OPENAI_HEDGES.inc(mode=self.name, winner="hedge" if task is tasks[-1] else "primary")
+                            # Отменённая попытка тоже расходует токены - учитываем оценку
+                            OPENAI_HEDGE_LOSER_TOKENS.inc(cost, mode=self.name)
+                        return task.result()
+                    error = error or task.exception()
+            raise error or RuntimeError(f"OpenAI ({self.name}): все попытки отменены")
+        finally:
+            for task in tasks:
+                if task.done() and not task.cancelled():
+                    task.exception()  # ошибка проигравшей попытки уже не нужна
+                else:
+                    task.cancel()
+            # Оценка токенов дубля остаётся в окне регулятора
+            if release is not None:
+                release()
+            self._hedged.append(hedged)
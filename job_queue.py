@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь заданий генерации в SQLite и пул асинхронных обработчиков
+Обработчики апдейтов только ставят задание в очередь; генерация идёт в пуле.
+Задания переживают перезапуск: незавершённые подхватываются при следующем старте
+"""
+import os
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """Задание генерации шаблона"""
+
+    __slots__ = ('id', 'user_id', 'username', 'chat_id', 'chat_type', 'message_id',
+                 'source', 'resume_hash', 'resume_text', 'attempts', 'created_at')
+
+    def __init__(self, id, user_id, username, chat_id, chat_type, message_id,
+                 source, resume_hash, resume_text, attempts, created_at):
+        self.id = id
+        self.user_id = user_id
+        self.username = username
+        self.chat_id = chat_id
+        self.chat_type = chat_type
+        self.message_id = message_id  # сообщение "Processing...", которое редактирует обработчик
+        self.source = source  # message или document
+        self.resume_hash = resume_hash
+        self.resume_text = resume_text
+        self.attempts = attempts
+        self.created_at = created_at
+
+
+JOB_COLUMNS = ('id, user_id, username, chat_id, chat_type, message_id, '
+               'source, resume_hash, resume_text, attempts, created_at')
+# Переносимые между очередями поля (id назначает целевая очередь, аренда сбрасывается)
+MOVE_COLUMNS = ('user_id, username, chat_id, chat_type, message_id, '
+                'source, resume_hash, resume_text, attempts, created_at')
+
+
+class JobQueue:
+    """Очередь заданий в SQLite
+
+    Взятое задание арендуется на lease_seconds; аренда продлевается, пока задание
+    обрабатывается. Задание с истёкшей арендой (процесс упал) снова доступно
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 120.0):
+        self.lease_seconds = lease_seconds
+        self._db = sqlite3.connect(db_path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, username TEXT, "
+            "chat_id INTEGER NOT NULL, chat_type TEXT, message_id INTEGER NOT NULL, "
+            "source TEXT NOT NULL, resume_hash TEXT NOT NULL, resume_text TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_lease ON jobs (lease_until, id)")
+        self._lock = asyncio.Lock()
+
+    async def _run(self, func, *args):
+        # Одно соединение на очередь - обращения к нему последовательны
+        async with self._lock:
+            return await asyncio.to_thread(func, *args)
+
+    async def put(self, user_id: int, username: str, chat_id: int, chat_type: str, message_id: int,
+                  source: str, resume_text: str) -> int:
+        """Постановка задания в очередь; возвращает id задания"""
+        resume_hash = hashlib.sha256(resume_text.encode('utf-8')).hexdigest()
+        return await self._run(self._put, (
+            user_id, username, chat_id, chat_type, message_id, source, resume_hash, resume_text, time.time()
+        ))
+
+    def _put(self, values: tuple) -> int:
+        cursor = self._db.execute(
+            "INSERT INTO jobs (user_id, username, chat_id, chat_type, message_id, source, "
+            "resume_hash, resume_text, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            values
+        )
+        return cursor.lastrowid
+
+    async def claim(self):
+        """Следующее свободное задание (или None); аренда и счётчик попыток обновляются"""
+        return await self._run(self._claim)
+
+    def _claim(self):
+        now = time.time()
+        row = self._db.execute(
+            "UPDATE jobs SET lease_until = ?, attempts = attempts + 1 "
+            "WHERE id = (SELECT id FROM jobs WHERE lease_until < ? ORDER BY id LIMIT 1) "
+            f"RETURNING {JOB_COLUMNS}",
+            (now + self.lease_seconds, now)
+        ).fetchone()
+        return Job(*row) if row else None
+
+    async def extend(self, job_id: int):
+        """Продление аренды задания, которое ещё обрабатывается"""
+        await self._run(self._extend, job_id)
+
+    def _extend(self, job_id: int):
+        self._db.execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() + self.lease_seconds, job_id))
+
+    async def complete(self, job_id: int):
+        """Удаление выполненного задания (вместе с текстом резюме)"""
+        await self._run(self._db.execute, "DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    async def release_all(self):
+        """Снятие аренды со всех заданий - при старте, если очередь принадлежит одному процессу"""
+        await self._run(self._db.execute, "UPDATE jobs SET lease_until = 0")
+
+    async def size(self) -> int:
+        return (await self._run(lambda: self._db.execute("SELECT COUNT(*) FROM jobs").fetchone()))[0]
+
+    async def close(self):
+        self._db.close()
+
+
+class JobWorkerPool:
+    """size асинхронных обработчиков, забирающих задания из JobQueue"""
+
+    def __init__(self, queue: JobQueue, handler, size: int = 8, poll_interval: float = 5.0):
+        self.queue = queue
+        self.handler = handler  # корутина handler(job)
+        self.size = size
+        self.poll_interval = poll_interval  # проверка очереди на задания других процессов
+        self._wakeup = None
+        self._tasks = []
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.size)]
+
+    def notify(self):
+        """Сигнал о новом задании"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _worker(self, index: int):
+        while True:
+            # Сброс до claim: сигнал, пришедший во время claim, не теряется
+            self._wakeup.clear()
+            try:
+                job = await self.queue.claim()
+            except Exception as e:
+                logger.error(f"Не удалось взять задание из очереди: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # Разбудить следующего обработчика: в очереди могут быть ещё задания
+            self._wakeup.set()
+            await self._process(job)
+
+    async def _process(self, job: Job):
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            await self.handler(job)
+        except asyncio.CancelledError:
+            # Остановка бота: задание остаётся в очереди и будет выполнено после перезапуска
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка обработки задания {job.id}: {e}", exc_info=True)
+        finally:
+            heartbeat.cancel()
+        await self.queue.complete(job.id)
+
+    async def _heartbeat(self, job_id: int):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                await self.queue.extend(job_id)
+            except Exception as e:
+                logger.error(f"Не удалось продлить аренду задания {job_id}: {e}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def move_jobs(source_path: str, target_for) -> int:
+    """Перенос всех заданий из файла очереди в другие очереди
+
+    target_for(key) -> путь целевой очереди для user_id задания (chat_id, если
+    пользователя нет).
+    Исходный файл удаляется после переноса; возвращает число перенесённых заданий
+    """
+    source = sqlite3.connect(source_path, timeout=5)
+    try:
+        rows = source.execute(f"SELECT {MOVE_COLUMNS} FROM jobs ORDER BY id").fetchall()
+    except sqlite3.OperationalError:
+        # Файл без таблицы заданий - переносить нечего
+        rows = []
+    finally:
+        source.close()
+
+    groups = {}
+    for row in rows:
+        groups.setdefault(target_for(row[0] if row[0] is not None else row[2]), []).append(row)
+    placeholders = ', '.join('?' * len(MOVE_COLUMNS.split(',')))
+    for target_path, group in groups.items():
+        # JobQueue создаёт таблицу в новом файле
+        target = JobQueue(target_path)
+        try:
+            with target._db:
+                target._db.execute("BEGIN IMMEDIATE")
+                target._db.executemany(f"INSERT INTO jobs ({MOVE_COLUMNS}) VALUES ({placeholders})", group)
+        finally:
+            target._db.close()
+    # Сбой между переносом и удалением приведёт к повтору заданий, но не к их потере
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.remove(source_path + suffix)
+        except FileNotFoundError:
+            pass
+    return len(rows)
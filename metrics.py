@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики в формате Prometheus
+Счётчики и гистограммы в памяти процесса и HTTP-эндпоинт /metrics
+"""
+import time
+import logging
+import functools
+import importlib.util
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# aiohttp импортируется при запуске сервера: метрики нужны и без него
+METRICS_SERVER_SUPPORT = importlib.util.find_spec('aiohttp') is not None
+
+# Все созданные метрики в порядке объявления
+REGISTRY = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for key in sorted(self._values):
+            lines.extend(self._render_value(key, self._values[key]))
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик"""
+
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self._labels(key))} {value}"]
+
+
+class Gauge(_Metric):
+    """Текущее значение (может уменьшаться)"""
+
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self._labels(key))} {value}"]
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами корзин"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # Счётчики по корзинам (последняя - +Inf), сумма и количество
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер времени выполнения блока"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_value(self, key, state):
+        counts, total, count = state
+        labels = self._labels(key)
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(float(bound))
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': le})} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+def timed(histogram: Histogram, **labels):
+    """Декоратор: время выполнения корутины в гистограмму"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render_metrics() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+async def start_metrics_server(host: str, port: int):
+    """Запуск HTTP-сервера с эндпоинтом /metrics; возвращает runner для остановки"""
+    if not METRICS_SERVER_SUPPORT:
+        logger.warning("aiohttp не установлен. Эндпоинт /metrics недоступен.")
+        return None
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logger.error(f"Не удалось запустить сервер метрик на {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
+
+
+# Метрики бота
+FILE_DOWNLOAD_SECONDS = Histogram(
+    'bot_file_download_seconds', 'Time to download a document from Telegram'
+)
+EXTRACTION_SECONDS = Histogram(
+    'bot_extraction_seconds', 'Time to extract text from a document', ['format']
+)
+OPENAI_REQUEST_SECONDS = Histogram(
+    'bot_openai_request_seconds', 'OpenAI chat completion latency', ['mode']
+)
+OPENAI_ENDPOINT_REQUESTS = Counter(
+    'bot_openai_endpoint_requests_total', 'OpenAI requests per pool endpoint', ['endpoint', 'result']
+)
+OPENAI_ENDPOINT_LATENCY = Gauge(
+    'bot_openai_endpoint_latency_seconds', 'Smoothed (EWMA) request latency per pool endpoint', ['endpoint']
+)
+OPENAI_ENDPOINT_UP = Gauge(
+    'bot_openai_endpoint_up', 'Whether a pool endpoint is currently used for requests', ['endpoint']
+)
+OPENAI_HEDGES = Counter(
+    'bot_openai_hedged_requests_total',
+    'OpenAI requests duplicated after the latency quantile (winner=skipped - no governor budget)',
+    ['mode', 'winner']
+)
+OPENAI_HEDGE_LOSER_TOKENS = Counter(
+    'bot_openai_hedge_loser_tokens_total', 'Estimated tokens spent by cancelled hedged attempts', ['mode']
+)
+OPENAI_ATTEMPT_TIMEOUT_SECONDS = Gauge(
+    'bot_openai_attempt_timeout_seconds', 'Current adaptive timeout of one OpenAI attempt', ['mode']
+)
+OPENAI_QUEUE_WAIT_SECONDS = Histogram(
+    'bot_openai_queue_wait_seconds', 'Time spent waiting in the OpenAI request queue'
+)
+OPENAI_PROMPT_TOKENS = Histogram(
+    'bot_openai_prompt_tokens', 'Prompt tokens per OpenAI request', buckets=TOKEN_BUCKETS
+)
+OPENAI_CACHED_PROMPT_TOKENS = Counter(
+    'bot_openai_cached_prompt_tokens_total', 'Prompt tokens served from the OpenAI prompt cache'
+)
+RESUME_TOKENS_SAVED = Counter(
+    'bot_resume_tokens_saved_total', 'Resume tokens removed by normalization and the token cap'
+)
+PROMPT_PREFIX_TOKENS = Gauge(
+    'bot_prompt_prefix_tokens', 'Tokens in the static system prompt prefix'
+)
+OPENAI_COMPLETION_TOKENS = Histogram(
+    'bot_openai_completion_tokens', 'Completion tokens per OpenAI request', buckets=TOKEN_BUCKETS
+)
+JOB_WAIT_SECONDS = Histogram(
+    'bot_job_wait_seconds', 'Time a generation job spent in the job queue'
+)
+GENERATION_SECONDS = Histogram(
+    'bot_generation_seconds', 'End-to-end generation latency from queuing the job to the reply',
+    ['source'], buckets=DEFAULT_BUCKETS + (120.0, 300.0)
+)
+HANDLER_SECONDS = Histogram(
+    'bot_handler_seconds', 'Update handler latency (with the job queue - until the job is queued)', ['handler']
+)
+CACHE_REQUESTS = Counter(
+    'bot_cache_requests_total', 'Cover letter cache lookups', ['result']
+)
+FILE_TEXT_CACHE_REQUESTS = Counter(
+    'bot_file_text_cache_requests_total', 'Extracted document text cache lookups', ['result']
+)
+RATE_LIMITED = Counter(
+    'bot_rate_limited_total', 'Requests rejected by the per-user rate limit'
+)
+GENERATIONS = Counter(
+    'bot_generations_total', 'Cover letter generation outcomes', ['outcome']
+)
+ERRORS = Counter(
+    'bot_errors_total', 'Errors reported to the administrator', ['error_type']
+)
+TELEGRAM_SEND_WAIT_SECONDS = Histogram(
+    'bot_telegram_send_wait_seconds', 'Time a Bot API request waited for the send scheduler', ['priority']
+)
+TELEGRAM_SEND_QUEUE = Gauge(
+    'bot_telegram_send_queue', 'Bot API requests waiting for the send scheduler'
+)
+TELEGRAM_RETRY_AFTER = Counter(
+    'bot_telegram_retry_after_total', 'RetryAfter (flood control) errors returned by Telegram'
+)
+PROFILE_FOLLOWUPS = Counter(
+    'bot_profile_followups_total', 'Vacancy letters by the resume context sent to the model', ['context']
+)
+PROFILE_BUILDS = Counter(
+    'bot_profile_builds_total', 'Compact candidate profile generations', ['outcome']
+)
+PLACEHOLDER_FILLS = Counter(
+    'bot_placeholder_fills_total', 'Local /fill requests by result', ['outcome']
+)
+
+# Метрики супервизора (supervisor.py)
+WORKER_UPDATES = Counter(
+    'bot_worker_updates_total', 'Updates routed to each worker process', ['worker']
+)
+WORKER_RESTARTS = Counter(
+    'bot_worker_restarts_total', 'Worker process crashes followed by a restart', ['worker']
+)
+WORKER_PENDING = Gauge(
+    'bot_worker_pending', 'Updates and generation jobs waiting in a worker process', ['worker']
+)
+WORKER_CPU = Gauge(
+    'bot_worker_cpu_percent', 'CPU usage of a worker process', ['worker']
+)
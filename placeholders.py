@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Заполнение плейсхолдеров шаблона без обращения к модели
+Шаблон из promt.txt содержит поля вакансии в квадратных скобках ([Company name],
+[Position title], ...). Значения берутся из строк "ключ=значение" или извлекаются
+эвристиками из текста вакансии и подставляются за один проход регулярного
+выражения; незаполненные плейсхолдеры остаются в тексте и возвращаются списком
+"""
+import re
+
+# Плейсхолдер: текст в квадратных скобках в пределах одной строки
+PLACEHOLDER_RE = re.compile(r'\[([^\[\]\n]{1,80})\]')
+
+# Поля вакансии: короткий ключ -> названия плейсхолдеров и синонимы ключа
+FIELD_ALIASES = {
+    'company': ('company name', 'company', 'employer', 'компания'),
+    'position': ('position title', 'position', 'role', 'vacancy', 'title', 'должность', 'вакансия'),
+    'focus': ('company focus or mission', 'focus', 'mission', 'миссия'),
+    'values': ('company values or culture theme', 'values', 'culture', 'ценности'),
+    'team': ('team or product', 'team', 'product', 'команда', 'продукт'),
+    'goal': ('company goal or desired outcome', 'goal', 'outcome', 'цель'),
+}
+ALIAS_TO_FIELD = {alias: field for field, aliases in FIELD_ALIASES.items() for alias in aliases}
+
+# Строка "ключ=значение" или "ключ: значение"
+DETAIL_LINE_RE = re.compile(r'^\s*([^\W\d][\w .\-]{0,40}?)\s*[=:]\s*(.+?)\s*$')
+DETAIL_SPLIT_RE = re.compile(r'[\n;]')
+
+# Эвристики для текста вакансии (первое совпадение выигрывает)
+JOB_PATTERNS = {
+    'position': (
+        re.compile(r'^(?:position|role|job title|title|vacancy|должность|вакансия)\s*[:\-–—]\s*(.+)$',
+                   re.IGNORECASE | re.MULTILINE),
+        re.compile(r'\b(?:looking for|hiring|seeking) (?:an? |our next )?([A-Z][\w+#./-]*(?: [A-Z][\w+#./-]*){0,5})'),
+    ),
+    'company': (
+        re.compile(r'^(?:company|employer|компания)\s*[:\-–—]\s*(.+)$', re.IGNORECASE | re.MULTILINE),
+        re.compile(r'^about ([A-Z][\w&.\-]*(?: [A-Z][\w&.\-]*){0,3})\s*:?\s*$', re.MULTILINE),
+        re.compile(r'\bjoin ([A-Z][\w&.\-]*(?: [A-Z][\w&.\-]*){0,3}?)(?: as\b|[,.!]| and\b| in\b)'),
+        re.compile(r'\b([A-Z][\w&.\-]*(?: [A-Z][\w&.\-]*){0,3}) is (?:looking for|hiring|seeking)\b'),
+    ),
+    'team': (
+        re.compile(r'\bjoin (?:our|the) ((?:[\w+#/-]+ ){1,3}team)\b', re.IGNORECASE),
+    ),
+    'focus': (
+        re.compile(r'\b(?:our|the company\'s) mission is to ([^.\n]{5,120})', re.IGNORECASE),
+        re.compile(r'\bwe(?: are|\'re) (?:building|on a mission to) ([^.\n]{5,120})', re.IGNORECASE),
+    ),
+    'values': (
+        re.compile(r'\bwe value ([^.\n]{3,120})', re.IGNORECASE),
+        re.compile(r'^(?:our )?values\s*[:\-–—]\s*(.+)$', re.IGNORECASE | re.MULTILINE),
+    ),
+}
+# "Senior Python Developer at Acme" в первой строке вакансии
+TITLE_AT_COMPANY_RE = re.compile(r'^(.{3,80}?) (?:at|@|в компании) (.{2,60})$', re.IGNORECASE)
+# Не название компании, хотя начинается с заглавной буквы
+NOT_COMPANY = {'we', 'our', 'the', 'this', 'you', 'us', 'the team', 'our team'}
+
+
+def normalize_key(key: str) -> str:
+    """Ключ для сравнения: нижний регистр, одиночные пробелы"""
+    return ' '.join(re.sub(r'[^\w]+', ' ', key.lower()).split())
+
+
+def field_for(name: str) -> str:
+    """Поле вакансии для названия плейсхолдера или ключа (или само нормализованное название)"""
+    key = normalize_key(name)
+    return ALIAS_TO_FIELD.get(key, key)
+
+
+def parse_details(text: str) -> dict:
+    """Значения из строк "ключ=значение" (через перевод строки или ";")"""
+    values = {}
+    for line in DETAIL_SPLIT_RE.split(text):
+        match = DETAIL_LINE_RE.match(line)
+        if match:
+            values[field_for(match.group(1))] = match.group(2)
+    return values
+
+
+def is_details_text(text: str) -> bool:
+    """Текст состоит только из строк "поле=значение" с известными полями вакансии"""
+    lines = [line for line in DETAIL_SPLIT_RE.split(text) if line.strip()]
+    if not lines:
+        return False
+    for line in lines:
+        match = DETAIL_LINE_RE.match(line)
+        if not match or normalize_key(match.group(1)) not in ALIAS_TO_FIELD:
+            return False
+    return True
+
+
+def _clean(value: str) -> str:
+    return value.strip().strip(' .,;:!-–—"\'«»')
+
+
+def parse_job_posting(text: str) -> dict:
+    """Поля вакансии, найденные эвристиками в тексте объявления"""
+    values = {}
+    first_line = next((line.strip() for line in text.splitlines() if line.strip()), '')
+    match = TITLE_AT_COMPANY_RE.match(first_line)
+    if match:
+        values['position'] = _clean(match.group(1))
+        values['company'] = _clean(match.group(2))
+    for field, patterns in JOB_PATTERNS.items():
+        if field in values:
+            continue
+        for pattern in patterns:
+            for match in pattern.finditer(text):
+                value = _clean(match.group(1))
+                if not value or (field == 'company' and value.lower() in NOT_COMPANY):
+                    continue
+                values[field] = value
+                break
+            if field in values:
+                break
+    # Короткая первая строка многострочной вакансии обычно и есть название должности
+    if ('position' not in values and '\n' in text.strip() and first_line[:1].isupper()
+            and len(first_line) <= 60 and ':' not in first_line):
+        values['position'] = _clean(first_line)
+    return values
+
+
+def parse_fill_request(text: str) -> dict:
+    """Значения для подстановки: строки "ключ=значение" или текст вакансии
+
+    Явно указанные "ключ=значение" важнее найденных в тексте вакансии
+    """
+    if is_details_text(text):
+        return parse_details(text)
+    values = parse_job_posting(text)
+    values.update(parse_details(text))
+    return values
+
+
+def find_placeholders(template: str) -> list:
+    """Уникальные плейсхолдеры шаблона в порядке появления"""
+    return list(dict.fromkeys(match.group(0) for match in PLACEHOLDER_RE.finditer(template)))
+
+
+def fill_placeholders(template: str, values: dict):
+    """Подстановка значений за один проход
+
+    values - поле вакансии (или нормализованное название плейсхолдера) -> значение.
+    Возвращает (текст, незаполненные плейсхолдеры в порядке появления)
+    """
+    unresolved = {}
+
+    def substitute(match):
+        value = values.get(field_for(match.group(1)))
+        if value:
+            return value
+        unresolved[match.group(0)] = None
+        return match.group(0)
+
+    return PLACEHOLDER_RE.sub(substitute, template), list(unresolved)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Профили пользователей: последнее резюме, его краткая выжимка и последний шаблон
+После первого шаблона резюме пользователя сохраняется в SQLite, и следующие
+сообщения с описанием вакансии превращаются в письмо под эту вакансию без
+повторной отправки резюме. Краткий профиль кандидата создаётся моделью один
+раз и дальше подставляется в запрос вместо полного текста резюме
+"""
+import re
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Признаки описания вакансии. Без хотя бы одной сильной фразы текст вакансией не считается:
+# слабые слова ("responsibilities", "apply", "benefits") встречаются и в резюме
+STRONG_JOB_MARKERS = (
+    'we are looking for', "we're looking for", 'we are hiring', "we're hiring", 'requirements',
+    'what you will do', "what you'll do", 'about the role', 'job description', 'the ideal candidate',
+    'nice to have', 'we offer', 'you will join', 'join our team',
+    'мы ищем', 'требования', 'мы предлагаем', 'будет плюсом', 'что нужно делать', 'приглашаем',
+)
+WEAK_JOB_MARKERS = (
+    'responsibilities', 'qualifications', 'you will', 'benefits', 'apply', 'salary', 'about us',
+    'ищем', 'условия', 'вакансия', 'обязанности',
+)
+RESUME_MARKERS = (
+    'work experience', 'professional experience', 'employment history', 'work history', 'education',
+    'curriculum vitae', 'resume', 'cv', 'objective', 'certifications', 'references',
+    'опыт работы', 'образование', 'резюме', 'о себе', 'навыки', 'ключевые навыки',
+)
+# Заголовки разделов резюме - отдельной строкой ("Experience", "Skills:")
+RESUME_HEADERS = (
+    'experience', 'skills', 'summary', 'profile', 'projects', 'languages', 'achievements',
+    'technical skills', 'key skills', 'contacts', 'contact', 'interests',
+    'опыт', 'проекты', 'достижения', 'языки', 'контакты',
+)
+
+
+def _phrases_re(phrases: tuple):
+    # Фразы ищутся целыми словами ("apply" не совпадает с "application") одним выражением
+    return re.compile(r'\b(?:' + '|'.join(map(re.escape, phrases)) + r')\b', re.IGNORECASE)
+
+
+STRONG_JOB_RE = _phrases_re(STRONG_JOB_MARKERS)
+WEAK_JOB_RE = _phrases_re(WEAK_JOB_MARKERS)
+RESUME_RE = _phrases_re(RESUME_MARKERS)
+RESUME_HEADER_RE = re.compile(
+    r'^[ \t#*•-]*(?:' + '|'.join(map(re.escape, RESUME_HEADERS)) + r')[ \t]*:?[ \t*]*$',
+    re.IGNORECASE | re.MULTILINE
+)
+# Обращение к кандидату во втором лице характерно для вакансий, первое лицо - для резюме
+SECOND_PERSON_RE = re.compile(r"\b(?:you|your|you'll|you're)\b", re.IGNORECASE)
+FIRST_PERSON_RE = re.compile(r"\b(?:i|my|i'm|i've)\b", re.IGNORECASE)
+
+
+def _count_markers(text: str, pattern) -> int:
+    """Число разных фраз из pattern, встретившихся в тексте"""
+    return len({match.strip(' \t#*•-:').lower() for match in pattern.findall(text)})
+
+
+def looks_like_job_posting(text: str) -> bool:
+    """Похож ли текст на описание вакансии, а не на резюме (по ключевым фразам)"""
+    strong = _count_markers(text, STRONG_JOB_RE)
+    if not strong:
+        return False
+    job_score = 2 * strong + _count_markers(text, WEAK_JOB_RE)
+    resume_score = 2 * (_count_markers(text, RESUME_RE) + _count_markers(text, RESUME_HEADER_RE))
+    if len(SECOND_PERSON_RE.findall(text)) > len(FIRST_PERSON_RE.findall(text)):
+        job_score += 1
+    else:
+        resume_score += 1
+    return job_score > resume_score
+
+
+def resume_hash(resume_text: str) -> str:
+    return hashlib.sha256(resume_text.encode('utf-8')).hexdigest()
+
+
+class UserProfile:
+    """Сохранённое резюме пользователя, краткий профиль (None - ещё не создан)
+    и последний шаблон с плейсхолдерами для /fill"""
+
+    __slots__ = ('user_id', 'resume_hash', 'resume_text', 'profile', 'updated_at', 'last_template')
+
+    def __init__(self, user_id, resume_hash, resume_text, profile, updated_at, last_template=None):
+        self.user_id = user_id
+        self.resume_hash = resume_hash
+        self.resume_text = resume_text
+        self.profile = profile
+        self.updated_at = updated_at
+        self.last_template = last_template
+
+
+PROFILE_COLUMNS = 'user_id, resume_hash, resume_text, profile, updated_at, last_template'
+
+
+class ProfileStore:
+    """Резюме и профили пользователей в SQLite
+
+    Хранится не больше max_entries пользователей (вытесняются давно не
+    обновлявшиеся), запись старше ttl секунд считается отсутствующей
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 10000, ttl: float = 0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._db = sqlite3.connect(db_path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            "user_id INTEGER PRIMARY KEY, resume_hash TEXT NOT NULL, resume_text TEXT NOT NULL, "
+            "profile TEXT, updated_at REAL NOT NULL, last_template TEXT)"
+        )
+        # Файлы, созданные до появления шаблонов
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(profiles)")}
+        if 'last_template' not in columns:
+            self._db.execute("ALTER TABLE profiles ADD COLUMN last_template TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS profiles_updated ON profiles (updated_at)")
+        self._lock = asyncio.Lock()
+
+    async def _run(self, func, *args):
+        # Одно соединение на хранилище - обращения к нему последовательны
+        async with self._lock:
+            return await asyncio.to_thread(func, *args)
+
+    async def get(self, user_id: int):
+        """Профиль пользователя (None, если его нет или срок хранения истёк)"""
+        return await self._run(self._get, user_id)
+
+    def _get(self, user_id: int):
+        row = self._db.execute(
+            f"SELECT {PROFILE_COLUMNS} FROM profiles WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        profile = UserProfile(*row)
+        if self.ttl and time.time() - profile.updated_at > self.ttl:
+            self._db.execute("DELETE FROM profiles WHERE user_id = ?", (user_id,))
+            return None
+        return profile
+
+    async def save_resume(self, user_id: int, resume_text: str):
+        """Сохранение резюме; профиль сбрасывается, если резюме изменилось"""
+        await self._run(self._save_resume, user_id, resume_text)
+
+    def _save_resume(self, user_id: int, resume_text: str):
+        now = time.time()
+        self._db.execute(
+            "INSERT INTO profiles (user_id, resume_hash, resume_text, profile, updated_at) "
+            "VALUES (?, ?, ?, NULL, ?) ON CONFLICT (user_id) DO UPDATE SET "
+            "profile = CASE WHEN resume_hash = excluded.resume_hash THEN profile END, "
+            "resume_hash = excluded.resume_hash, resume_text = excluded.resume_text, "
+            "updated_at = excluded.updated_at",
+            (user_id, resume_hash(resume_text), resume_text, now)
+        )
+        # Вытесняем самые старые записи сверх лимита
+        self._db.execute(
+            "DELETE FROM profiles WHERE user_id IN ("
+            "SELECT user_id FROM profiles ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    async def set_profile(self, user_id: int, resume_hash: str, profile: str):
+        """Сохранение профиля, если резюме пользователя с тех пор не сменилось"""
+        await self._run(
+            self._db.execute,
+            "UPDATE profiles SET profile = ? WHERE user_id = ? AND resume_hash = ?",
+            (profile, user_id, resume_hash)
+        )
+
+    async def save_template(self, user_id: int, template: str):
+        """Сохранение последнего шаблона пользователя (если его резюме сохранено)"""
+        await self._run(
+            self._db.execute,
+            "UPDATE profiles SET last_template = ? WHERE user_id = ?",
+            (template, user_id)
+        )
+
+    async def delete(self, user_id: int) -> bool:
+        """Удаление данных пользователя; True, если они были"""
+        cursor = await self._run(self._db.execute, "DELETE FROM profiles WHERE user_id = ?", (user_id,))
+        return cursor.rowcount > 0
+
+    async def size(self) -> int:
+        return (await self._run(lambda: self._db.execute("SELECT COUNT(*) FROM profiles").fetchone()))[0]
+
+    async def close(self):
+        self._db.close()
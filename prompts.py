@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Сборка запроса к модели: системный промпт, инструкции и очистка ответа
+Используется ботом и пакетным режимом (batch.py), чтобы запросы совпадали.
+
+Статический префикс (системное сообщение и начало сообщения пользователя)
+собирается один раз при загрузке promt.txt и не меняется от запроса к запросу:
+OpenAI кэширует совпадающие префиксы промптов длиной от 1024 токенов
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from config import (
+    OPENAI_MODEL, OPENAI_TEMPERATURE, OPENAI_MAX_TOKENS, MAX_RESUME_LENGTH,
+    PROMPT_PATH, PROMPT_RELOAD_INTERVAL, RESUME_COMPACTION, MAX_RESUME_TOKENS,
+    PROFILE_MAX_TOKENS, MAX_VACANCY_TOKENS
+)
+from cache import make_cache_key
+from tokens import estimate_tokens
+from compaction import compact_resume, truncate_to_tokens, CompactionResult
+from metrics import PROMPT_PREFIX_TOKENS, RESUME_TOKENS_SAVED
+
+logger = logging.getLogger(__name__)
+
+# Минимальная длина промпта, с которой OpenAI применяет кэширование префикса
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+
+# Дополнительные инструкции для ИИ
+ADDITIONAL_INSTRUCTIONS = """
+CRITICAL INSTRUCTIONS:
+- You MUST return ONLY the cover letter template text
+- DO NOT include any introductory text, explanations, or comments
+- DO NOT say things like "Here is your cover letter:" or "Based on your resume:"
+- DO NOT use markdown code blocks (```)
+- DO NOT add any text before or after the template
+- The template must be in English
+- Include placeholders in square brackets [ ] as shown in the format
+- Base the template on the resume information provided
+- Start directly with the template format: [Your Name] [Your City, Country]...
+"""
+
+# Инструкции для письма под конкретную вакансию (вместо ADDITIONAL_INSTRUCTIONS)
+VACANCY_INSTRUCTIONS = """
+CRITICAL INSTRUCTIONS:
+- Write the cover letter for the specific vacancy from the job description, using the candidate profile
+- Follow the format above, but fill [Company name], [Position title], [Company focus or mission],
+  [Company values or culture theme], [Team or product] and [Company goal or desired outcome]
+  from the job description
+- Pick the experience and achievements from the profile that best match the vacancy requirements
+- Keep a placeholder in square brackets [ ] only for details missing from both the profile and the job description
+- DO NOT invent facts that are not in the profile
+- You MUST return ONLY the cover letter text, in English, without markdown or introductory text
+"""
+
+# Краткий профиль кандидата: создаётся один раз и заменяет резюме в письмах под вакансии
+PROFILE_INSTRUCTIONS = """You compress a resume into a compact candidate profile that will be used
+to write cover letters for specific vacancies. Return plain text without markdown, at most 150 words,
+one line per field:
+Name:
+Location:
+Contacts: (email | phone | LinkedIn)
+Title:
+Experience: (total years, main domains and technologies)
+Skills: (the most important, comma-separated)
+Achievements: (3-5 strongest, keep the numbers)
+Education:
+Languages:
+Copy facts exactly as written in the resume, do not invent anything, skip fields with no data.
+"""
+PROFILE_SYSTEM_MESSAGE = {"role": "system", "content": PROFILE_INSTRUCTIONS}
+
+
+def sanitize_resume_text(text: str) -> str:
+    """Очистка и валидация текста резюме
+
+    Символьный лимит - только предварительный фильтр: длинное резюме не отклоняется,
+    а сокращается до MAX_RESUME_TOKENS в prepare_resume_text
+    """
+    if len(text) > MAX_RESUME_LENGTH:
+        raise ValueError(f"Resume is too long (maximum {MAX_RESUME_LENGTH} characters)")
+
+    # Удаляем потенциально опасные символы
+    text = text.replace('\x00', '')  # Null bytes
+
+    return text.strip()
+
+
+def sanitize_vacancy_text(text: str) -> str:
+    """Очистка и валидация описания вакансии (лимит длины тот же, что у резюме)"""
+    if len(text) > MAX_RESUME_LENGTH:
+        raise ValueError(f"Job description is too long (maximum {MAX_RESUME_LENGTH} characters)")
+    return sanitize_resume_text(text)
+
+
+def limit_tokens(text: str, max_tokens: int) -> CompactionResult:
+    """Только ограничение по токенам, без нормализации (RESUME_COMPACTION выключен)"""
+    original_tokens = estimate_tokens(text, OPENAI_MODEL)
+    if original_tokens <= max_tokens:
+        return CompactionResult(text, original_tokens, original_tokens, False)
+    text = truncate_to_tokens(text, max_tokens, OPENAI_MODEL)
+    return CompactionResult(text, original_tokens, estimate_tokens(text, OPENAI_MODEL), True)
+
+
+def prepare_resume_text(text: str) -> CompactionResult:
+    """Очистка, нормализация и ограничение резюме по токенам перед запросом к модели"""
+    text = sanitize_resume_text(text)
+    if not RESUME_COMPACTION:
+        return limit_tokens(text, MAX_RESUME_TOKENS)
+    result = compact_resume(text, MAX_RESUME_TOKENS, OPENAI_MODEL)
+    RESUME_TOKENS_SAVED.inc(result.tokens_saved)
+    logger.info(
+        f"Резюме нормализовано: {result.original_tokens} -> {result.tokens} токенов "
+        f"(-{result.tokens_saved}{', обрезано по лимиту' if result.truncated else ''})"
+    )
+    return result
+
+
+def prepare_vacancy_text(text: str) -> CompactionResult:
+    """Очистка и ограничение описания вакансии по токенам"""
+    text = sanitize_vacancy_text(text)
+    if not RESUME_COMPACTION:
+        return limit_tokens(text, MAX_VACANCY_TOKENS)
+    return compact_resume(text, MAX_VACANCY_TOKENS, OPENAI_MODEL)
+
+
+# Неизменное начало сообщения пользователя (часть кэшируемого префикса)
+USER_PREFIX = "Generate a cover letter template based on this resume:\n\n"
+VACANCY_USER_PREFIX = "Write a cover letter for this vacancy.\n\nCandidate profile:\n"
+
+
+class CompiledPrompt:
+    """Собранный промпт: системное сообщение, его размер в токенах и отпечаток"""
+
+    __slots__ = ('system_message', 'prefix_tokens', 'fingerprint', 'vacancy_message', 'vacancy_prefix_tokens')
+
+    def __init__(self, prompt_text: str):
+        content = prompt_text + "\n\n" + ADDITIONAL_INSTRUCTIONS
+        self.system_message = {"role": "system", "content": content}
+        self.prefix_tokens = estimate_tokens(content + USER_PREFIX, OPENAI_MODEL)
+        vacancy_content = prompt_text + "\n\n" + VACANCY_INSTRUCTIONS
+        self.vacancy_message = {"role": "system", "content": vacancy_content}
+        self.vacancy_prefix_tokens = estimate_tokens(vacancy_content + VACANCY_USER_PREFIX, OPENAI_MODEL)
+        # Отпечаток вместо полного текста промпта в ключе кэша шаблонов
+        self.fingerprint = hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class PromptTemplate:
+    """promt.txt с перезагрузкой при изменении файла (проверка не чаще reload_interval)
+
+    Файл читается при первом вызове current(): подсчёт токенов префикса
+    загружает tiktoken, что не должно происходить при импорте
+    """
+
+    def __init__(self, path: str, reload_interval: float = 5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._compiled = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self, signature):
+        # Запоминаем версию файла и при ошибке, чтобы не повторять её на каждом запросе
+        self._signature = signature
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                text = f.read().strip()
+        except OSError as e:
+            logger.error(f"Не удалось прочитать промпт {self.path}: {e}")
+            return
+        if not text:
+            logger.error(f"Файл промпта {self.path} пуст")
+            return
+        reloaded = self._compiled is not None
+        self._compiled = CompiledPrompt(text)
+        PROMPT_PREFIX_TOKENS.set(self._compiled.prefix_tokens)
+        logger.info(
+            f"Промпт {'перезагружен' if reloaded else 'загружен'}: "
+            f"{self._compiled.prefix_tokens} токенов в статическом префиксе"
+        )
+        if self._compiled.prefix_tokens < PROMPT_CACHE_MIN_TOKENS:
+            logger.info(
+                f"Префикс короче {PROMPT_CACHE_MIN_TOKENS} токенов - "
+                f"автоматическое кэширование промптов OpenAI к нему не применяется"
+            )
+
+    def current(self):
+        """Актуальный CompiledPrompt (None, если промпт не удалось загрузить)"""
+        now = time.monotonic()
+        if self._compiled is not None and now - self._checked_at < self.reload_interval:
+            return self._compiled
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                # Файл удалён или недоступен - продолжаем с последней загруженной версией
+                if self._compiled is None:
+                    logger.error(f"Файл {self.path} не найден")
+                return self._compiled
+            if signature != self._signature:
+                self._load(signature)
+            return self._compiled
+
+
+prompt_template = PromptTemplate(PROMPT_PATH, PROMPT_RELOAD_INTERVAL)
+
+
+def build_request_params(resume_text: str, prompt: CompiledPrompt) -> dict:
+    """Параметры chat.completions для уже очищенного текста резюме"""
+    return dict(
+        model=OPENAI_MODEL,
+        messages=[
+            prompt.system_message,
+            {"role": "user", "content": USER_PREFIX + resume_text}
+        ],
+        temperature=OPENAI_TEMPERATURE,
+        max_tokens=OPENAI_MAX_TOKENS
+    )
+
+
+def build_vacancy_request_params(profile: str, vacancy_text: str, prompt: CompiledPrompt) -> dict:
+    """Параметры chat.completions для письма под вакансию по профилю кандидата"""
+    return dict(
+        model=OPENAI_MODEL,
+        messages=[
+            prompt.vacancy_message,
+            {"role": "user", "content": VACANCY_USER_PREFIX + profile + "\n\nJob description:\n" + vacancy_text}
+        ],
+        temperature=OPENAI_TEMPERATURE,
+        max_tokens=OPENAI_MAX_TOKENS
+    )
+
+
+def build_profile_request_params(resume_text: str) -> dict:
+    """Параметры chat.completions для краткого профиля кандидата по резюме"""
+    return dict(
+        model=OPENAI_MODEL,
+        messages=[PROFILE_SYSTEM_MESSAGE, {"role": "user", "content": resume_text}],
+        # Выжимка фактов, а не творческий текст
+        temperature=0,
+        max_tokens=PROFILE_MAX_TOKENS
+    )
+
+
+def cover_letter_cache_key(resume_text: str, prompt: CompiledPrompt) -> str:
+    """Ключ кэша шаблонов: зависит от резюме, промпта и параметров модели"""
+    return make_cache_key(resume_text, prompt.fingerprint, OPENAI_MODEL, OPENAI_TEMPERATURE)
+
+
+def vacancy_letter_cache_key(profile: str, vacancy_text: str, prompt: CompiledPrompt) -> str:
+    """Ключ кэша писем под вакансию: профиль, вакансия, промпт и параметры модели"""
+    return make_cache_key(VACANCY_INSTRUCTIONS, profile, vacancy_text, prompt.fingerprint,
+                          OPENAI_MODEL, OPENAI_TEMPERATURE)
+
+
+def clean_cover_letter(cover_letter: str) -> str:
+    """Удаление markdown и вводных фраз из ответа модели"""
+    cover_letter = cover_letter.strip()
+
+    # Убираем возможные markdown форматирования и лишний текст
+    cover_letter = cover_letter.replace('```markdown', '').replace('```', '').strip()
+
+    # Удаляем возможные вводные фразы
+    intro_phrases = [
+        "here is your cover letter:",
+        "based on your resume:",
+        "here's your cover letter:",
+        "cover letter template:",
+        "template:"
+    ]
+    for phrase in intro_phrases:
+        if cover_letter.lower().startswith(phrase):
+            cover_letter = cover_letter[len(phrase):].strip()
+            # Убираем двоеточие и пробелы в начале
+            if cover_letter.startswith(':'):
+                cover_letter = cover_letter[1:].strip()
+
+    # Убираем лишние пробелы и переносы в начале
+    return cover_letter.lstrip()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Ограничение частоты запросов пользователей (token bucket)
+Бэкенды: память процесса, SQLite (общий для процессов на одной машине), Redis
+"""
+import abc
+import time
+import asyncio
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as redis_asyncio
+    REDIS_SUPPORT = True
+except ImportError:
+    REDIS_SUPPORT = False
+
+
+class RateLimiter(abc.ABC):
+    """Базовый класс: ведро на capacity запросов, пополняется за period секунд"""
+
+    def __init__(self, capacity: int, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period  # токенов в секунду
+        # Через это время ведро гарантированно полное и запись можно удалить
+        self.idle_ttl = period
+
+    @abc.abstractmethod
+    async def acquire(self, user_id: int) -> bool:
+        """Попытка списать один токен; False - лимит исчерпан"""
+
+    def _refill(self, tokens: float, updated_at: float, now: float) -> float:
+        return min(self.capacity, tokens + (now - updated_at) * self.rate)
+
+    async def close(self):
+        """Освобождение ресурсов бэкенда"""
+
+
+class MemoryRateLimiter(RateLimiter):
+    """Token bucket в памяти процесса с удалением неактивных пользователей"""
+
+    def __init__(self, capacity: int, period: float = 60.0):
+        super().__init__(capacity, period)
+        self._buckets = {}  # user_id -> (tokens, updated_at)
+        self._last_sweep = time.monotonic()
+
+    async def acquire(self, user_id: int) -> bool:
+        now = time.monotonic()
+        self._maybe_sweep(now)
+        tokens, updated_at = self._buckets.get(user_id, (self.capacity, now))
+        tokens = self._refill(tokens, updated_at, now)
+        if tokens < 1:
+            self._buckets[user_id] = (tokens, now)
+            return False
+        self._buckets[user_id] = (tokens - 1, now)
+        return True
+
+    def _maybe_sweep(self, now: float):
+        # Очистка не чаще раза в idle_ttl - амортизированно O(1) на запрос
+        if now - self._last_sweep < self.idle_ttl:
+            return
+        self._last_sweep = now
+        idle = [uid for uid, (_, updated_at) in self._buckets.items()
+                if now - updated_at >= self.idle_ttl]
+        for uid in idle:
+            del self._buckets[uid]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """Token bucket в SQLite: общий лимит для нескольких процессов бота"""
+
+    def __init__(self, db_path: str, capacity: int, period: float = 60.0):
+        super().__init__(capacity, period)
+        self._db = sqlite3.connect(db_path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            "user_id INTEGER PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._lock = asyncio.Lock()
+        self._last_sweep = 0.0
+
+    async def acquire(self, user_id: int) -> bool:
+        async with self._lock:
+            return await asyncio.to_thread(self._acquire, user_id)
+
+    def _acquire(self, user_id: int) -> bool:
+        # Время стены, а не monotonic: значение сравнивается между процессами
+        now = time.time()
+        # BEGIN IMMEDIATE берёт блокировку на запись - чтение и обновление атомарны
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(
+                "SELECT tokens, updated_at FROM rate_buckets WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            tokens = self._refill(*row, now) if row else self.capacity
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._db.execute(
+                "INSERT OR REPLACE INTO rate_buckets (user_id, tokens, updated_at) VALUES (?, ?, ?)",
+                (user_id, tokens, now)
+            )
+            if now - self._last_sweep >= self.idle_ttl:
+                self._last_sweep = now
+                self._db.execute("DELETE FROM rate_buckets WHERE updated_at < ?", (now - self.idle_ttl,))
+            self._db.execute("COMMIT")
+            return allowed
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    async def close(self):
+        self._db.close()
+
+
+# Атомарный token bucket на стороне Redis; ключ истекает, когда ведро снова полное
+REDIS_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1])
+local updated_at = tonumber(bucket[2])
+if tokens == nil then
+    tokens = capacity
+else
+    tokens = math.min(capacity, tokens + (now - updated_at) * rate)
+end
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], ttl)
+return allowed
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """Token bucket в Redis (или совместимом сервере) для нескольких реплик бота"""
+
+    def __init__(self, url: str, capacity: int, period: float = 60.0, prefix: str = 'ratelimit:'):
+        super().__init__(capacity, period)
+        if not REDIS_SUPPORT:
+            raise RuntimeError("redis package is required for RATE_LIMIT_BACKEND=redis: pip install redis")
+        self._redis = redis_asyncio.from_url(url)
+        self._script = self._redis.register_script(REDIS_TOKEN_BUCKET_SCRIPT)
+        self.prefix = prefix
+
+    async def acquire(self, user_id: int) -> bool:
+        allowed = await self._script(
+            keys=[f"{self.prefix}{user_id}"],
+            args=[self.capacity, self.rate, time.time(), int(self.idle_ttl) + 1]
+        )
+        return bool(allowed)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def create_rate_limiter(backend: str, capacity: int, period: float = 60.0,
+                        db_path: str = None, redis_url: str = None) -> RateLimiter:
+    """Создание rate limiter'а по имени бэкенда из конфигурации"""
+    if backend == 'sqlite':
+        return SQLiteRateLimiter(db_path, capacity, period)
+    if backend == 'redis':
+        return RedisRateLimiter(redis_url, capacity, period)
+    if backend != 'memory':
+        logger.warning(f"Неизвестный RATE_LIMIT_BACKEND={backend}, используется memory")
+    return MemoryRateLimiter(capacity, period)
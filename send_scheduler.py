@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Планировщик исходящих запросов к Bot API
+Все запросы бота, адресованные чату (send_message, edit_text, delete и т.д.),
+проходят через общую очередь с token bucket: глобальным (~30 сообщений/с)
+и отдельным на каждый чат (~1/с в личке, ~20/мин в группах). Ответы
+пользователям обслуживаются раньше промежуточных правок и уведомлений
+администратору; RetryAfter приостанавливает чат и запрос повторяется.
+Подключается к PTB как rate_limiter приложения
+"""
+import time
+import asyncio
+import logging
+import datetime
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from metrics import TELEGRAM_SEND_WAIT_SECONDS, TELEGRAM_RETRY_AFTER, TELEGRAM_SEND_QUEUE
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты запросов (меньше - раньше); передаются как rate_limit_args={'priority': ...}
+PRIORITY_REPLY = 0  # ответы пользователю: результат, ошибки
+PRIORITY_PROGRESS = 1  # промежуточные правки: потоковый текст, место в очереди
+PRIORITY_ADMIN = 2  # уведомления администратору
+
+PRIORITY_NAMES = {PRIORITY_REPLY: "reply", PRIORITY_PROGRESS: "progress", PRIORITY_ADMIN: "admin"}
+
+# Как часто удалять состояние чатов, в которые давно ничего не отправлялось
+SWEEP_INTERVAL = 60.0
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Пауза из RetryAfter в секундах (PTB отдаёт int или timedelta)"""
+    retry_after = error.retry_after
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+def is_group_chat(chat_id) -> bool:
+    """Группы и каналы имеют отрицательный id или @username"""
+    return str(chat_id).startswith(('-', '@'))
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0  # пауза по RetryAfter
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд можно взять токен (0 - уже можно)"""
+        self.refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self):
+        self.tokens -= 1
+
+    def idle(self, now: float) -> bool:
+        self.refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+class SendScheduler(BaseRateLimiter):
+    """Очередь исходящих запросов с приоритетами и лимитами Telegram
+
+    Запрос ждёт, пока есть токен и в глобальном bucket, и в bucket его чата.
+    Ожидающие перебираются по приоритету: запрос, упёршийся в лимит своего
+    чата, не задерживает запросы в другие чаты. Запросы без chat_id
+    (getFile, getMe, ...) не ограничиваются
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: int = 3,
+                 group_rate: float = 20 / 60, group_burst: int = 3, max_retries: int = 3):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        # Без запаса: Telegram считает сообщения в скользящем окне, пачка сверх rate получит 429
+        self._global = TokenBucket(global_rate, 1.0, time.monotonic())
+        self._chats = {}
+        self._waiting = []  # [priority, seq, chat_id, future]
+        self._seq = 0
+        self._timer = None
+        self._last_sweep = time.monotonic()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        for entry in self._waiting:
+            if not entry[3].done():
+                entry[3].cancel()
+        self._waiting = []
+
+    def _bucket(self, chat_id, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if is_group_chat(chat_id):
+                bucket = TokenBucket(self.group_rate, self.group_burst, now)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _sweep(self, now: float):
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        waiting = {entry[2] for entry in self._waiting}
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items()
+                        if chat_id not in waiting and bucket.idle(now)]:
+            del self._chats[chat_id]
+
+    def _dispatch(self):
+        """Выдача токенов ожидающим запросам в порядке приоритета"""
+        self._timer = None
+        now = time.monotonic()
+        wake = None
+        remaining = []
+        self._waiting.sort(key=lambda entry: (entry[0], entry[1]))
+        for index, entry in enumerate(self._waiting):
+            future = entry[3]
+            if future.done():
+                continue
+            global_wait = self._global.wait_time(now)
+            if global_wait > 0:
+                # Глобальный лимит исчерпан: первым получит токен запрос с высшим приоритетом
+                remaining.extend(entry for entry in self._waiting[index:] if not entry[3].done())
+                wake = global_wait if wake is None else min(wake, global_wait)
+                break
+            bucket = self._bucket(entry[2], now)
+            chat_wait = bucket.wait_time(now)
+            if chat_wait > 0:
+                remaining.append(entry)
+                wake = chat_wait if wake is None else min(wake, chat_wait)
+                continue
+            self._global.take()
+            bucket.take()
+            future.set_result(None)
+        self._waiting = remaining
+        TELEGRAM_SEND_QUEUE.set(len(remaining))
+        self._sweep(now)
+        if wake is not None:
+            self._timer = asyncio.get_running_loop().call_later(wake, self._dispatch)
+
+    async def _acquire(self, chat_id, priority: int):
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        self._waiting.append([priority, self._seq, chat_id, future])
+        if self._timer:
+            self._timer.cancel()
+        self._dispatch()
+        await future
+
+    def _block(self, chat_id, seconds: float):
+        """Пауза для чата, получившего RetryAfter"""
+        now = time.monotonic()
+        bucket = self._bucket(chat_id, now)
+        bucket.blocked_until = max(bucket.blocked_until, now + seconds)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+        rate_limit_args = rate_limit_args or {}
+        priority = rate_limit_args.get('priority', PRIORITY_REPLY)
+        max_retries = rate_limit_args.get('max_retries', self.max_retries)
+        attempt = 0
+        while True:
+            queued = time.monotonic()
+            await self._acquire(chat_id, priority)
+            TELEGRAM_SEND_WAIT_SECONDS.observe(time.monotonic() - queued,
+                                               priority=PRIORITY_NAMES.get(priority, str(priority)))
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                seconds = retry_after_seconds(e)
+                TELEGRAM_RETRY_AFTER.inc()
+                self._block(chat_id, seconds)
+                if attempt >= max_retries:
+                    raise
+                attempt += 1
+                logger.warning(f"Telegram RetryAfter {seconds:g}s для чата {chat_id} ({endpoint}), "
+                               f"повтор {attempt}/{max_retries}")
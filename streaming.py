@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Потоковая доставка шаблона пользователю
+Текст появляется в сообщении "Processing..." по мере генерации
+"""
+import time
+import asyncio
+import logging
+from telegram.error import BadRequest, RetryAfter
+from send_scheduler import PRIORITY_PROGRESS, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина одного сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Границы, по которым режется длинный текст, в порядке предпочтения
+SPLIT_SEPARATORS = ('\n\n', '\n', ' ')
+
+# Промежуточные правки: ниже ответов в очереди отправки, RetryAfter обрабатывает сам стример
+PROGRESS_ARGS = {'priority': PRIORITY_PROGRESS, 'max_retries': 0}
+
+
+def split_text(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list:
+    """Разбиение текста на части не длиннее limit
+
+    Режем по последнему абзацу, иначе по строке, иначе по пробелу в пределах
+    limit; граница раньше половины limit не используется, чтобы не плодить
+    короткие части. Начало текста режется одинаково, пока он дописывается
+    """
+    parts = []
+    while len(text) > limit:
+        cut = limit
+        for separator in SPLIT_SEPARATORS:
+            position = text.rfind(separator, 0, limit + 1)
+            if position >= limit // 2:
+                cut = position
+                break
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text or not parts:
+        parts.append(text)
+    return parts
+
+
+class MessageStreamer:
+    """Прогрессивное редактирование сообщений с ограничением частоты правок
+
+    Первая часть текста пишется в исходное сообщение (processing_msg),
+    при превышении 4096 символов создаются новые сообщения через reply.
+    max_retries - сколько раз finish повторяет запись после RetryAfter
+    """
+
+    def __init__(self, message, reply, interval: float = 1.5, min_chars: int = 20, max_retries: int = 3):
+        self.messages = [message]
+        self.reply = reply
+        self.interval = interval
+        self.min_chars = min_chars
+        self.max_retries = max_retries
+        self._shown = [None]
+        self._pending = None
+        self._last_flush = 0.0
+        self._task = None
+        self._blocked_until = 0.0
+
+    @property
+    def started(self) -> bool:
+        """Был ли уже показан пользователю хотя бы фрагмент текста"""
+        return self._shown[0] is not None
+
+    async def update(self, text: str):
+        """Новый частичный текст; правка будет отправлена не чаще interval"""
+        self._pending = text
+        if len(text.strip()) < self.min_chars:
+            return
+        if self._task and not self._task.done():
+            return
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return
+        # Первый фрагмент показываем сразу, дальше - с ограничением частоты
+        if self.started and now - self._last_flush < self.interval:
+            return
+        self._last_flush = now
+        self._task = asyncio.create_task(self._flush(text))
+
+    async def finish(self, text: str):
+        """Запись итогового текста во все сообщения"""
+        await self._wait_flush()
+        for attempt in range(self.max_retries + 1):
+            try:
+                count = await self._render(text)
+                break
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(retry_after_seconds(e))
+        # Итоговый текст мог оказаться короче частичного - лишние сообщения удаляем
+        await self._delete_extra(count)
+
+    async def fail(self, text: str):
+        """Замена частичного результата сообщением об ошибке"""
+        await self._wait_flush()
+        await self._delete_extra(1)
+        await self.messages[0].edit_text(text)
+
+    async def _delete_extra(self, keep: int):
+        for message in self.messages[keep:]:
+            try:
+                await message.delete()
+            except Exception as e:
+                logger.warning(f"Не удалось удалить сообщение: {e}")
+        self.messages = self.messages[:keep]
+        self._shown = self._shown[:keep]
+
+    async def _wait_flush(self):
+        if self._task:
+            try:
+                await self._task
+            except Exception:
+                pass
+
+    async def _flush(self, text: str):
+        try:
+            await self._render(text, PROGRESS_ARGS)
+        except RetryAfter as e:
+            logger.warning(f"Telegram RetryAfter при потоковой правке: {retry_after_seconds(e):g}s")
+            self._blocked_until = time.monotonic() + retry_after_seconds(e)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить сообщение при потоковой генерации: {e}")
+
+    async def _render(self, text: str, rate_limit_args: dict = None) -> int:
+        """Запись текста в сообщения; возвращает число занятых им сообщений"""
+        parts = split_text(text.strip())
+        for i, part in enumerate(parts):
+            if i < len(self.messages):
+                if self._shown[i] == part:
+                    continue
+                try:
+                    # Через метод бота: шорткаты Message не передают rate_limit_args
+                    message = self.messages[i]
+                    await message.get_bot().edit_message_text(
+                        part, chat_id=message.chat_id, message_id=message.message_id,
+                        rate_limit_args=rate_limit_args
+                    )
+                except BadRequest as e:
+                    # Текст совпал с уже показанным - это не ошибка
+                    if "not modified" not in str(e).lower():
+                        raise
+            else:
+                self.messages.append(await self.reply(part, rate_limit_args=rate_limit_args))
+                self._shown.append(None)
+            self._shown[i] = part
+        return len(parts)
@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+Запуск бота в нескольких процессах
+Супервизор получает апдейты от Telegram (long polling) и передаёт каждый одному
+из процессов-обработчиков по консистентному хэшу effective_user.id: состояние
+пользователя (rate limit, очередь заданий) остаётся в одном процессе.
+Упавшие обработчики перезапускаются, нагрузка по процессам пишется в лог и в метрики
+
+Пример:
+    python3 supervisor.py --workers 4
+"""
+import os
+import re
+import sys
+import glob
+import time
+import queue
+import bisect
+import signal
+import asyncio
+import hashlib
+import logging
+import argparse
+import multiprocessing
+
+# config импортируется внутри функций: дочерний процесс (spawn) импортирует этот
+# модуль раньше, чем получает свои переменные окружения
+from admin_notifier import format_alert
+from metrics import start_metrics_server, WORKER_UPDATES, WORKER_RESTARTS, WORKER_PENDING, WORKER_CPU
+
+logger = logging.getLogger(__name__)
+
+# Как часто обработчики сообщают супервизору о нагрузке
+STATUS_INTERVAL = 5.0
+# Как часто нагрузка по процессам пишется в лог
+LOAD_LOG_INTERVAL = 60.0
+# Таймаут long polling getUpdates
+POLL_TIMEOUT = 30
+# Максимальная пауза перед перезапуском процесса, который падает сразу после старта
+RESTART_BACKOFF_MAX = 30.0
+# Сколько ждать завершения обработчика при остановке
+STOP_TIMEOUT = 30.0
+# Типы апдейтов, нужные обработчикам bot.build_application (команды и сообщения):
+# супервизор не импортирует bot, чтобы не поднимать весь стек бота в своём процессе
+ALLOWED_UPDATES = ['message']
+
+
+class HashRing:
+    """Консистентное хэширование: при изменении числа процессов переезжает ~1/N пользователей"""
+
+    def __init__(self, nodes, replicas: int = 100):
+        self._ring = sorted((self._hash(f"{node}:{replica}"), node) for node in nodes for replica in range(replicas))
+        self._points = [point for point, _ in self._ring]
+
+    @staticmethod
+    def _hash(value) -> int:
+        return int.from_bytes(hashlib.md5(str(value).encode('utf-8')).digest()[:8], 'big')
+
+    def node_for(self, key):
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._ring[index][1]
+
+
+def routing_key(update) -> int:
+    """effective_user.id апдейта (chat id или update_id, если пользователя нет)"""
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return update.update_id
+
+
+def job_queue_path(index: int) -> str:
+    """Файл очереди заданий процесса-обработчика: jobs.db -> jobs.<index>.db"""
+    import config
+
+    root, ext = os.path.splitext(config.JOB_QUEUE_DB_PATH)
+    return f"{root}.{index}{ext or '.db'}"
+
+
+def merge_orphaned_job_queues(workers: int) -> int:
+    """Перенос заданий из очередей процессов с номером >= workers
+
+    Если процессов стало меньше, чем при прошлом запуске, задания из лишних
+    jobs.<index>.db переходят к процессам, которые теперь обслуживают их пользователей
+    """
+    import config
+    from job_queue import move_jobs
+
+    root, ext = os.path.splitext(config.JOB_QUEUE_DB_PATH)
+    ext = ext or '.db'
+    pattern = re.compile(re.escape(root) + r'\.(\d+)' + re.escape(ext) + '$')
+    ring = HashRing(range(workers))
+    moved = 0
+    for path in sorted(glob.glob(glob.escape(root) + '.*' + glob.escape(ext))):
+        match = pattern.match(path)
+        if not match or int(match.group(1)) < workers:
+            continue
+        count = move_jobs(path, lambda key: job_queue_path(ring.node_for(key)))
+        logger.info(f"Очередь заданий {path} больше не используется: перенесено заданий {count}")
+        moved += count
+    return moved
+
+
+def worker_env(index: int, workers: int) -> dict:
+    """Переменные окружения процесса-обработчика"""
+    import config
+
+    return {
+        # У каждого процесса своя очередь заданий: после перезапуска он подхватывает свои задания
+        'JOB_QUEUE_DB_PATH': job_queue_path(index),
+        # Метрики процесса - на следующих за супервизором портах
+        'METRICS_PORT': str(config.METRICS_PORT + 1 + index) if config.METRICS_PORT else '0',
+        # Общий лимит отправки Telegram делится между процессами; чат всегда обслуживает один процесс
+        'TELEGRAM_GLOBAL_RATE': str(config.TELEGRAM_GLOBAL_RATE / workers),
+        # Лимиты OpenAI общие для аккаунта - у каждого процесса своя доля
+        'OPENAI_TPM_LIMIT': str(max(1, config.OPENAI_TPM_LIMIT // workers)),
+        'OPENAI_RPM_LIMIT': str(max(1, config.OPENAI_RPM_LIMIT // workers)),
+        'OPENAI_MAX_CONCURRENCY': str(max(1, config.OPENAI_MAX_CONCURRENCY // workers)),
+    }
+
+
+def run_worker(index: int, updates, status, parent_pid: int, env: dict):
+    """Точка входа процесса-обработчика"""
+    # Остановкой управляет супервизор, Ctrl+C в терминале приходит всей группе процессов
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ.update(env)
+    asyncio.run(serve_worker(index, updates, status, parent_pid))
+
+
+async def serve_worker(index: int, updates, status, parent_pid: int):
+    """Обработка апдейтов, полученных от супервизора, до сигнала остановки (None)"""
+    # Бот импортируется в дочернем процессе уже с его переменными окружения
+    import bot
+    from telegram import Update
+
+    application = bot.build_application()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    received = 0
+
+    async def report():
+        while True:
+            jobs = await bot.job_queue.size() if bot.job_queue else 0
+            status.put({
+                'worker': index, 'pid': os.getpid(), 'received': received,
+                'pending': application.update_queue.qsize(), 'jobs': jobs, 'cpu': time.process_time(),
+            })
+            await asyncio.sleep(STATUS_INTERVAL)
+
+    reporter = asyncio.create_task(report())
+    logger.info(f"Обработчик {index} (pid {os.getpid()}) запущен")
+    try:
+        while True:
+            try:
+                data = await asyncio.to_thread(updates.get, timeout=1.0)
+            except queue.Empty:
+                if os.getppid() != parent_pid:
+                    logger.error(f"Обработчик {index}: супервизор завершился, остановка")
+                    break
+                continue
+            if data is None:
+                break
+            received += 1
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        reporter.cancel()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+class WorkerHandle:
+    """Процесс-обработчик и его последнее состояние"""
+
+    __slots__ = ('index', 'process', 'updates', 'started_at', 'failures', 'restart_at', 'status', 'cpu_percent')
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.updates = None
+        self.started_at = 0.0
+        self.failures = 0  # падений подряд вскоре после старта
+        self.restart_at = None
+        self.status = {}
+        self.cpu_percent = 0.0
+
+
+class Supervisor:
+    """Маршрутизация апдейтов по процессам и перезапуск упавших процессов"""
+
+    def __init__(self, workers: int):
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = [WorkerHandle(index) for index in range(workers)]
+        self.ring = HashRing(range(workers))
+        self.status = self.context.Queue()
+        self.bot = None
+        self._stopping = False
+        self._offset = None  # update_id, следующий за последним переданным обработчикам
+
+    def start_worker(self, handle: WorkerHandle):
+        if handle.updates is None:
+            handle.updates = self.context.Queue()
+        handle.process = self.context.Process(
+            target=run_worker,
+            args=(handle.index, handle.updates, self.status, os.getpid(), worker_env(handle.index, len(self.workers))),
+            name=f"bot-worker-{handle.index}",
+            daemon=False
+        )
+        handle.process.start()
+        handle.started_at = time.monotonic()
+        handle.restart_at = None
+        logger.info(f"Запущен обработчик {handle.index} (pid {handle.process.pid})")
+
+    def route(self, update):
+        handle = self.workers[self.ring.node_for(routing_key(update))]
+        handle.updates.put(update.to_dict())
+        WORKER_UPDATES.inc(worker=handle.index)
+
+    async def poll(self, allowed_updates: list):
+        """Long polling getUpdates и передача апдейтов обработчикам"""
+        from telegram.error import RetryAfter, TelegramError
+
+        while True:
+            try:
+                updates = await self.bot.get_updates(
+                    offset=self._offset, timeout=POLL_TIMEOUT, allowed_updates=allowed_updates
+                )
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except TelegramError as e:
+                logger.warning(f"Ошибка getUpdates: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            for update in updates:
+                self._offset = update.update_id + 1
+                self.route(update)
+
+    async def confirm_updates(self):
+        """Подтверждение переданных апдейтов, чтобы Telegram не прислал их снова после перезапуска"""
+        if self._offset is None:
+            return
+        try:
+            await self.bot.get_updates(offset=self._offset, timeout=0)
+        except Exception as e:
+            logger.warning(f"Не удалось подтвердить апдейты: {e}")
+
+    async def monitor(self):
+        """Перезапуск упавших процессов и сбор нагрузки"""
+        logged_at = time.monotonic()
+        while True:
+            await asyncio.sleep(1.0)
+            now = time.monotonic()
+            for handle in self.workers:
+                if self._stopping or handle.process.is_alive():
+                    continue
+                if handle.restart_at is None:
+                    await self._on_crash(handle, now)
+                elif now >= handle.restart_at:
+                    self.start_worker(handle)
+            self._collect_status()
+            if now - logged_at >= LOAD_LOG_INTERVAL:
+                logged_at = now
+                self.log_load()
+
+    async def _on_crash(self, handle: WorkerHandle, now: float):
+        exitcode = handle.process.exitcode
+        # Процесс, падающий сразу после старта, перезапускаем со всё большей паузой
+        handle.failures = handle.failures + 1 if now - handle.started_at < 60 else 1
+        delay = min(RESTART_BACKOFF_MAX, 2 ** (handle.failures - 1))
+        handle.restart_at = now + delay
+        # Очередь, которую читал убитый процесс, могла остаться заблокированной -
+        # апдейты до перезапуска копятся в новой. Апдейты, уже переданные упавшему
+        # процессу, теряются; принятые им задания генерации остаются в его jobs.db
+        handle.updates = self.context.Queue()
+        WORKER_RESTARTS.inc(worker=handle.index)
+        message = f"Worker {handle.index} (pid {handle.process.pid}) exited with code {exitcode}"
+        logger.error(f"{message}, перезапуск через {delay:.0f}s")
+        try:
+            from config import ADMIN_ID
+            await self.bot.send_message(
+                ADMIN_ID, format_alert(message, "", "CRITICAL: Bot Worker Crashed"), parse_mode='HTML'
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось уведомить администратора: {e}")
+
+    def _collect_status(self):
+        while True:
+            try:
+                status = self.status.get_nowait()
+            except queue.Empty:
+                return
+            handle = self.workers[status['worker']]
+            previous = handle.status
+            if previous.get('pid') == status['pid'] and status['cpu'] >= previous['cpu']:
+                handle.cpu_percent = (status['cpu'] - previous['cpu']) / STATUS_INTERVAL * 100
+            handle.status = status
+            WORKER_PENDING.set(status['pending'] + status['jobs'], worker=handle.index)
+            WORKER_CPU.set(round(handle.cpu_percent, 1), worker=handle.index)
+
+    def log_load(self):
+        for handle in self.workers:
+            status = handle.status
+            logger.info(
+                f"Обработчик {handle.index} (pid {status.get('pid', '-')}): "
+                f"апдейтов {status.get('received', 0)}, в очереди {status.get('pending', 0)}, "
+                f"заданий {status.get('jobs', 0)}, CPU {handle.cpu_percent:.0f}%, "
+                f"перезапусков {int(WORKER_RESTARTS.value(worker=handle.index))}"
+            )
+
+    async def stop(self):
+        self._stopping = True
+        for handle in self.workers:
+            if handle.process.is_alive():
+                handle.updates.put(None)
+        for handle in self.workers:
+            await asyncio.to_thread(handle.process.join, STOP_TIMEOUT)
+            if handle.process.is_alive():
+                logger.warning(f"Обработчик {handle.index} не остановился за {STOP_TIMEOUT:.0f}s, завершаем")
+                handle.process.terminate()
+                await asyncio.to_thread(handle.process.join, 5.0)
+
+    async def run(self):
+        from telegram import Bot
+        from config import BOT_TOKEN, TELEGRAM_BASE_URL, METRICS_HOST, METRICS_PORT
+
+        allowed_updates = ALLOWED_UPDATES
+        # Задания процессов, которых после уменьшения их числа больше нет
+        await asyncio.to_thread(merge_orphaned_job_queues, len(self.workers))
+        self.bot = Bot(BOT_TOKEN, **({'base_url': TELEGRAM_BASE_URL} if TELEGRAM_BASE_URL else {}))
+        await self.bot.initialize()
+        # Long polling не работает, пока установлен webhook
+        await self.bot.delete_webhook()
+
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+        for handle in self.workers:
+            self.start_worker(handle)
+
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        logger.info(f"Супервизор запущен: {len(self.workers)} процессов, апдейты: {', '.join(allowed_updates)}")
+        tasks = [asyncio.create_task(self.poll(allowed_updates)), asyncio.create_task(self.monitor())]
+        try:
+            await stop_event.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.confirm_updates()
+            await self.stop()
+            self.log_load()
+            await self.bot.shutdown()
+            if metrics_runner:
+                await metrics_runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot in several worker processes")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    from config import BOT_MODE, require_tokens
+
+    try:
+        require_tokens('BOT_TOKEN', 'CHATGPT_TOKEN')
+    except ValueError as e:
+        sys.exit(str(e))
+    if BOT_MODE != 'polling':
+        sys.exit("supervisor.py supports BOT_MODE=polling only; run webhook replicas behind a load balancer")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    asyncio.run(Supervisor(args.workers).run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Пакетный режим против заглушки Batch API: отправка, ожидание, сбор и продолжение"""
+import os
+import sys
+import json
+import asyncio
+
+from benchmarks.corpus import make_resume, write_docx, write_pdf, write_txt
+from benchmarks.fake_openai import FakeOpenAI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def run_batch(url: str, input_dir: str, output_dir: str, *args) -> str:
+    env = dict(os.environ, CHATGPT_TOKEN='sk-test', OPENAI_BASE_URL=url, METRICS_PORT='0',
+               CACHE_ENABLED='false', LOG_LEVEL='WARNING')
+    env.pop('BOT_TOKEN', None)
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, 'batch.py'), input_dir, output_dir,
+        '--batch-size', '2', '--poll-interval', '0.1', *args,
+        env=env, cwd=ROOT, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+    )
+    output, _ = await asyncio.wait_for(process.communicate(), 60)
+    assert process.returncode == 0, output.decode()
+    return output.decode().strip().splitlines()[-1]
+
+
+def test_submit_then_resume_and_collect(tmp_path):
+    input_dir, output_dir = tmp_path / 'resumes', tmp_path / 'letters'
+    (input_dir / 'sub').mkdir(parents=True)
+    write_txt(str(input_dir / 'a.txt'), make_resume(0))
+    write_pdf(str(input_dir / 'sub' / 'b.pdf'), make_resume(1))
+    write_docx(str(input_dir / 'c.docx'), make_resume(2))
+    (input_dir / 'short.txt').write_text('hi')
+
+    async def scenario():
+        fake = FakeOpenAI(latency=0, jitter=0, batch_latency=0.3)
+        url = await fake.start()
+        try:
+            # Только отправка: пакеты остаются в очереди, состояние сохраняется на диск
+            assert await run_batch(url, str(input_dir), str(output_dir), '--no-wait') == 'skipped: 1, submitted: 3'
+            state = json.loads((output_dir / 'batch_state.json').read_text())
+            assert len(state['batches']) == 2 and len(fake.batches) == 2
+
+            # Повторный запуск ничего не отправляет заново, а дожидается и забирает результаты
+            assert await run_batch(url, str(input_dir), str(output_dir)) == 'done: 3, skipped: 1'
+            assert len(fake.batches) == 2
+            for name in ('a.txt', os.path.join('sub', 'b.pdf'), 'c.docx'):
+                assert '[Company name]' in (output_dir / (name + '.txt')).read_text()
+        finally:
+            await fake.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Дублирующие запросы: бюджет регулятора и замеры задержек"""
+import asyncio
+import functools
+
+import pytest
+
+from governor import OpenAIGovernor
+from hedging import Hedger
+
+
+def make_hedger(samples=0.01, count=20):
+    hedger = Hedger("test", max_timeout=5.0, max_fraction=1.0, min_samples=count)
+    for _ in range(count):
+        hedger.latencies.add(samples)
+        hedger._hedged.append(False)
+    return hedger
+
+
+def slow_then_fast():
+    calls = []
+
+    async def attempt(commit):
+        calls.append(len(calls))
+        await asyncio.sleep(1.0 if len(calls) == 1 else 0.01)
+        return len(calls)
+
+    return attempt, calls
+
+
+def test_hedge_takes_governor_budget_and_releases_it():
+    async def scenario():
+        governor = OpenAIGovernor(max_concurrency=2, tokens_per_minute=1000, requests_per_minute=10)
+        primary = await governor.acquire(1, 100)
+        hedger = make_hedger()
+        attempt, calls = slow_then_fast()
+        reserved = []
+
+        def reserve():
+            ticket = governor.try_acquire(1, 100)
+            reserved.append(ticket)
+            return functools.partial(governor.release, ticket)
+
+        assert await hedger.run(attempt, reserve=reserve, cost=100) == 2
+        assert len(calls) == 2 and reserved[0] is not None
+        # Дубль освобождён, но его оценка осталась в окне TPM/RPM
+        assert governor._in_flight == 1
+        assert governor._window_tokens == 200 and len(governor._window) == 2
+        governor.release(primary)
+
+    asyncio.run(scenario())
+
+
+def test_no_hedge_without_budget():
+    async def scenario():
+        governor = OpenAIGovernor(max_concurrency=1, tokens_per_minute=1000, requests_per_minute=10)
+        primary = await governor.acquire(1, 100)
+        hedger = make_hedger()
+        attempt, calls = slow_then_fast()
+        result = await hedger.run(attempt, reserve=lambda: governor.try_acquire(1, 100), cost=100)
+        assert result == 1 and calls == [0]
+        governor.release(primary)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_loser_is_recorded_as_censored_sample():
+    async def scenario():
+        hedger = make_hedger()
+        attempt, _ = slow_then_fast()
+        await hedger.run(attempt)
+        await asyncio.sleep(0)  # отменённая попытка завершается на следующей итерации цикла
+        # Победитель (~0.01s) и отменённая первая попытка (не меньше задержки дубля)
+        assert len(hedger.latencies) == 22
+        assert max(hedger.latencies._samples) >= 0.01
+
+    asyncio.run(scenario())
+
+
+def test_all_attempts_cancelled_raises_error():
+    async def attempt(commit):
+        raise asyncio.CancelledError()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(Hedger("test", max_timeout=5.0).run(attempt))
+
+
+def test_try_acquire_does_not_jump_the_queue():
+    async def scenario():
+        governor = OpenAIGovernor(max_concurrency=1, tokens_per_minute=1000, requests_per_minute=10)
+        first = await governor.acquire(1, 10)
+        waiting = asyncio.ensure_future(governor.acquire(2, 10))
+        await asyncio.sleep(0)
+        governor.max_concurrency = 5
+        # Пока кто-то ждёт в очереди, дополнительных разрешений нет
+        assert governor.try_acquire(1, 10) is None
+        governor.release(first)
+        governor.release(await waiting)
+
+    asyncio.run(scenario())
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Распознавание описаний вакансий и хранилище профилей"""
+import asyncio
+
+import pytest
+
+from profiles import RESUME_RE, WEAK_JOB_RE, ProfileStore, looks_like_job_posting
+
+RESUME_EN = """John Smith
+Senior Python Developer | Berlin, Germany | john.smith@example.com | github.com/jsmith
+
+Summary
+Backend engineer with 7 years of experience building high-load APIs.
+
+Experience
+Acme GmbH - Senior Python Developer (2020 - present)
+Responsibilities: designed payment services, mentored 4 engineers, introduced code review.
+- Apply best practices for testing and observability; cut incident rate by 40%
+- Resumed work on the legacy billing migration and finished it in 3 months
+
+Globex - Python Developer (2017 - 2020)
+- Built a job application tracker used by 200 recruiters
+
+Skills
+Python, asyncio, Django, PostgreSQL, Redis, Kubernetes
+
+Education
+MSc Computer Science, TU Berlin
+"""
+
+# Резюме без явных заголовков, но со "слабыми" словами вакансий
+RESUME_PLAIN = """Experience: 5 years as a backend developer.
+Responsibilities: you will find I apply best practices, benefits of clean code.
+Skills: Python, Go. I led the migration to Kubernetes."""
+
+RESUME_RU = """Иванов Иван
+Python-разработчик, Москва, ivan@example.com
+
+Опыт работы
+ООО "Ромашка" - ведущий разработчик (2019 - н.в.)
+Обязанности: разработка API, ревью кода, наставничество.
+Требования бизнеса переводил в технические задачи.
+
+Навыки
+Python, Django, PostgreSQL
+
+Образование
+МГТУ им. Баумана, 2016
+"""
+
+POSTING_EN = """Senior Python Developer at Acme Corp
+About the role
+We are looking for a backend engineer to build our payments platform.
+
+What you'll do:
+- Design and ship services used by millions of customers
+- Mentor engineers in your team
+
+Requirements:
+- 5+ years of experience with Python
+- Experience with PostgreSQL and Kafka
+
+Nice to have: Go, Kubernetes
+We offer: remote work, competitive salary, learning budget. Apply now!
+"""
+
+POSTING_RU = """Вакансия: Python-разработчик
+Мы ищем опытного backend-разработчика в команду платежей.
+
+Обязанности:
+- разработка и поддержка сервисов
+Требования:
+- опыт коммерческой разработки на Python от 3 лет
+Будет плюсом: опыт с Kafka
+Мы предлагаем: удалённую работу, ДМС.
+"""
+
+
+@pytest.mark.parametrize('text', [RESUME_EN, RESUME_PLAIN, RESUME_RU])
+def test_resume_is_not_job_posting(text):
+    assert not looks_like_job_posting(text)
+
+
+@pytest.mark.parametrize('text', [POSTING_EN, POSTING_RU])
+def test_job_posting_detected(text):
+    assert looks_like_job_posting(text)
+
+
+def test_weak_words_alone_are_not_a_posting():
+    assert not looks_like_job_posting("Responsibilities and benefits: you will apply, salary negotiable.")
+
+
+def test_markers_match_whole_words():
+    # "application" и "resumed" не совпадают с "apply" и "resume"
+    assert WEAK_JOB_RE.findall("Built a job application tracker") == []
+    assert RESUME_RE.findall("Resumed work on billing") == []
+    assert WEAK_JOB_RE.findall("Apply now") == ['Apply']
+
+
+def test_profile_store_roundtrip(tmp_path):
+    async def scenario():
+        store = ProfileStore(str(tmp_path / 'profiles.db'), max_entries=2)
+        await store.save_resume(1, RESUME_EN)
+        stored = await store.get(1)
+        await store.set_profile(1, stored.resume_hash, "profile")
+        await store.save_template(1, "Dear [Company name]")
+        stored = await store.get(1)
+        assert (stored.profile, stored.last_template) == ("profile", "Dear [Company name]")
+        # Новое резюме сбрасывает профиль
+        await store.save_resume(1, RESUME_RU)
+        assert (await store.get(1)).profile is None
+        # Сверх max_entries вытесняются самые старые записи
+        await store.save_resume(2, RESUME_EN)
+        await store.save_resume(3, RESUME_EN)
+        assert await store.get(1) is None and await store.size() == 2
+        assert await store.delete(2) and not await store.delete(2)
+        await store.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""Подготовка резюме к запросу: длину определяет лимит токенов, а не символов"""
+import pytest
+
+import prompts
+from config import MAX_RESUME_LENGTH, MAX_RESUME_TOKENS
+
+
+def long_resume(lines):
+    return "\n".join(f"{index}. Built service number {index} with Python, SQL and Kafka" for index in range(lines))
+
+
+@pytest.mark.parametrize("compaction", [True, False])
+def test_long_resume_is_trimmed_by_tokens(monkeypatch, compaction):
+    monkeypatch.setattr(prompts, "RESUME_COMPACTION", compaction)
+    text = long_resume(2000)
+    assert 50000 < len(text) < MAX_RESUME_LENGTH
+    result = prompts.prepare_resume_text(text)
+    assert result.truncated
+    assert result.original_tokens > MAX_RESUME_TOKENS >= result.tokens
+    assert text.startswith(result.text)
+
+
+def test_short_resume_is_not_trimmed(monkeypatch):
+    monkeypatch.setattr(prompts, "RESUME_COMPACTION", False)
+    result = prompts.prepare_resume_text(long_resume(20))
+    assert not result.truncated and result.tokens == result.original_tokens
+
+
+def test_character_prefilter_rejects_huge_text():
+    with pytest.raises(ValueError):
+        prompts.prepare_resume_text("x" * (MAX_RESUME_LENGTH + 1))
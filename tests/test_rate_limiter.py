@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Бэкенды rate limiter'а: память, общий файл SQLite и Redis-совместимый сервер"""
+import asyncio
+
+import pytest
+
+import rate_limiter
+from rate_limiter import MemoryRateLimiter, RateLimiter, RedisRateLimiter, SQLiteRateLimiter
+
+
+async def drain(limiter, user_id, attempts):
+    return [await limiter.acquire(user_id) for _ in range(attempts)]
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        RateLimiter(5)
+
+
+def test_memory_limiter_limits_per_user():
+    async def scenario():
+        limiter = MemoryRateLimiter(3, period=60)
+        assert await drain(limiter, 1, 4) == [True, True, True, False]
+        assert await limiter.acquire(2)
+
+    asyncio.run(scenario())
+
+
+def test_memory_limiter_refills():
+    async def scenario():
+        limiter = MemoryRateLimiter(1, period=0.05)
+        assert await limiter.acquire(1) and not await limiter.acquire(1)
+        await asyncio.sleep(0.06)
+        assert await limiter.acquire(1)
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_limit_is_shared_between_instances(tmp_path):
+    # Два процесса бота - два экземпляра на одном файле
+    async def scenario():
+        path = str(tmp_path / 'rate.db')
+        first = SQLiteRateLimiter(path, 4, period=60)
+        second = SQLiteRateLimiter(path, 4, period=60)
+        results = await asyncio.gather(*(limiter.acquire(7) for limiter in (first, second) * 3))
+        assert sorted(results) == [False, False, True, True, True, True]
+        assert not await first.acquire(7) and not await second.acquire(7)
+        assert await second.acquire(8)
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
+
+
+def test_redis_limiter_against_local_stand_in(monkeypatch):
+    # fakeredis с Lua - локальная замена сервера Redis
+    pytest.importorskip('redis')
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(rate_limiter.redis_asyncio, 'from_url',
+                        lambda url: fakeredis.aioredis.FakeRedis(server=server))
+
+    async def scenario():
+        first = RedisRateLimiter('redis://stand-in', 3, period=60)
+        second = RedisRateLimiter('redis://stand-in', 3, period=60)
+        assert await drain(first, 1, 2) + await drain(second, 1, 2) == [True, True, True, False]
+        assert await second.acquire(2)
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
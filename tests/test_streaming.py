@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Потоковая доставка: итоговая запись, лишние сообщения и повторы после RetryAfter"""
+import asyncio
+import datetime
+
+import pytest
+from telegram.error import RetryAfter
+
+from streaming import MessageStreamer
+
+
+class FakeBot:
+    def __init__(self, retry_after=0):
+        self.retry_after = retry_after
+        self.edits = {}
+
+    async def edit_message_text(self, text, chat_id, message_id, rate_limit_args=None):
+        if self.retry_after:
+            self.retry_after -= 1
+            raise RetryAfter(datetime.timedelta(0))
+        self.edits[message_id] = text
+
+
+class FakeMessage:
+    def __init__(self, bot, message_id):
+        self.bot = bot
+        self.chat_id = 1
+        self.message_id = message_id
+        self.deleted = False
+
+    def get_bot(self):
+        return self.bot
+
+    async def delete(self):
+        self.deleted = True
+
+
+def make_streamer(bot, **kwargs):
+    sent = []
+
+    async def reply(text, rate_limit_args=None):
+        message = FakeMessage(bot, len(sent) + 2)
+        sent.append(message)
+        bot.edits[message.message_id] = text
+        return message
+
+    return MessageStreamer(FakeMessage(bot, 1), reply, min_chars=1, **kwargs), sent
+
+
+def test_finish_deletes_extra_rollover_messages():
+    async def scenario():
+        bot = FakeBot()
+        streamer, sent = make_streamer(bot)
+        await streamer.update("a" * 5000)
+        await streamer._wait_flush()
+        assert len(streamer.messages) == 2
+        await streamer.finish("short final text")
+        assert bot.edits[1] == "short final text"
+        assert sent[0].deleted and streamer.messages == streamer.messages[:1]
+
+    asyncio.run(scenario())
+
+
+def test_finish_retries_retry_after_a_bounded_number_of_times():
+    async def scenario():
+        streamer, _ = make_streamer(FakeBot(retry_after=2), max_retries=2)
+        await streamer.finish("final text")
+        assert streamer.messages[0].bot.edits[1] == "final text"
+
+        streamer, _ = make_streamer(FakeBot(retry_after=100), max_retries=2)
+        with pytest.raises(RetryAfter):
+            await streamer.finish("final text")
+        assert streamer.messages[0].bot.retry_after == 97
+
+    asyncio.run(scenario())
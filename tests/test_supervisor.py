@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Супервизор: типы апдейтов без импорта bot и очереди заданий лишних процессов"""
+import os
+import sys
+import json
+import asyncio
+import sqlite3
+import subprocess
+
+import config
+import supervisor
+from job_queue import JobQueue
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_allowed_updates_match_bot_handlers():
+    # Жёстко заданный список супервизора не должен разойтись с обработчиками бота
+    env = dict(os.environ, BOT_TOKEN='123:test', CHATGPT_TOKEN='sk-test', METRICS_PORT='0')
+    output = subprocess.run(
+        [sys.executable, '-c', 'import json, bot; print(json.dumps(bot.get_allowed_updates(bot.build_application())))'],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    assert json.loads(output.strip().splitlines()[-1]) == supervisor.ALLOWED_UPDATES
+
+
+def count_jobs(path):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+def test_orphaned_job_queues_are_merged(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'JOB_QUEUE_DB_PATH', str(tmp_path / 'jobs.db'))
+
+    async def fill():
+        # Прошлый запуск с четырьмя процессами
+        for index in range(4):
+            queue = JobQueue(supervisor.job_queue_path(index))
+            for user_id in range(index * 10, index * 10 + 5):
+                await queue.put(user_id, 'user', user_id, 'private', 1, 'message', f'resume {user_id}')
+            await queue.close()
+
+    asyncio.run(fill())
+    assert supervisor.merge_orphaned_job_queues(2) == 10
+    assert not os.path.exists(tmp_path / 'jobs.2.db') and not os.path.exists(tmp_path / 'jobs.3.db')
+    assert count_jobs(tmp_path / 'jobs.0.db') + count_jobs(tmp_path / 'jobs.1.db') == 20
+
+    # Задание попадает к процессу, который теперь обслуживает пользователя
+    ring = supervisor.HashRing(range(2))
+    for index in range(2):
+        with sqlite3.connect(tmp_path / f'jobs.{index}.db') as db:
+            users = [row[0] for row in db.execute("SELECT user_id FROM jobs WHERE user_id >= 20")]
+        assert all(ring.node_for(user_id) == index for user_id in users)
+
+    # Повторный запуск с тем же числом процессов ничего не переносит
+    assert supervisor.merge_orphaned_job_queues(2) == 0
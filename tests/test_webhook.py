@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Эндпоинт webhook: проверка секрета и разбор тела апдейта"""
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from webhook import SECRET_HEADER, create_web_app
+
+SECRET = 'webhook-secret'
+
+
+class FakeApplication:
+    def __init__(self):
+        self.bot = None
+        self.running = True
+        self.update_queue = asyncio.Queue()
+
+
+async def post(application, headers, **kwargs):
+    async with TestClient(TestServer(create_web_app(application, '/hook', SECRET))) as client:
+        response = await client.post('/hook', headers=headers, **kwargs)
+        return response.status
+
+
+def test_valid_update_is_queued():
+    async def scenario():
+        application = FakeApplication()
+        assert await post(application, {SECRET_HEADER: SECRET}, json={'update_id': 7}) == 200
+        assert (await application.update_queue.get()).update_id == 7
+
+    asyncio.run(scenario())
+
+
+def test_wrong_or_non_ascii_secret_is_forbidden():
+    async def scenario():
+        application = FakeApplication()
+        for token in ('wrong', 'секрет'):
+            headers = {SECRET_HEADER: token.encode('utf-8').decode('latin-1')}
+            assert await post(application, headers, json={'update_id': 1}) == 403
+        assert application.update_queue.empty()
+
+    asyncio.run(scenario())
+
+
+def test_malformed_body_is_a_client_error():
+    async def scenario():
+        application = FakeApplication()
+        for body in (b'{not json', b'[1, 2]', b'{"message": {}}', b'\xff\xfe'):
+            assert await post(application, {SECRET_HEADER: SECRET}, data=body) == 400
+        assert application.update_queue.empty()
+
+    asyncio.run(scenario())
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Оценка количества токенов в тексте
+Использует tiktoken, если он установлен, иначе - приближённую оценку по байтам
+"""
+import logging
+import importlib.util
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# tiktoken импортируется при первой оценке
+TIKTOKEN_SUPPORT = importlib.util.find_spec('tiktoken') is not None
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+
+
+def estimator_name() -> str:
+    """Описание активного способа подсчёта токенов (для лога при запуске)"""
+    if TIKTOKEN_SUPPORT:
+        return "tiktoken"
+    return "приближённая оценка (~4 байта на токен), tiktoken не установлен"
+
+
+def estimate_tokens(text: str, model: str = 'gpt-4o-mini') -> int:
+    """Количество токенов в тексте (точное с tiktoken, иначе оценка)"""
+    global TIKTOKEN_SUPPORT
+    if not text:
+        return 0
+    if TIKTOKEN_SUPPORT:
+        try:
+            return len(_get_encoding(model).encode(text))
+        except Exception as e:
+            # Например, словарь не удалось скачать - больше не пытаемся
+            logger.warning(f"tiktoken недоступен для {model}, используется оценка: {e}")
+            TIKTOKEN_SUPPORT = False
+    # ~4 байта UTF-8 на токен: для латиницы это ~4 символа, для кириллицы ~2
+    return len(text.encode('utf-8')) // 4 + 1
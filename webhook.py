@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Режим работы через webhook
+Локальный aiohttp-сервер принимает апдейты от Telegram вместо long polling
+"""
+import hmac
+import json
+import signal
+import asyncio
+import logging
+import importlib.util
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# aiohttp импортируется только в режиме webhook
+WEBHOOK_SUPPORT = importlib.util.find_spec('aiohttp') is not None
+if not WEBHOOK_SUPPORT:
+    logger.warning("aiohttp не установлен. Режим webhook недоступен.")
+
+# Заголовок, в котором Telegram передаёт secret_token из setWebhook
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def create_web_app(application, path: str, secret: str):
+    """Создание aiohttp-приложения с эндпоинтами webhook и health"""
+    from aiohttp import web
+
+    async def handle_update(request):
+        # Сравнение за постоянное время, чтобы не раскрывать секрет по таймингу;
+        # байты, а не str: compare_digest отвергает строки с не-ASCII символами
+        token = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(token.encode('utf-8', 'surrogateescape'), secret.encode('utf-8')):
+            logger.warning(f"Webhook запрос с неверным секретом от {request.remote}")
+            return web.Response(status=403)
+        # Битое тело - ошибка клиента (400), а не сервера: на 500 Telegram повторяет запрос
+        try:
+            data = await request.json()
+            update = Update.de_json(data, application.bot)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return web.Response(status=400)
+        except Exception as e:
+            logger.warning(f"Не удалось разобрать апдейт webhook: {type(e).__name__}: {e}")
+            return web.Response(status=400)
+        # Кладём апдейт в очередь и сразу отвечаем Telegram
+        await application.update_queue.put(update)
+        return web.Response()
+
+    async def handle_health(request):
+        status = 200 if application.running else 503
+        return web.json_response(
+            {
+                'status': 'ok' if application.running else 'stopped',
+                'pending_updates': application.update_queue.qsize(),
+            },
+            status=status
+        )
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get('/health', handle_health)
+    return app
+
+
+async def serve_webhook(application, url: str, path: str, listen: str, port: int,
+                        secret: str, allowed_updates: list, set_webhook: bool = True):
+    """Запуск бота в режиме webhook до получения SIGINT/SIGTERM"""
+    if not WEBHOOK_SUPPORT:
+        raise RuntimeError("aiohttp is required for webhook mode: pip install aiohttp")
+    from aiohttp import web
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: обработчики сигналов в event loop не поддерживаются
+            pass
+
+    runner = web.AppRunner(create_web_app(application, path, secret))
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await runner.setup()
+        await web.TCPSite(runner, listen, port).start()
+        logger.info(f"Webhook сервер слушает {listen}:{port}{path}")
+
+        # При нескольких репликах достаточно, чтобы webhook установила одна из них
+        if set_webhook:
+            await application.bot.set_webhook(
+                url=url.rstrip('/') + path,
+                secret_token=secret,
+                allowed_updates=allowed_updates
+            )
+            logger.info(f"Webhook установлен: {url.rstrip('/') + path}")
+
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)